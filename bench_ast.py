@@ -0,0 +1,219 @@
+# Compares Element trees with compact ASTs (compactast.py) on a large generated program:
+# memory per node, the time to walk every node, and the time to run a program on each.
+#
+#   python bench_ast.py [--functions N] [--reps N] [--json]
+#
+# walks:
+#   element     follow each Element's dict to its children
+#   arrays      follow child indexes through the compact arrays, no objects made
+#   scan        read the kinds array front to back; nodes are stored in preorder
+#   views       walk the compact tree through its Element-shaped node views, making them
+#   views (2nd) the same, once the views exist
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+import brewparse
+from compactast import LIST_TAG, NODE_TAG, TAG_BITS, CompactAST
+from element import Element
+from interpreterv3 import Interpreter
+
+FUNCTION_TEMPLATE = """
+func f{n}(a, ref b) {{
+  x = a * {n} + b - (a / 3);
+  s = "name" + "{n}";
+  if (x > 10 && !(b == nil) || a <= -{n}) {{
+    b = x;
+    print(s, " ", x);
+  }} else {{
+    while (x < 100) {{
+      x = x + f{m}(x, b);
+    }}
+  }}
+  g = lambda(y) {{ return y + x; }};
+  return g(a);
+}}
+"""
+
+RUN_PROGRAM = """
+func add(a, b) { return a + b; }
+func main() {
+  i = 0;
+  t = 0;
+  while (i < 2000) {
+    t = add(t, i * 2 - 1);
+    if (t > 100000 || !(i < 1990)) { t = t - 100000; }
+    i = i + 1;
+  }
+  print(t);
+}
+"""
+
+
+def generate(functions):
+    parts = [FUNCTION_TEMPLATE.format(n=n, m=(n + 1) % functions) for n in range(functions)]
+    parts.append("func main() { print(f0(1, 2)); }\n")
+    return "".join(parts)
+
+
+# bytes held by the Element objects, their dicts and child lists, plus each distinct
+# constant
+def element_bytes(root):
+    seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        total += sys.getsizeof(node)
+        if isinstance(node, Element):
+            total += sys.getsizeof(node.__dict__) + sys.getsizeof(node.dict)
+            stack.extend(node.dict.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return total
+
+
+def constant_bytes(tree):
+    return sum(sys.getsizeof(constant) for constant in tree.constants)
+
+
+def walk_elements(node):
+    count = 1
+    for value in node.dict.values():
+        if isinstance(value, Element):
+            count += walk_elements(value)
+        elif isinstance(value, list):
+            for item in value:
+                count += walk_elements(item)
+    return count
+
+
+def walk_arrays(tree, index=0):
+    count = 1
+    field_values = tree.field_values
+    start = tree.field_start[index]
+    for slot in range(start, start + tree.field_count[index]):
+        tagged = field_values[slot]
+        tag = tagged & 3
+        if tag == NODE_TAG:
+            count += walk_arrays(tree, tagged >> TAG_BITS)
+        elif tag == LIST_TAG:
+            list_index = tagged >> TAG_BITS
+            first = tree.list_start[list_index]
+            for i in range(first, first + tree.list_length[list_index]):
+                count += walk_arrays(tree, tree.list_items[i])
+    return count
+
+
+def scan_kinds(tree):
+    counts = [0] * len(tree.kind_names)
+    for kind in tree.kinds:
+        counts[kind] += 1
+    return sum(counts)
+
+
+def walk_views(tree):
+    count = 0
+    stack = [tree.root()]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for value in node.dict.values():
+            if isinstance(value, Element):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+    return count
+
+
+def best_time(function, reps):
+    times = []
+    for _ in range(reps):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def run_time(ast_format, backend, reps):
+    def run():
+        interpreter = Interpreter(False, None, False, backend=backend, ast_format=ast_format)
+        with redirect_stdout(io.StringIO()):
+            interpreter.run(RUN_PROGRAM)
+
+    return best_time(run, reps)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--functions", type=int, default=2000)
+    arg_parser.add_argument("--reps", type=int, default=5)
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+    sys.setrecursionlimit(100000)
+
+    root = brewparse.parse_uncached(generate(args.functions))
+    tree = CompactAST.from_element(root)
+    nodes = len(tree)
+    assert walk_elements(root) == walk_arrays(tree) == scan_kinds(tree) == nodes
+    assert walk_views(CompactAST.from_element(root)) == nodes
+
+    element_total = element_bytes(root)
+    compact_total = tree.nbytes() + constant_bytes(tree)
+    results = {
+        "nodes": nodes,
+        "memory": {
+            "element_bytes_per_node": element_total / nodes,
+            "compact_bytes_per_node": compact_total / nodes,
+            "compact_constants": len(tree.constants),
+        },
+        "walk_ms": {},
+        "run_ms": {},
+    }
+
+    walks = {
+        "element": lambda: walk_elements(root),
+        "arrays": lambda: walk_arrays(tree),
+        "scan": lambda: scan_kinds(tree),
+    }
+    for name, walk in walks.items():
+        results["walk_ms"][name] = best_time(walk, args.reps)[0] * 1000
+    # the first walk over a fresh tree makes its views, later ones reuse them
+    fresh = CompactAST.from_element(root)
+    results["walk_ms"]["views"] = best_time(lambda: walk_views(fresh), 1)[0] * 1000
+    results["walk_ms"]["views (2nd)"] = best_time(lambda: walk_views(fresh), args.reps)[0] * 1000
+
+    backends = (Interpreter.TREE_BACKEND, Interpreter.CLOSURE_BACKEND, Interpreter.BYTECODE_BACKEND)
+    for backend in backends:
+        for ast_format in (Interpreter.ELEMENT_AST, Interpreter.COMPACT_AST):
+            results["run_ms"][f"{backend}/{ast_format}"] = (
+                run_time(ast_format, backend, args.reps)[0] * 1000
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    memory = results["memory"]
+    print(f"{nodes} nodes")
+    print(f"  element  {memory['element_bytes_per_node']:>7.1f} bytes/node")
+    print(
+        f"  compact  {memory['compact_bytes_per_node']:>7.1f} bytes/node"
+        f" ({memory['compact_constants']} distinct constants)"
+    )
+    print("walk every node:")
+    for name, ms in results["walk_ms"].items():
+        print(f"  {name:<12} {ms:>8.2f} ms")
+    print("run a 2000-iteration loop:")
+    for name, ms in results["run_ms"].items():
+        print(f"  {name:<18} {ms:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Compares getting a runnable program by parsing its source with loading its compiled .brc
+# file (brewcompile.py), in process and in fresh worker processes.
+#
+#   python bench_brc.py [--functions N] [--reps N] [--json]
+#
+# The program is the one bench_ast.py generates. In process, "ply" and "pratt" parse it
+# uncached and "brc" maps its .brc file in and builds the function table. The fresh process
+# numbers are for a whole worker start: importing the interpreter, then parsing or loading.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import brewcompile
+import brewparse
+import brewpratt
+from bench_ast import generate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = """
+import sys, time
+start = time.perf_counter()
+import interpreterv3
+if sys.argv[1] == "parse":
+    with open(sys.argv[2]) as f:
+        interpreterv3.parse_program(f.read())
+else:
+    import brewcompile
+    with brewcompile.load(sys.argv[2]) as program:
+        program.function_table()
+print(time.perf_counter() - start, "ply.yacc" in sys.modules)
+"""
+
+
+def best_time(function, reps):
+    times = []
+    for _ in range(reps):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def load_table(brc, source):
+    with brewcompile.load(brc, source) as program:
+        return program.function_table()
+
+
+def worker_time(mode, path, reps):
+    env = dict(os.environ)
+    env.pop("BREWIN_PARSE_CACHE", None)
+    samples = []
+    for _ in range(reps):
+        result = subprocess.run(
+            [sys.executable, "-c", WORKER, mode, path],
+            capture_output=True,
+            text=True,
+            cwd=HERE,
+            env=env,
+            check=True,
+        )
+        seconds, loaded_ply = result.stdout.split()
+        samples.append(float(seconds))
+    return statistics.median(samples), loaded_ply == "True"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--functions", type=int, default=200)
+    arg_parser.add_argument("--reps", type=int, default=5)
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+
+    source = generate(args.functions)
+    results = {"functions": args.functions, "in_process_ms": {}, "fresh_process_ms": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.br")
+        with open(path, "w") as f:
+            f.write(source)
+        brc = brewcompile.compile_file(path)
+        results["source_bytes"] = len(source)
+        results["brc_bytes"] = os.path.getsize(brc)
+
+        timings = results["in_process_ms"]
+        timings["ply"] = best_time(lambda: brewparse.parse_with_ply(source), args.reps) * 1000
+        timings["pratt"] = best_time(lambda: brewpratt.parse(source), args.reps) * 1000
+        timings["brc"] = (
+            best_time(lambda: load_table(brc, source), args.reps) * 1000
+        )
+
+        for mode in ("parse", "load"):
+            seconds, loaded_ply = worker_time(mode, path if mode == "parse" else brc, args.reps)
+            results["fresh_process_ms"][mode] = seconds * 1000
+            results["fresh_process_ms"][f"{mode}_loads_ply"] = loaded_ply
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{args.functions} functions: {results['source_bytes']} bytes of source,"
+        f" {results['brc_bytes']} bytes of .brc"
+    )
+    print("in process:")
+    for name, ms in results["in_process_ms"].items():
+        print(f"  {name:<6} {ms:>8.2f} ms")
+    fresh = results["fresh_process_ms"]
+    print("fresh worker, import to runnable program:")
+    for mode in ("parse", "load"):
+        ply = "loads PLY" if fresh[f"{mode}_loads_ply"] else "no PLY"
+        print(f"  {mode:<6} {fresh[mode]:>8.2f} ms  ({ply})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# Measures how lexing and parsing scale with the size of the source, on generated programs
+# from a few KB up to tens of MB, for each parser frontend (PLY, and brewpratt.py).
+#
+#   python bench_parser.py [--shapes a,b] [--sizes 1K,10K,...] [--frontends ply,pratt]
+#                          [--reps N] [--comment-bytes N] [--no-memory] [--json]
+#
+# shapes:
+#   functions    thousands of small func definitions
+#   expressions  assignments of long chains of binary operators
+#   nesting      if and while blocks nested deep inside one another
+#   comments     functions between big /* */ comment blocks, of --comment-bytes each
+#
+# Lexing and parsing are timed apart: the source is lexed to a list of tokens first, and
+# the parser is then fed that list (PLY through yacc's tokenfunc). Each is the fastest of
+# --reps runs after a warmup, with the garbage collector off; tokens/s is over the lex
+# time, AST nodes/s over the parse time. Peak memory is what tracemalloc sees allocated
+# during one more run of each, so it's of the tokens for lexing and of the tree (and parse
+# stacks) for parsing. The parse cache isn't used.
+#
+# Sizes go up to tens of MB (--sizes 10M,30M) if there's the time: PLY lexes and parses
+# a few hundred thousand tokens a second. Note that both lexers match a comment with the
+# regex /\*(.|\n)*?\*/, whose peak memory is a couple of hundred bytes per character of
+# the longest comment; try --comment-bytes 1048576.
+import argparse
+import functools
+import gc
+import io
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import brewparse
+import brewpratt
+from element import Element
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 * 1024}
+
+
+def functions_unit(n):
+    return f"""
+func f{n}(a, b) {{
+  x = a * {n} + b;
+  if (x > {n}) {{
+    print("f{n}", x);
+  }}
+  return x - 1;
+}}
+"""
+
+
+def expressions_unit(n, terms=200):
+    operators = ["+", "-", "*", "/"]
+    chain = " ".join(f"{operators[i % 4]} (v{i % 7} + {i})" for i in range(terms))
+    return f"""
+func e{n}(v0, v1, v2, v3, v4, v5, v6) {{
+  x = {n} {chain};
+  return x;
+}}
+"""
+
+
+def nesting_unit(n, depth=40):
+    body = f"x = x + {n};"
+    for level in range(depth):
+        keyword = "while" if level % 2 else "if"
+        body = f"{keyword} (x < {level}) {{\n{body}\n}}"
+    return f"func n{n}(x) {{\n{body}\nreturn x;\n}}\n"
+
+
+def comments_unit(n, comment_bytes=4096):
+    line = f"  comment {n}: func main() {{ print(1 + 2); }} \"quoted\" text\n"
+    comment = "/*\n" + line * (comment_bytes // len(line)) + "*/"
+    return comment + functions_unit(n)
+
+
+SHAPES = {
+    "functions": functions_unit,
+    "expressions": expressions_unit,
+    "nesting": nesting_unit,
+    "comments": comments_unit,
+}
+
+
+def generate(unit, size):
+    """A program of about size bytes (at least one unit), of unit(0), unit(1), ..."""
+    parts = ["func main() {\n  print(0);\n}\n"]
+    length = len(parts[0])
+    n = 0
+    while length < size or n == 0:
+        part = unit(n)
+        parts.append(part)
+        length += len(part)
+        n += 1
+    return "".join(parts)
+
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Element):
+            count += 1
+            stack.extend(node.dict.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return count
+
+
+class PlyFrontend:
+    def __init__(self):
+        self.parser = brewparse.Parser()
+
+    def lex(self, source):
+        lexer = self.parser.lexer
+        lexer.lineno = 1
+        lexer.input(source)
+        return list(iter(lexer.token, None))
+
+    def parse(self, tokens):
+        next_token = iter(tokens).__next__
+
+        def tokenfunc():
+            try:
+                return next_token()
+            except StopIteration:
+                return None
+
+        return self.parser.lr_parser.parse(lexer=self.parser.lexer, tokenfunc=tokenfunc)
+
+    def token_count(self, tokens):
+        return len(tokens)
+
+
+class PrattFrontend:
+    def lex(self, source):
+        return brewpratt.tokenize(source)
+
+    def parse(self, tokens):
+        return brewpratt.PrattParser(*tokens).program()
+
+    def token_count(self, tokens):
+        # less the END marker
+        return len(tokens[0]) - 1
+
+
+FRONTENDS = {brewparse.PLY_FRONTEND: PlyFrontend, brewparse.PRATT_FRONTEND: PrattFrontend}
+
+
+def fastest(function, argument, reps):
+    # the first run also pays for whatever's set up lazily; it isn't counted
+    result = function(argument)
+    best = None
+    for _ in range(reps):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = function(argument)
+            seconds = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def peak_memory(function, argument):
+    tracemalloc.start()
+    try:
+        function(argument)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(frontend, source, reps, memory):
+    lex_seconds, tokens = fastest(frontend.lex, source, reps)
+    if tokens is None:
+        return {"error": "lexer rejected the source"}
+    parse_seconds, ast = fastest(frontend.parse, tokens, reps)
+    if ast is None:
+        return {"error": "parser rejected the source"}
+    token_count = frontend.token_count(tokens)
+    nodes = count_nodes(ast)
+    result = {
+        "tokens": token_count,
+        "nodes": nodes,
+        "lex_s": lex_seconds,
+        "parse_s": parse_seconds,
+        "tokens_per_s": token_count / lex_seconds,
+        "nodes_per_s": nodes / parse_seconds,
+        "lex_bytes_per_s": len(source) / lex_seconds,
+    }
+    if memory:
+        result["lex_peak_bytes"] = peak_memory(frontend.lex, source)
+        result["parse_peak_bytes"] = peak_memory(frontend.parse, tokens)
+    return result
+
+
+def size_list(spec):
+    sizes = []
+    for part in spec.split(","):
+        part = part.strip().upper()
+        multiplier = SIZE_SUFFIXES.get(part[-1:], 1)
+        digits = part[:-1] if part[-1:] in SIZE_SUFFIXES else part
+        if not digits.isdigit():
+            raise argparse.ArgumentTypeError(f"expected sizes like 1K,10M, got {spec}")
+        sizes.append(int(digits) * multiplier)
+    return sizes
+
+
+def human_size(size):
+    for suffix, multiplier in (("M", SIZE_SUFFIXES["M"]), ("K", SIZE_SUFFIXES["K"])):
+        if size >= multiplier:
+            return f"{size / multiplier:.1f}{suffix}"
+    return str(size)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--shapes", default=",".join(SHAPES))
+    arg_parser.add_argument(
+        "--sizes", type=size_list, default=size_list("1K,10K,100K,1M"), help="e.g. 1K,10M"
+    )
+    arg_parser.add_argument("--frontends", default=",".join(FRONTENDS))
+    arg_parser.add_argument("--reps", type=int, default=3)
+    arg_parser.add_argument(
+        "--comment-bytes", type=int, default=4096, help="size of each comment block"
+    )
+    arg_parser.add_argument(
+        "--no-memory", action="store_true", help="skip the (slower) peak memory runs"
+    )
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+    shapes = args.shapes.split(",")
+    for shape in shapes:
+        if shape not in SHAPES:
+            arg_parser.error(f"unknown shape {shape}; expected one of {', '.join(SHAPES)}")
+    frontends = args.frontends.split(",")
+    for name in frontends:
+        if name not in FRONTENDS:
+            arg_parser.error(f"unknown frontend {name}; expected one of {', '.join(FRONTENDS)}")
+    # the Pratt parser recurses once per nesting level and operator
+    sys.setrecursionlimit(20000)
+
+    instances = {name: FRONTENDS[name]() for name in frontends}
+    units = dict(SHAPES)
+    units["comments"] = functools.partial(comments_unit, comment_bytes=args.comment_bytes)
+    rows = []
+    for shape in shapes:
+        for size in args.sizes:
+            source = generate(units[shape], size)
+            for name in frontends:
+                row = {"shape": shape, "size": size, "source_bytes": len(source), "frontend": name}
+                # PLY reports syntax errors on stdout
+                with redirect_stdout(io.StringIO()):
+                    row.update(measure(instances[name], source, args.reps, not args.no_memory))
+                rows.append(row)
+                if not args.json:
+                    print_row(row)
+    if args.json:
+        results = {"reps": args.reps, "comment_bytes": args.comment_bytes, "results": rows}
+        print(json.dumps(results, indent=2))
+
+
+def print_row(row):
+    label = f"{row['shape']:<12}{human_size(row['source_bytes']):>7} {row['frontend']:<6}"
+    if "error" in row:
+        print(f"{label} {row['error']}")
+        return
+    line = (
+        f"{label} {row['tokens']:>9} tokens {row['tokens_per_s'] / 1e3:>6.0f}K tok/s"
+        f" {human_size(row['lex_bytes_per_s']):>7}B/s {row['nodes']:>8} nodes"
+        f" {row['nodes_per_s'] / 1e3:>5.0f}K nodes/s"
+    )
+    if "lex_peak_bytes" in row:
+        line += (
+            f"  peak lex {human_size(row['lex_peak_bytes']):>6}B"
+            f" parse {human_size(row['parse_peak_bytes']):>6}B"
+        )
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# Runs Brewin programs generated for a range of sizes of one parameter at a time, and fits
+# how time and peak memory grow with it, to catch hot paths whose cost is worse than
+# linear (which a fixed-size benchmark like bench_versions.py can't tell apart from slow).
+#
+#   python bench_scaling.py [--params a,b] [--targets v3,v3-closure] [--reps N]
+#                           [--sizes param=n1,n2,... ...] [--threshold X] [--json]
+#
+# Every program is written so that, for parameter n, it does O(n) work:
+#   loop        a while loop of n iterations
+#   recursion   a call chain n calls deep
+#   variables   n live variables, each assigned twice
+#   nesting     n if statements nested in one another, each doing an assignment
+#   closures    n lambdas made one after another, each called once
+# so a fitted exponent well above 1 means the interpreter adds cost per unit of n that grows
+# with n (e.g. scanning every frame on each assignment, never popping frames, or copying the
+# whole environment into each closure). The time exponent is the slope of a least-squares
+# line through (log n, log t), t the fastest of --reps runs. Every run also allocates a
+# fixed amount, which would bend that line for memory, so the memory exponent is fitted to
+# how much the peak tracemalloc sees grows from each size to the next: for sizes that go
+# up by a constant factor, as the defaults do, a peak of c + b * n^k grows by an amount
+# proportional to n^k. (Time is too noisy for differences; its fixed cost is small next to
+# the work, and only bends the line down.) A parameter is flagged when an exponent is above
+# --threshold.
+import argparse
+import json
+import math
+import statistics
+import sys
+import tracemalloc
+
+from bench_versions import TARGETS, run_once, sample, version_of
+
+
+def loop(n):
+    return f"""
+func main() {{
+  i = 0;
+  total = 0;
+  while (i < {n}) {{
+    total = total + i;
+    i = i + 1;
+  }}
+  print(total);
+}}
+"""
+
+
+def recursion(n):
+    return f"""
+func main() {{
+  print(depth({n}));
+}}
+
+func depth(n) {{
+  if (n == 0) {{
+    return 0;
+  }}
+  return 1 + depth(n - 1);
+}}
+"""
+
+
+def variables(n):
+    lines = [f"  v{i} = {i};" for i in range(n)]
+    lines += [f"  v{i} = v{i} + 1;" for i in range(n)]
+    return "func main() {\n" + "\n".join(lines) + f"\n  print(v{n - 1});\n}}\n"
+
+
+def nesting(n):
+    body = "x = x + 1;"
+    for _ in range(n):
+        body = f"if (x >= 0) {{ x = x + 1; {body} }}"
+    return f"func main() {{\n  x = 0;\n  {body}\n  print(x);\n}}\n"
+
+
+def closures(n):
+    lines = ["  k = 1;", "  total = 0;"]
+    for i in range(n):
+        lines.append(f"  f{i} = lambda(x) {{ return x + k; }};")
+        lines.append(f"  total = f{i}(total);")
+    return "func main() {\n" + "\n".join(lines) + "\n  print(total);\n}\n"
+
+
+# name: (first version that runs it, program generator, default sizes)
+PARAMETERS = {
+    "loop": (2, loop, [500, 1000, 2000, 4000]),
+    "recursion": (2, recursion, [50, 100, 200, 400]),
+    "variables": (1, variables, [100, 200, 400, 800]),
+    "nesting": (2, nesting, [25, 50, 100, 200]),
+    "closures": (3, closures, [50, 100, 200, 400]),
+}
+
+
+def time_run(target, source, reps):
+    # the fastest run is the one least disturbed by anything else on the machine; the fit is
+    # of differences between sizes, which noise in a median would swamp at small sizes
+    run_once(target, source)
+    return min(sample(target, source)[0] for _ in range(reps))
+
+
+def peak_memory(target, source):
+    tracemalloc.start()
+    try:
+        run_once(target, source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def fit_slope(points):
+    """Slope of the least-squares line through points; None if there's no line."""
+    if len(points) < 2:
+        return None
+    mean_x = statistics.mean(x for x, _ in points)
+    mean_y = statistics.mean(y for _, y in points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def growth_exponent(sizes, costs):
+    """k for costs ~ b * size^k."""
+    return fit_slope([(math.log(size), math.log(cost)) for size, cost in zip(sizes, costs)])
+
+
+def increment_exponent(sizes, costs):
+    """k for costs ~ c + b * size^k, from how much cost grows from each size to the next."""
+    return fit_slope(
+        [
+            (math.log(size), math.log(after - before))
+            for size, before, after in zip(sizes, costs, costs[1:])
+            if after > before
+        ]
+    )
+
+
+def scale(target, generate, sizes, reps):
+    seconds = []
+    peaks = []
+    for size in sizes:
+        source = generate(size)
+        seconds.append(time_run(target, source, reps))
+        peaks.append(peak_memory(target, source))
+    return {
+        "sizes": sizes,
+        "time_ms": [s * 1000 for s in seconds],
+        "peak_bytes": peaks,
+        "time_exponent": growth_exponent(sizes, seconds),
+        "memory_exponent": increment_exponent(sizes, peaks),
+    }
+
+
+def sizes_spec(spec):
+    name, _, sizes = spec.partition("=")
+    try:
+        sizes = [int(size) for size in sizes.split(",")]
+    except ValueError:
+        sizes = []
+    if name not in PARAMETERS or len(sizes) < 3:
+        raise argparse.ArgumentTypeError(f"expected param=n1,n2,n3,..., got {spec}")
+    return name, sizes
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--params", default=",".join(PARAMETERS))
+    arg_parser.add_argument("--targets", default="v3")
+    arg_parser.add_argument("--reps", type=int, default=5)
+    arg_parser.add_argument(
+        "--sizes", type=sizes_spec, action="append", default=[], help="param=n1,n2,..."
+    )
+    arg_parser.add_argument(
+        "--threshold", type=float, default=1.25, help="flag growth exponents above this"
+    )
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+    params = args.params.split(",")
+    targets = args.targets.split(",")
+    for name in params:
+        if name not in PARAMETERS:
+            arg_parser.error(f"unknown parameter {name}; expected one of {', '.join(PARAMETERS)}")
+    for target in targets:
+        if target not in TARGETS:
+            arg_parser.error(f"unknown target {target}; expected one of {', '.join(TARGETS)}")
+    sys.setrecursionlimit(20000)
+    custom_sizes = dict(args.sizes)
+
+    results = {"threshold": args.threshold, "parameters": {}}
+    for name in params:
+        since, generate, sizes = PARAMETERS[name]
+        sizes = custom_sizes.get(name, sizes)
+        row = results["parameters"][name] = {}
+        for target in targets:
+            if version_of(target) < since:
+                continue
+            curve = scale(target, generate, sizes, args.reps)
+            curve["superlinear"] = [
+                kind
+                for kind in ("time", "memory")
+                if (curve[f"{kind}_exponent"] or 0) > args.threshold
+            ]
+            row[target] = curve
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"growth exponents (cost ~ n^k), flagged above {args.threshold}")
+    print(f"{'parameter':<11}{'target':<13}{'sizes':<22}{'time k':>7}{'memory k':>9}  ms")
+    for name, row in results["parameters"].items():
+        for target, curve in row.items():
+            exponents = [
+                "-" if curve[key] is None else f"{curve[key]:.2f}"
+                for key in ("time_exponent", "memory_exponent")
+            ]
+            sizes = ",".join(str(size) for size in curve["sizes"])
+            times = " ".join(f"{ms:.1f}" for ms in curve["time_ms"])
+            flag = ""
+            if curve["superlinear"]:
+                flag = f"  SUPERLINEAR {'/'.join(curve['superlinear'])}"
+            print(
+                f"{name:<11}{target:<13}{sizes:<22}{exponents[0]:>7}{exponents[1]:>9}"
+                f"  {times}{flag}"
+            )
+
+
+if __name__ == "__main__":
+    main()
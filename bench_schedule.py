@@ -0,0 +1,98 @@
+# Compares how long a parallel test run takes with tests handed out in suite order,
+# longest first by recorded durations, and longest first by source size alone (a run with
+# no timings recorded yet).
+#
+#   python bench_schedule.py [--timings FILE] [--workers 2,4,8,16] [--json] [dir ...]
+#
+# Each test in the given directories (default v3/tests, v3original/tests, v3original/fails)
+# is first run once on its own, through the harness, to get its real duration; --timings
+# reuses durations recorded by an earlier run instead. The makespan of each order is then
+# simulated the way run_tests_in_processes hands out tests: each test goes to the first
+# worker to become free. The lower bound is the larger of the longest test and the total
+# divided by the number of workers.
+import argparse
+import asyncio
+import glob
+import heapq
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+
+import harness
+import interpreterv3
+from tester import TestScaffold
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIRS = ("v3/tests", "v3original/tests", "v3original/fails")
+
+
+def suite(directories):
+    tests = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "*.br"))):
+            tests.append(
+                {"name": path, "srcfile": path, "expect_failure": "fails" in directory}
+            )
+    return tests
+
+
+def measure(tests):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "timings.json")
+        # failing tests print tracebacks; only the durations matter here
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            asyncio.run(
+                harness.run_all_tests(TestScaffold(interpreterv3), tests, timings_path=path)
+            )
+        return harness.load_timings(path)
+
+
+def makespan(order, durations, workers):
+    free_at = [0.0] * workers
+    for index in order:
+        heapq.heapreplace(free_at, free_at[0] + durations[index])
+    return max(free_at)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("directories", nargs="*", default=DEFAULT_DIRS)
+    arg_parser.add_argument("--timings", help="durations recorded by an earlier run")
+    arg_parser.add_argument("--workers", default="2,4,8,16")
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+    os.chdir(HERE)
+    sys.setrecursionlimit(10000)
+
+    tests = suite(args.directories)
+    timings = harness.load_timings(args.timings) if args.timings else measure(tests)
+    tests = [test for test in tests if test["srcfile"] in timings]
+    durations = [timings[test["srcfile"]] for test in tests]
+    orders = {
+        "suite order": range(len(tests)),
+        "longest first": harness.schedule_longest_first(tests, timings),
+        "by size": harness.schedule_longest_first(tests, {}),
+    }
+
+    results = {"tests": len(tests), "total_s": sum(durations), "workers": {}}
+    for workers in (int(n) for n in args.workers.split(",")):
+        row = {"lower_bound_s": max(max(durations), sum(durations) / workers)}
+        for name, order in orders.items():
+            row[name] = makespan(order, durations, workers)
+        results["workers"][workers] = row
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{len(tests)} tests, {results['total_s'] * 1000:.1f} ms in total")
+    names = ["lower_bound_s", *orders]
+    print(f"{'workers':>7} " + " ".join(f"{name.replace('_s', ''):>14}" for name in names))
+    for workers, row in results["workers"].items():
+        print(f"{workers:>7} " + " ".join(f"{row[name] * 1000:>12.1f}ms" for name in names))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Measures how long a fresh process takes to get from nothing to a parsed program, for each
+# way of building the parser. Every sample runs in its own interpreter process, since
+# startup cost is what's being measured.
+#
+#   python bench_startup.py [--reps N] [--json] [--no-bytecode-cache] [--baseline REV]
+#                           [program.br]
+#
+# modes:
+#   baseline  brewparse as of git revision REV (by default the repository's first commit),
+#             checked out into a scratch directory: importing it runs lex.lex(), validating
+#             the token rules, and yacc.yacc() with its defaults, reflecting the grammar
+#             and checking its signature against parsetab.py
+#   lazy      import brewparse and parse, which reads the pregenerated tables on the first
+#             parse and, for a valid program, runs them without loading PLY
+#   cached    lazy, with the on-disk parse cache already holding the program's AST; loading
+#             it means importing pickle and hashlib, which can cost more than parsing a
+#             small program does
+#
+# Modules are byte-compiled once, into a scratch pycache, before anything is timed, as
+# they would be after a first run; --no-bytecode-cache compiles every module in every
+# sample instead, which costs more than building the parser does.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PROGRAM = """
+func main() {
+  x = 5;
+  while (x > 0) {
+    print(x);
+    x = x - 1;
+  }
+}
+"""
+
+# prints import time, first parse time and whether PLY got loaded
+# run in the checkout being measured
+SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import brewparse
+ready = time.perf_counter()
+brewparse.parse_program(sys.stdin.read())
+done = time.perf_counter()
+print(ready - start, done - ready, "ply.yacc" in sys.modules)
+"""
+
+
+def check_out(revision, directory):
+    archive = subprocess.run(
+        ["git", "archive", revision], cwd=HERE, capture_output=True, check=True
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+
+
+def sample(tree, program, env):
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        input=program,
+        capture_output=True,
+        text=True,
+        cwd=tree,
+        env=env,
+        check=True,
+    )
+    import_time, parse_time, loaded_ply = result.stdout.split()
+    return float(import_time), float(parse_time), loaded_ply == "True"
+
+
+def measure(tree, program, reps, env):
+    samples = [sample(tree, program, env) for _ in range(reps)]
+    imports = [s[0] * 1000 for s in samples]
+    parses = [s[1] * 1000 for s in samples]
+    totals = [i + p for i, p in zip(imports, parses)]
+    return {
+        "import_ms": statistics.median(imports),
+        "first_parse_ms": statistics.median(parses),
+        "total_ms": statistics.median(totals),
+        "total_min_ms": min(totals),
+        "loads_ply": any(s[2] for s in samples),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("program", nargs="?", help="a .br file to parse")
+    arg_parser.add_argument("--reps", type=int, default=15)
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    arg_parser.add_argument(
+        "--no-bytecode-cache",
+        action="store_true",
+        help="compile every module in every sample rather than once up front",
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        help="git revision whose brewparse to compare against (default: the first commit)",
+    )
+    args = arg_parser.parse_args()
+
+    program = DEFAULT_PROGRAM
+    if args.program:
+        with open(args.program) as f:
+            program = f.read()
+
+    env = dict(os.environ)
+    env.pop("BREWIN_PARSE_CACHE", None)
+    revision = args.baseline or subprocess.run(
+        ["git", "rev-list", "--max-parents=0", "HEAD"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()[0]
+    with tempfile.TemporaryDirectory() as scratch:
+        baseline = os.path.join(scratch, "baseline")
+        os.mkdir(baseline)
+        check_out(revision, baseline)
+        if args.no_bytecode_cache:
+            env["PYTHONDONTWRITEBYTECODE"] = "1"
+        else:
+            env.pop("PYTHONDONTWRITEBYTECODE", None)
+            env["PYTHONPYCACHEPREFIX"] = os.path.join(scratch, "pycache")
+            # byte-compiles what each mode imports
+            sample(baseline, program, env)
+            sample(HERE, program, env)
+        results = {
+            "baseline": measure(baseline, program, args.reps, env),
+            "lazy": measure(HERE, program, args.reps, env),
+        }
+        env["BREWIN_PARSE_CACHE"] = os.path.join(scratch, "asts")
+        sample(HERE, program, env)  # fills the cache
+        results["cached"] = measure(HERE, program, args.reps, env)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<8} {'import':>9} {'1st parse':>10} {'total':>9} {'best':>9}  PLY")
+    for mode, r in results.items():
+        print(
+            f"{mode:<8} {r['import_ms']:>7.1f}ms {r['first_parse_ms']:>8.1f}ms "
+            f"{r['total_ms']:>7.1f}ms {r['total_min_ms']:>7.1f}ms  "
+            f"{'loaded' if r['loads_ply'] else 'not loaded'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# Times a set of representative Brewin workloads on each interpreter version (and each v3
+# execution backend), so a performance change can be judged against a recorded baseline.
+#
+#   python bench_versions.py [--workloads a,b] [--targets v1,v2,v3] [--warmup N] [--reps N]
+#                            [--size workload=N ...] [--output FILE] [--baseline FILE] [--json]
+#
+# Each workload is a program generated for a size n, and runs on every target whose
+# version supports the features it uses (v1 has no loops or functions, v2 no lambdas) and
+# computes the same result with them (v3 scopes variables dynamically).
+# A sample is one Interpreter(...).run(source) with console output off, so it includes
+# looking the AST up in the parse cache but not parsing, which the warmup runs already did.
+# The garbage collector is off during a sample, as timeit does, and run between samples.
+# Targets whose outputs for a workload differ are flagged: the times then aren't of the
+# same work (v3's dynamic scoping changes what some v2 programs compute).
+#
+# --output writes the results as JSON: environment, then for each workload and target the
+# per-sample times and their min, median, mean and standard deviation in ms. --baseline
+# reads such a file back and adds each row's median relative to the baseline's.
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import interpreterv1
+import interpreterv2
+import interpreterv3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (interpreter module, keyword arguments)
+TARGETS = {
+    "v1": (interpreterv1, {}),
+    "v2": (interpreterv2, {}),
+    "v3": (interpreterv3, {"backend": interpreterv3.Interpreter.TREE_BACKEND}),
+    "v3-closure": (interpreterv3, {"backend": interpreterv3.Interpreter.CLOSURE_BACKEND}),
+    "v3-bytecode": (interpreterv3, {"backend": interpreterv3.Interpreter.BYTECODE_BACKEND}),
+}
+
+
+def straight_line(n):
+    # unrolled assignments and prints, the only kind of program v1 runs
+    return "func main() {\n  x = 0;\n" + "  x = x + 1;\n  print(x);\n" * n + "}\n"
+
+
+def while_arith(n):
+    return f"""
+func main() {{
+  i = 0;
+  total = 0;
+  while (i < {n}) {{
+    total = total + i * 3 - i / 2;
+    i = i + 1;
+  }}
+  print(total);
+}}
+"""
+
+
+def catalan(n):
+    # the same exponential recursion as v2/tests/test_recur_catalan_nums.br. Not run on
+    # v3: it scopes variables dynamically and never pops a call's block frames, so the
+    # callers' n, ans and j are the callees' after a call
+    return f"""
+func main() {{
+  print(catalan({n}));
+}}
+
+func catalan(n) {{
+  return catalan_help(n, 0, 0);
+}}
+
+func catalan_help(n, ans, j) {{
+  if (n < 2) {{
+    return 1;
+  }} else {{
+    while (j < n) {{
+      ans = ans + catalan(j) * catalan(n - j - 1);
+      j = j + 1;
+    }}
+    return ans;
+  }}
+}}
+"""
+
+
+def deep_recursion(n):
+    return f"""
+func main() {{
+  print(depth({n}));
+}}
+
+func depth(n) {{
+  if (n == 0) {{
+    return 0;
+  }}
+  return 1 + depth(n - 1);
+}}
+"""
+
+
+def closures(n):
+    # one lambda, capturing k by copy, called n times (bench_scaling's closures makes a new
+    # lambda each time)
+    return f"""
+func main() {{
+  total = 0;
+  i = 0;
+  k = 3;
+  add = lambda(x) {{ return x + k; }};
+  while (i < {n}) {{
+    total = add(total);
+    i = i + 1;
+  }}
+  print(total);
+}}
+"""
+
+
+def string_concat(n):
+    return f"""
+func main() {{
+  s = "";
+  i = 0;
+  while (i < {n}) {{
+    s = s + "ab";
+    i = i + 1;
+  }}
+  print(s);
+}}
+"""
+
+
+def print_heavy(n):
+    return f"""
+func main() {{
+  i = 0;
+  while (i < {n}) {{
+    print("line ", i, " of ", {n});
+    i = i + 1;
+  }}
+}}
+"""
+
+
+# name: (versions that run it, program generator, default size)
+WORKLOADS = {
+    "straight_line": ((1, 2, 3), straight_line, 300),
+    "while_arith": ((2, 3), while_arith, 2000),
+    "catalan": ((2,), catalan, 8),
+    "deep_recursion": ((2, 3), deep_recursion, 300),
+    "closures": ((3,), closures, 200),
+    "string_concat": ((2, 3), string_concat, 1000),
+    "print_heavy": ((2, 3), print_heavy, 1000),
+}
+
+
+def version_of(target):
+    return int(TARGETS[target][0].__name__[-1])
+
+
+def run_once(target, source):
+    module, options = TARGETS[target]
+    interpreter = module.Interpreter(False, [], False, **options)
+    interpreter.run(source)
+    return interpreter.get_output()
+
+
+def sample(target, source):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        output = run_once(target, source)
+        return time.perf_counter() - start, output
+    finally:
+        gc.enable()
+
+
+def measure(target, source, warmup, reps):
+    for _ in range(warmup):
+        output = run_once(target, source)
+    times = []
+    for _ in range(reps):
+        seconds, output = sample(target, source)
+        times.append(seconds * 1000)
+    return {
+        "samples_ms": times,
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.mean(times),
+        "stdev_ms": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "output_sha256": hashlib.sha256("\n".join(output).encode("utf-8")).hexdigest()[:16],
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=HERE,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def run_suite(workloads, targets, sizes, warmup, reps):
+    results = {}
+    for name in workloads:
+        versions, generate, default_size = WORKLOADS[name]
+        size = sizes.get(name, default_size)
+        source = generate(size)
+        row = {"size": size, "targets": {}}
+        for target in targets:
+            if version_of(target) in versions:
+                row["targets"][target] = measure(target, source, warmup, reps)
+        outputs = {result["output_sha256"] for result in row["targets"].values()}
+        row["outputs_agree"] = len(outputs) <= 1
+        results[name] = row
+    return results
+
+
+def compare(results, baseline):
+    """Add each row's median over the baseline's median, where the baseline has the row."""
+    for name, row in results.items():
+        for target, result in row["targets"].items():
+            try:
+                before = baseline["workloads"][name]
+                if before["size"] != row["size"]:
+                    continue
+                before_ms = before["targets"][target]["median_ms"]
+                result["vs_baseline"] = result["median_ms"] / before_ms
+            except (KeyError, ZeroDivisionError):
+                pass
+
+
+def size_spec(spec):
+    name, _, size = spec.partition("=")
+    if name not in WORKLOADS or not size.isdigit():
+        raise argparse.ArgumentTypeError(f"expected workload=N, got {spec}")
+    return name, int(size)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    arg_parser.add_argument("--targets", default=",".join(TARGETS))
+    arg_parser.add_argument("--warmup", type=int, default=1)
+    arg_parser.add_argument("--reps", type=int, default=5)
+    arg_parser.add_argument(
+        "--size", type=size_spec, action="append", default=[], help="workload=N"
+    )
+    arg_parser.add_argument("--output", help="write the results to this JSON file")
+    arg_parser.add_argument("--baseline", help="results JSON of an earlier run to compare to")
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+    workloads = args.workloads.split(",")
+    targets = args.targets.split(",")
+    for name in workloads:
+        if name not in WORKLOADS:
+            arg_parser.error(f"unknown workload {name}; expected one of {', '.join(WORKLOADS)}")
+    for target in targets:
+        if target not in TARGETS:
+            arg_parser.error(f"unknown target {target}; expected one of {', '.join(TARGETS)}")
+    sys.setrecursionlimit(20000)
+
+    results = {
+        "environment": environment(),
+        "warmup": args.warmup,
+        "reps": args.reps,
+        "workloads": run_suite(workloads, targets, dict(args.size), args.warmup, args.reps),
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            compare(results["workloads"], json.load(handle))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"median of {args.reps} runs after {args.warmup} warmup, ms (stdev)")
+    print(f"{'workload':<16}{'n':>6} " + "".join(f"{target:>19}" for target in targets))
+    for name, row in results["workloads"].items():
+        cells = []
+        for target in targets:
+            result = row["targets"].get(target)
+            if result is None:
+                cells.append(f"{'-':>19}")
+                continue
+            cell = f"{result['median_ms']:.1f} ({result['stdev_ms']:.1f})"
+            if "vs_baseline" in result:
+                cell += f" {result['vs_baseline']:.2f}x"
+            cells.append(f"{cell:>19}")
+        flag = "" if row["outputs_agree"] else "  outputs differ!"
+        print(f"{name:<16}{row['size']:>6} " + "".join(cells) + flag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# Compiles brewin programs into .brc files, which hold the program's compact AST
+# (compactast.py) and function table, so a process can map one in and start running it
+# without lexing or parsing anything.
+#
+#   python brewcompile.py program.br ...      writes program.brc next to each program
+#
+# A .brc file is a fixed header, a JSON metadata block and the tree's arrays:
+#
+#   header      magic, format version, sha256 of the source, grammar fingerprint, the
+#               metadata block's length
+#   metadata    kind and field names, the constant pool, the function table, and each
+#               array's offset, length and item size
+#   arrays      each array's raw bytes in this machine's byte order, 8-byte aligned
+#
+# load() maps the file and hands the arrays to CompactAST as memoryviews into the mapping,
+# so they're never copied. A file is stale, and load() raises StaleProgramError, when its
+# source hash doesn't match the source it's checked against, or it was built by a different
+# format version, grammar or kind of machine.
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from compactast import ARRAYS, CompactAST
+from parsecache import grammar_fingerprint
+
+MAGIC = b"BRC\x00"
+FORMAT_VERSION = 2
+EXTENSION = ".brc"
+# magic, format version, padding, source sha256, grammar fingerprint, metadata length
+HEADER = struct.Struct("<4sHH32s16sI")
+ALIGNMENT = 8
+
+
+class StaleProgramError(ValueError):
+    pass
+
+
+class CompiledProgram:
+    def __init__(self, tree, functions, source_hash, mapping=None):
+        self.tree = tree
+        # (name, number of params, node index) for each function, in source order
+        self.functions = functions
+        self.source_hash = source_hash
+        # the file mapping the tree's arrays are views into, if they are
+        self.mapping = mapping
+
+    # unmaps the file the program was loaded from; the tree can't be read after this
+    def close(self):
+        if self.mapping is None:
+            return
+        for name, _typecode in ARRAYS:
+            getattr(self.tree, name).release()
+        self.mapping.close()
+        self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # the table Interpreter.__set_up_function_table builds from a parsed program; a later
+    # function with the same name and arity replaces an earlier one, as it does there
+    def function_table(self):
+        table = {}
+        for name, num_params, index in self.functions:
+            if name not in table:
+                table[name] = {}
+            table[name][num_params] = self.tree.node(index)
+        return table
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode("utf-8")).digest()
+
+
+def brc_path(path):
+    return os.path.splitext(path)[0] + EXTENSION
+
+
+# returns the .brc bytes for a program's source; raises SyntaxError as parse_program does
+def compile_source(source):
+    from brewparse import parse_program
+
+    tree = CompactAST.from_element(parse_program(source))
+    functions = []
+    for func in tree.root().get("functions"):
+        functions.append([func.get("name"), len(func.get("args")), func.index])
+
+    arrays = []
+    offset = 0
+    for name, _typecode in ARRAYS:
+        data = getattr(tree, name).tobytes()
+        arrays.append((name, offset, len(data), data))
+        offset += len(data) + -len(data) % ALIGNMENT
+    metadata = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "kind_names": tree.kind_names,
+            "field_names": tree.field_names,
+            "constants": tree.constants,
+            "functions": functions,
+            "arrays": {
+                name: [offset, size, getattr(tree, name).itemsize]
+                for name, offset, size, _ in arrays
+            },
+        }
+    ).encode("utf-8")
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        0,
+        source_hash(source),
+        grammar_fingerprint().encode("ascii"),
+        len(metadata),
+    )
+    parts = [header, metadata, b"\x00" * (-(len(header) + len(metadata)) % ALIGNMENT)]
+    for _, _, size, data in arrays:
+        parts.append(data)
+        parts.append(b"\x00" * (-size % ALIGNMENT))
+    return b"".join(parts)
+
+
+# compiles the program at path into its .brc file, written atomically
+def compile_file(path, output=None):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    data = compile_source(source)
+    output = output or brc_path(path)
+    temp_path = f"{output}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, output)
+    return output
+
+
+# maps a .brc file in. source, if given, is the program text it must have been built from.
+# The program keeps the file mapped until it's closed (CompiledProgram.close)
+def load(path, source=None):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise StaleProgramError(f"{path} is not a compiled brewin program")
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapping)
+    arrays = {}
+    try:
+        return load_mapped(path, source, mapping, view, arrays)
+    except BaseException:
+        # nothing outside holds the views yet, so the mapping can be closed
+        for array_view in arrays.values():
+            array_view.release()
+        view.release()
+        mapping.close()
+        raise
+    finally:
+        # the arrays are casts of their own; the tree doesn't need this one
+        view.release()
+
+
+def load_mapped(path, source, mapping, view, arrays):
+    magic, version, _, digest, fingerprint, metadata_size = HEADER.unpack_from(mapping)
+    if magic != MAGIC:
+        raise StaleProgramError(f"{path} is not a compiled brewin program")
+    if version != FORMAT_VERSION:
+        raise StaleProgramError(f"{path} has format version {version}, not {FORMAT_VERSION}")
+    if fingerprint.decode("ascii") != grammar_fingerprint():
+        raise StaleProgramError(f"{path} was built by a different parser")
+    if source is not None and digest != source_hash(source):
+        raise StaleProgramError(f"{path} is out of date with its source")
+
+    metadata_start = HEADER.size
+    metadata = json.loads(bytes(mapping[metadata_start : metadata_start + metadata_size]))
+    if metadata["byteorder"] != sys.byteorder:
+        raise StaleProgramError(f"{path} was built on a {metadata['byteorder']}-endian machine")
+    base = metadata_start + metadata_size
+    base += -base % ALIGNMENT
+    for name, typecode in ARRAYS:
+        offset, size, itemsize = metadata["arrays"][name]
+        if itemsize != struct.calcsize(typecode):
+            raise StaleProgramError(f"{path} was built with different array item sizes")
+        arrays[name] = view[base + offset : base + offset + size].cast(typecode)
+
+    tree = CompactAST.from_arrays(
+        arrays, metadata["constants"], metadata["kind_names"], metadata["field_names"]
+    )
+    functions = [tuple(entry) for entry in metadata["functions"]]
+    return CompiledProgram(tree, functions, digest, mapping)
+
+
+# the compiled form of the program at path: its .brc file when that's up to date, otherwise
+# a freshly compiled one (rewriting the .brc file). Close it when done, as load()'s
+def load_or_compile(path):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    try:
+        return load(brc_path(path), source)
+    except (FileNotFoundError, StaleProgramError):
+        return load(compile_file(path), source)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} program.br ...")
+        sys.exit(2)
+    for path in sys.argv[1:]:
+        print(compile_file(path))
+
+
+if __name__ == "__main__":
+    main()
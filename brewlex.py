@@ -1,4 +1,4 @@
-from ply import lex
+import sys
 
 reserved = (
     "FUNC",
@@ -126,5 +126,92 @@ def t_error(t):
     t.lexer.skip(1)
 
 
-# Build the lexer
-lex.lex()
+# pregenerated lexer tables, see brewparse.py
+LEXTAB = "brewlextab"
+
+
+# Build the lexer. With optimize, PLY reads the rules from the pregenerated tables without
+# validating them; without it, the rules are checked and compiled from this module
+def build_lexer(optimize=True):
+    # imported here so programs whose AST is already cached never load PLY
+    from ply import lex
+
+    return lex.lex(module=sys.modules[__name__], optimize=optimize, lextab=LEXTAB)
+
+
+# What the rule functions above are handed when tokenize runs them, in place of PLY's lexer
+# and tokens
+class TableLexer:
+    __slots__ = ("lineno",)
+
+
+class TableToken:
+    __slots__ = ("type", "value", "lineno", "lexer")
+
+
+# the master patterns from the pregenerated tables, each with what its groups stand for:
+# the rule function (if any) and the token type
+table_rules = None
+
+
+def load_table_rules():
+    global table_rules
+    if table_rules is None:
+        import re
+
+        tables = __import__(LEXTAB)
+        module = sys.modules[__name__]
+        table_rules = [
+            (
+                re.compile(pattern, tables._lexreflags).match,
+                [
+                    None if group is None else (group[0] and getattr(module, group[0]), group[1])
+                    for group in groups
+                ],
+            )
+            for pattern, groups in tables._lexstatere["INITIAL"]
+        ]
+    return table_rules
+
+
+# Tokenizes source as PLY's lexer would, from the pregenerated tables and the rule functions
+# above, without loading PLY. Returns parallel lists of token types, values and line numbers,
+# ending with "$end", or None when it comes to a character no rule matches; PLY's lexer is
+# what reports those
+def tokenize(source):
+    rules = load_table_rules()
+    lexer = TableLexer()
+    lexer.lineno = 1
+    types = []
+    values = []
+    lines = []
+    pos = 0
+    end = len(source)
+    while pos < end:
+        if source[pos] in t_ignore:
+            pos += 1
+            continue
+        for match, groups in rules:
+            found = match(source, pos)
+            if found is not None:
+                break
+        else:
+            return None
+        pos = found.end()
+        rule, token_type = groups[found.lastindex]
+        token = TableToken()
+        token.type = token_type
+        token.value = found.group()
+        token.lineno = lexer.lineno
+        if rule is not None:
+            token.lexer = lexer
+            token = rule(token)
+            if token is None:
+                continue
+        types.append(token.type)
+        values.append(token.value)
+        lines.append(token.lineno)
+    types.append("$end")
+    values.append(None)
+    lines.append(lexer.lineno)
+    return types, values, lines
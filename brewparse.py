@@ -1,7 +1,11 @@
+import os
+import sys
+import threading
+import brewlex
 from element import Element
 from brewlex import *
 from intbase import InterpreterBase
-from ply import yacc
+from parsecache import ParseCache
 
 # Parsing rules
 
@@ -38,18 +42,22 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_DEF, name=p[2], args=p[4], statements=p[7])
+        p[0] = Element(
+            InterpreterBase.FUNC_DEF, p.lineno(1), name=p[2], args=p[4], statements=p[7]
+        )
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_DEF, name=p[2], args=[], statements=p[6])
+        p[0] = Element(
+            InterpreterBase.FUNC_DEF, p.lineno(1), name=p[2], args=[], statements=p[6]
+        )
 
 
 def p_lambda(p):
     """lambda : LAMBDA LPAREN formal_args RPAREN LBRACE statements RBRACE
     | LAMBDA LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 8:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.LAMBDA_DEF, args=p[3], statements=p[6])
+        p[0] = Element(InterpreterBase.LAMBDA_DEF, p.lineno(1), args=p[3], statements=p[6])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.LAMBDA_DEF, args=[], statements=p[5])
+        p[0] = Element(InterpreterBase.LAMBDA_DEF, p.lineno(1), args=[], statements=p[5])
 
 
 def p_formal_args(p):
@@ -60,12 +68,12 @@ def p_formal_args(p):
 
 def p_formal_arg(p):
     "formal_arg : NAME"
-    p[0] = Element(InterpreterBase.ARG_DEF, name=p[1])
+    p[0] = Element(InterpreterBase.ARG_DEF, p.lineno(1), name=p[1])
 
 
 def p_formal_ref_arg(p):
     "formal_arg : REF NAME"
-    p[0] = Element(InterpreterBase.REFARG_DEF, name=p[2])
+    p[0] = Element(InterpreterBase.REFARG_DEF, p.lineno(1), name=p[2])
 
 
 def p_statements(p):
@@ -76,7 +84,7 @@ def p_statements(p):
 
 def p_statement___assign(p):
     "statement : variable ASSIGN expression SEMI"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    p[0] = Element("=", p.lineno(1), name=p[1], expression=p[3])
 
 
 def p_variable(p):
@@ -86,6 +94,8 @@ def p_variable(p):
         p[0] = p[1] + "." + p[3]
     else:
         p[0] = p[1]
+    # a nonterminal's symbol has no line unless it's given one
+    p.set_lineno(0, p.lineno(1))
 
 
 def p_statement_if(p):
@@ -95,6 +105,7 @@ def p_statement_if(p):
     if len(p) == 8:
         p[0] = Element(
             InterpreterBase.IF_DEF,
+            p.lineno(1),
             condition=p[3],
             statements=p[6],
             else_statements=None,
@@ -102,6 +113,7 @@ def p_statement_if(p):
     else:
         p[0] = Element(
             InterpreterBase.IF_DEF,
+            p.lineno(1),
             condition=p[3],
             statements=p[6],
             else_statements=p[10],
@@ -110,7 +122,7 @@ def p_statement_if(p):
 
 def p_statement_while(p):
     "statement : WHILE LPAREN expression RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.WHILE_DEF, condition=p[3], statements=p[6])
+    p[0] = Element(InterpreterBase.WHILE_DEF, p.lineno(1), condition=p[3], statements=p[6])
 
 
 def p_statement_expr(p):
@@ -125,17 +137,17 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_DEF, expression=expr)
+    p[0] = Element(InterpreterBase.RETURN_DEF, p.lineno(1), expression=expr)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_DEF, op1=p[2])
+    p[0] = Element(InterpreterBase.NOT_DEF, p.lineno(1), op1=p[2])
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_DEF, op1=p[2])
+    p[0] = Element(InterpreterBase.NEG_DEF, p.lineno(1), op1=p[2])
 
 
 def p_arith_expression_binop(p):
@@ -149,7 +161,7 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = Element(p[2], p[1].line_num, op1=p[1], op2=p[3])
 
 
 def p_expression_group(p):
@@ -160,12 +172,12 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = Element(p[2], p[1].line_num, op1=p[1], op2=p[3])
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_DEF, val=p[1])
+    p[0] = Element(InterpreterBase.INT_DEF, p.lineno(1), val=p[1])
 
 
 def p_expression_lambda(p):
@@ -177,47 +189,49 @@ def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_DEF, val=bool_val)
+    p[0] = Element(InterpreterBase.BOOL_DEF, p.lineno(1), val=bool_val)
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_DEF)
+    p[0] = Element(InterpreterBase.NIL_DEF, p.lineno(1))
 
 
 def p_expression_obj(
     p,
 ):  # e.g. a = @;   ### creates a new dictionary/object and stores in a
     "expression : AT"
-    p[0] = Element(InterpreterBase.OBJ_DEF)
+    p[0] = Element(InterpreterBase.OBJ_DEF, p.lineno(1))
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_DEF, val=p[1])
+    p[0] = Element(InterpreterBase.STRING_DEF, p.lineno(1), val=p[1])
 
 
 def p_expression_variable(p):
     "expression : variable"
-    p[0] = Element(InterpreterBase.VAR_DEF, name=p[1])
+    p[0] = Element(InterpreterBase.VAR_DEF, p.lineno(1), name=p[1])
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_DEF, name=p[1], args=p[3])
+        p[0] = Element(InterpreterBase.FCALL_DEF, p.lineno(1), name=p[1], args=p[3])
     else:
-        p[0] = Element(InterpreterBase.FCALL_DEF, name=p[1], args=[])
+        p[0] = Element(InterpreterBase.FCALL_DEF, p.lineno(1), name=p[1], args=[])
 
 
 def p_method_call(p):
     """expression : NAME DOT NAME LPAREN args RPAREN
     | NAME DOT NAME LPAREN RPAREN"""
     if len(p) == 7:
-        p[0] = Element(InterpreterBase.MCALL_DEF, objref=p[1], name=p[3], args=p[5])
+        p[0] = Element(
+            InterpreterBase.MCALL_DEF, p.lineno(1), objref=p[1], name=p[3], args=p[5]
+        )
     else:
-        p[0] = Element(InterpreterBase.MCALL_DEF, objref=p[1], name=p[3], args=[])
+        p[0] = Element(InterpreterBase.MCALL_DEF, p.lineno(1), objref=p[1], name=p[3], args=[])
 
 
 def p_expression_args(p):
@@ -233,13 +247,204 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
+# The lexer and parser are built the first time a program is parsed rather than at import.
+# They're loaded read-only from the pregenerated brewlextab.py and parsetab.py, without
+# validating the grammar or writing parser.out; run this file to regenerate all three
+# after changing the grammar or the tokens. These two are templates holding the shared
+# tables: parsing goes through Parser objects, which keep their own state
+lexer = None
+parser = None
+build_lock = threading.Lock()
+
+
+def build_parser():
+    global lexer, parser
+    with build_lock:
+        if parser is None:
+            # imported here so programs whose AST is already cached never load PLY
+            from ply import yacc
+
+            lexer = brewlex.build_lexer()
+            parser = yacc.yacc(
+                module=sys.modules[__name__], debug=False, write_tables=False, optimize=True
+            )
+    return parser
+
+
+# A lexer and LR parser of its own (input position, line number, parse stacks) over the
+# shared tables. A Parser can parse any number of programs, one at a time; use one per
+# thread to parse concurrently
+class Parser:
+    def __init__(self):
+        import copy
+
+        build_parser()
+        self.lexer = lexer.clone()
+        self.lr_parser = copy.copy(parser)
+
+    def parse(self, program):
+        self.lexer.lineno = 1
+        ast = self.lr_parser.parse(program, lexer=self.lexer)
+        if ast is None:
+            raise SyntaxError("Syntax error")
+        return ast
+
+
+# each thread parses with its own Parser
+thread_parsers = threading.local()
+
+
+# What a rule function is handed by parse_with_tables, in place of PLY's YaccProduction: the
+# values of the production's symbols, [0] being its result, and their line numbers, which are
+# 0 for nonterminals not given one
+class Production:
+    __slots__ = ("values", "lines")
+
+    def __init__(self, values, lines):
+        self.values = values
+        self.lines = lines
+
+    def __getitem__(self, n):
+        return self.values[n]
+
+    def __setitem__(self, n, value):
+        self.values[n] = value
+
+    def __len__(self):
+        return len(self.values)
+
+    def lineno(self, n):
+        return self.lines[n]
+
+    def set_lineno(self, n, line):
+        self.lines[n] = line
+
+
+# parsetab.py's action and goto tables, and for each production the nonterminal it reduces
+# to, how many symbols it pops and its rule function
+lr_tables = None
+
+
+def load_lr_tables():
+    global lr_tables
+    with build_lock:
+        if lr_tables is None:
+            import parsetab
+
+            module = sys.modules[__name__]
+            productions = [
+                (name, length, rule and getattr(module, rule))
+                for _, name, length, rule, _, _ in parsetab._lr_productions
+            ]
+            lr_tables = (parsetab._lr_action, parsetab._lr_goto, productions)
+    return lr_tables
+
+
+# Parses program with the pregenerated tables and the rules here, as PLY's LR parser would,
+# but without loading PLY, which is most of what a first parse costs. Returns None for
+# anything that isn't a valid program; parse_with_ply then reports the error and recovers
+# from it as it always has
+def parse_with_tables(program):
+    tokens = brewlex.tokenize(program)
+    if tokens is None:
+        return None
+    types, values, lines = tokens
+    actions, gotos, productions = load_lr_tables()
+    states = [0]
+    symbol_values = [None]
+    symbol_lines = [0]
+    pos = 0
+    while True:
+        action = actions[states[-1]].get(types[pos])
+        if action is None:
+            return None
+        if action > 0:  # shift
+            states.append(action)
+            symbol_values.append(values[pos])
+            symbol_lines.append(lines[pos])
+            pos += 1
+        elif action < 0:  # reduce
+            name, length, rule = productions[-action]
+            start = len(states) - length
+            p = Production([None] + symbol_values[start:], [0] + symbol_lines[start:])
+            rule(p)
+            del states[start:], symbol_values[start:], symbol_lines[start:]
+            states.append(gotos[states[-1]][name])
+            symbol_values.append(p.values[0])
+            symbol_lines.append(p.lines[0])
+        else:  # accept
+            return symbol_values[-1]
+
+
+# which frontend parses programs: PLY's LALR parser, or the hand-written one in brewpratt.py.
+# They build the same trees; set BREWIN_PARSER or call set_frontend to pick one
+PLY_FRONTEND = "ply"
+PRATT_FRONTEND = "pratt"
+FRONTENDS = (PLY_FRONTEND, PRATT_FRONTEND)
+frontend = PLY_FRONTEND
+
+
+def set_frontend(name):
+    global frontend
+    if name not in FRONTENDS:
+        raise ValueError(f"Unknown parser frontend {name}")
+    frontend = name
+
+
+def parse_uncached(program):
+    if isinstance(program, str):
+        if frontend == PRATT_FRONTEND:
+            # imported here because brewpratt reads this module's precedence table
+            import brewpratt
+
+            ast = brewpratt.parse(program)
+        else:
+            ast = parse_with_tables(program)
+        if ast is not None:
+            return ast
+        # anything they don't parse cleanly goes through PLY, so errors are reported (and
+        # recovered from) exactly as before
+    return parse_with_ply(program)
+
+
+def parse_with_ply(program):
+    thread_parser = getattr(thread_parsers, "parser", None)
+    if thread_parser is None:
+        thread_parser = thread_parsers.parser = Parser()
+    return thread_parser.parse(program)
+
+
+set_frontend(os.environ.get("BREWIN_PARSER") or PLY_FRONTEND)
+
+
+# ASTs of the programs parsed so far; set BREWIN_PARSE_CACHE to a directory to keep them
+# across processes too
+parse_cache = ParseCache(directory=os.environ.get("BREWIN_PARSE_CACHE") or None)
+
+
 # exported function
 def parse_program(program):
-    ast = yacc.parse(program)
-    if ast is None:
-        raise SyntaxError("Syntax error")
-    return ast
+    if not isinstance(program, str):
+        return parse_uncached(program)
+    return parse_cache.get(program, parse_uncached)
+
+
+def parse_compact_uncached(program):
+    from compactast import CompactAST
+
+    return CompactAST.from_element(parse_uncached(program))
+
+
+# the program's AST as a CompactAST. The Element tree it's built from is dropped once it's
+# converted, and only the compact tree is cached
+def parse_compact(program):
+    return parse_cache.get(program, parse_compact_uncached, variant="compact")
+
 
+# regenerates the pregenerated tables (and parser.out) from the rules in brewlex.py and here
+if __name__ == "__main__":
+    from ply import yacc
 
-# generate our parser
-yacc.yacc()
+    here = os.path.dirname(os.path.abspath(__file__))
+    brewlex.build_lexer(optimize=False).writetab(brewlex.LEXTAB, here)
+    yacc.yacc(module=sys.modules[__name__], outputdir=here)
@@ -0,0 +1,298 @@
+# A hand-written frontend for brewin: recursive descent for functions and statements, and
+# precedence climbing (Pratt) for expressions. It builds exactly the Element trees the PLY
+# grammar in brewparse.py builds, from the same tokens: the tokenizer runs the master regex
+# PLY generated into brewlextab.py, and the operator precedence comes from brewparse.
+#
+# parse() only handles programs that lex and parse cleanly, and returns None for anything
+# else (illegal characters, syntax errors, nesting too deep to recurse through). brewparse
+# then hands those to PLY, so error messages and PLY's error recovery stay exactly as they
+# were.
+import re
+
+import brewlextab
+from brewlex import reserved_map
+from brewparse import precedence
+from element import Element
+from intbase import InterpreterBase
+
+master_re, rule_index = brewlextab._lexstatere["INITIAL"][0]
+# t_ignore is skipped before every token, as PLY does
+scanner = re.compile(r"[ \t]*(?:" + master_re + ")", brewlextab._lexreflags).match
+# token type for each group of the master regex; None for rules that produce no token.
+# t_NUMBER, t_NAME and t_STRING are brewlex's only rules that change their token, and
+# tokenize() does the same thing they do
+TOKEN_TYPES = [None] * len(rule_index)
+for group, rule in enumerate(rule_index):
+    if rule is not None and rule[1] not in ("newline", "comment"):
+        TOKEN_TYPES[group] = rule[1]
+
+END = "$end"
+
+# binary operator token -> precedence level; all of them are left associative. unary - and !
+# bind tighter than any of them
+BINARY_LEVELS = {}
+for level, entry in enumerate(precedence, 1):
+    for token_type in entry[1:]:
+        if token_type not in ("UMINUS", "NOT"):
+            BINARY_LEVELS[token_type] = level
+
+
+class ParseError(Exception):
+    pass
+
+
+# returns parallel lists of token types, values and line numbers, ending with END, or None
+# when the source has a character no rule matches
+def tokenize(source):
+    types = []
+    values = []
+    lines = []
+    line = 1
+    pos = 0
+    end = len(source)
+    while pos < end:
+        match = scanner(source, pos)
+        if match is None:
+            if source[pos:].strip(" \t"):
+                return None
+            break
+        pos = match.end()
+        group = match.lastindex
+        token_type = TOKEN_TYPES[group]
+        if token_type is None:
+            # newlines, and comments, which can span lines
+            line += match.group(group).count("\n")
+            continue
+        value = match.group(group)
+        if token_type == "NAME":
+            token_type = reserved_map.get(value, "NAME")
+        elif token_type == "NUMBER":
+            value = int(value)
+        elif token_type == "STRING":
+            value = value[1:-1]
+        types.append(token_type)
+        values.append(value)
+        lines.append(line)
+    types.append(END)
+    values.append(None)
+    lines.append(line)
+    return types, values, lines
+
+
+class PrattParser:
+    def __init__(self, types, values, lines):
+        self.types = types
+        self.values = values
+        self.lines = lines
+        self.pos = 0
+
+    def take(self, token_type):
+        if self.types[self.pos] != token_type:
+            raise ParseError(self.pos)
+        value = self.values[self.pos]
+        self.pos += 1
+        return value
+
+    def program(self):
+        functions = [self.func()]
+        while self.types[self.pos] != END:
+            functions.append(self.func())
+        return Element(InterpreterBase.PROGRAM_DEF, functions=functions)
+
+    def func(self):
+        line = self.lines[self.pos]
+        self.take("FUNC")
+        name = self.take("NAME")
+        args = self.formal_args()
+        statements = self.block()
+        return Element(
+            InterpreterBase.FUNC_DEF, line, name=name, args=args, statements=statements
+        )
+
+    def lambda_def(self):
+        line = self.lines[self.pos]
+        self.take("LAMBDA")
+        args = self.formal_args()
+        statements = self.block()
+        return Element(InterpreterBase.LAMBDA_DEF, line, args=args, statements=statements)
+
+    # ( ), or ( formal_arg, ... )
+    def formal_args(self):
+        self.take("LPAREN")
+        args = []
+        if self.types[self.pos] == "RPAREN":
+            self.pos += 1
+            return args
+        while True:
+            line = self.lines[self.pos]
+            if self.types[self.pos] == "REF":
+                self.pos += 1
+                args.append(Element(InterpreterBase.REFARG_DEF, line, name=self.take("NAME")))
+            else:
+                args.append(Element(InterpreterBase.ARG_DEF, line, name=self.take("NAME")))
+            if self.types[self.pos] != "COMMA":
+                break
+            self.pos += 1
+        self.take("RPAREN")
+        return args
+
+    # { statement ... }, with at least one statement
+    def block(self):
+        self.take("LBRACE")
+        statements = [self.statement()]
+        while self.types[self.pos] != "RBRACE":
+            statements.append(self.statement())
+        self.pos += 1
+        return statements
+
+    def statement(self):
+        types = self.types
+        token_type = types[self.pos]
+        line = self.lines[self.pos]
+        if token_type == "IF":
+            return self.if_statement()
+        if token_type == "WHILE":
+            self.pos += 1
+            self.take("LPAREN")
+            condition = self.expression()
+            self.take("RPAREN")
+            statements = self.block()
+            return Element(
+                InterpreterBase.WHILE_DEF, line, condition=condition, statements=statements
+            )
+        if token_type == "RETURN":
+            self.pos += 1
+            expression = None
+            if types[self.pos] != "SEMI":
+                expression = self.expression()
+            self.take("SEMI")
+            return Element(InterpreterBase.RETURN_DEF, line, expression=expression)
+        if token_type == "NAME":
+            # NAME = ... and NAME.NAME = ... are assignments, anything else is an expression
+            if types[self.pos + 1] == "ASSIGN":
+                return self.assignment(self.values[self.pos], 2)
+            if (
+                types[self.pos + 1] == "DOT"
+                and types[self.pos + 2] == "NAME"
+                and types[self.pos + 3] == "ASSIGN"
+            ):
+                name = self.values[self.pos] + "." + self.values[self.pos + 2]
+                return self.assignment(name, 4)
+        expression = self.expression()
+        self.take("SEMI")
+        return expression
+
+    def assignment(self, name, length):
+        line = self.lines[self.pos]
+        self.pos += length
+        expression = self.expression()
+        self.take("SEMI")
+        return Element("=", line, name=name, expression=expression)
+
+    def if_statement(self):
+        line = self.lines[self.pos]
+        self.pos += 1
+        self.take("LPAREN")
+        condition = self.expression()
+        self.take("RPAREN")
+        statements = self.block()
+        else_statements = None
+        if self.types[self.pos] == "ELSE":
+            self.pos += 1
+            else_statements = self.block()
+        return Element(
+            InterpreterBase.IF_DEF,
+            line,
+            condition=condition,
+            statements=statements,
+            else_statements=else_statements,
+        )
+
+    # parses operators binding tighter than min_level, folding equal levels to the left
+    def expression(self, min_level=0):
+        left = self.unary()
+        types = self.types
+        while True:
+            level = BINARY_LEVELS.get(types[self.pos])
+            if level is None or level <= min_level:
+                return left
+            operator = self.values[self.pos]
+            self.pos += 1
+            left = Element(operator, left.line_num, op1=left, op2=self.expression(level))
+
+    def unary(self):
+        token_type = self.types[self.pos]
+        line = self.lines[self.pos]
+        if token_type == "NOT":
+            self.pos += 1
+            return Element(InterpreterBase.NOT_DEF, line, op1=self.unary())
+        if token_type == "MINUS":
+            self.pos += 1
+            return Element(InterpreterBase.NEG_DEF, line, op1=self.unary())
+        return self.primary()
+
+    def primary(self):
+        token_type = self.types[self.pos]
+        value = self.values[self.pos]
+        line = self.lines[self.pos]
+        self.pos += 1
+        if token_type == "NAME":
+            return self.name_expression(value, line)
+        if token_type == "NUMBER":
+            return Element(InterpreterBase.INT_DEF, line, val=value)
+        if token_type == "STRING":
+            return Element(InterpreterBase.STRING_DEF, line, val=value)
+        if token_type == "LPAREN":
+            expression = self.expression()
+            self.take("RPAREN")
+            return expression
+        if token_type == "TRUE" or token_type == "FALSE":
+            return Element(InterpreterBase.BOOL_DEF, line, val=value == InterpreterBase.TRUE_DEF)
+        if token_type == "NIL":
+            return Element(InterpreterBase.NIL_DEF, line)
+        if token_type == "LAMBDA":
+            self.pos -= 1
+            return self.lambda_def()
+        if token_type == "AT":
+            return Element(InterpreterBase.OBJ_DEF, line)
+        raise ParseError(self.pos - 1)
+
+    # a variable, function call or method call starting with the NAME just taken
+    def name_expression(self, name, line):
+        types = self.types
+        if types[self.pos] == "LPAREN":
+            return Element(InterpreterBase.FCALL_DEF, line, name=name, args=self.args())
+        if types[self.pos] == "DOT":
+            self.pos += 1
+            member = self.take("NAME")
+            if types[self.pos] == "LPAREN":
+                return Element(
+                    InterpreterBase.MCALL_DEF, line, objref=name, name=member, args=self.args()
+                )
+            return Element(InterpreterBase.VAR_DEF, line, name=name + "." + member)
+        return Element(InterpreterBase.VAR_DEF, line, name=name)
+
+    # ( ), or ( expression, ... )
+    def args(self):
+        self.pos += 1
+        args = []
+        if self.types[self.pos] == "RPAREN":
+            self.pos += 1
+            return args
+        args.append(self.expression())
+        while self.types[self.pos] == "COMMA":
+            self.pos += 1
+            args.append(self.expression())
+        self.take("RPAREN")
+        return args
+
+
+# returns the program's AST, or None when it doesn't lex and parse cleanly
+def parse(program):
+    tokens = tokenize(program)
+    if tokens is None:
+        return None
+    try:
+        return PrattParser(*tokens).program()
+    except (ParseError, IndexError, RecursionError):
+        return None
@@ -0,0 +1,393 @@
+# An execution profiler for the interpreters, switched on by their trace_output flag: it
+# counts and times the nodes, functions, operators, copies and environment operations a run
+# executes (TABLES), with total_s counting recursion once and self_s leaving out nested
+# entries. The Sampler instead counts v3's call stacks every few ms, for flame graphs.
+#
+#   python brewprofile.py program.br [--interval MS] [--backend B] [--output FILE]
+#
+# runs a program under a Sampler and writes its collapsed stacks.
+import sys
+import threading
+import time
+from enum import Enum
+
+from intbase import InterpreterBase
+
+TABLES = ("nodes", "functions", "operators", "deepcopy", "env")
+
+# EnvironmentManager methods timed in the env table
+ENV_METHODS = ("get", "get_ref", "get_ref_var", "set", "set_ref", "create")
+
+# private method: AST node type it runs, or None when it's given the node
+NODE_METHODS = {
+    "_Interpreter__eval_expr": None,
+    "_Interpreter__assign": "=",
+    "_Interpreter__do_if": InterpreterBase.IF_DEF,
+    "_Interpreter__do_while": InterpreterBase.WHILE_DEF,
+    "_Interpreter__do_return": InterpreterBase.RETURN_DEF,
+    "_Interpreter__call_func": InterpreterBase.FCALL_DEF,
+    "_Interpreter__handle_lambdas": InterpreterBase.LAMBDA_DEF,
+}
+# node types timed by a method of their own above, not where they're evaluated
+OWN_METHOD_NODES = {InterpreterBase.FCALL_DEF, InterpreterBase.LAMBDA_DEF}
+
+
+def node_type(node):
+    # ref args are evaluated from the [Value, name] list they're stored as
+    if isinstance(node, list):
+        return InterpreterBase.REFARG_DEF
+    return node.elem_type
+
+
+def value_kind(value):
+    kind = getattr(value, "t", None)
+    if isinstance(kind, Enum):
+        return kind.name.lower()
+    return str(kind) if kind is not None else type(value).__name__
+
+
+class Stat:
+    __slots__ = ("count", "total_s", "self_s")
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.self_s = 0.0
+
+
+class Profiler:
+    def __init__(self):
+        self.tables = {table: {} for table in TABLES}
+        # per table, the open frames, each [key, start, time in nested frames]
+        self.stacks = {table: [] for table in TABLES}
+        # (table, key) -> how many frames of it are open, so recursion counts once in total_s
+        self.active = {}
+
+    def open(self, table, key):
+        frame = [key, time.perf_counter(), 0.0]
+        self.stacks[table].append(frame)
+        self.active[table, key] = self.active.get((table, key), 0) + 1
+        return frame
+
+    def close(self, table, frame):
+        elapsed = time.perf_counter() - frame[1]
+        stack = self.stacks[table]
+        # frames above this one were left open by an error unwinding past them
+        while stack and stack[-1] is not frame:
+            self.active[table, stack.pop()[0]] -= 1
+        if not stack:
+            return
+        stack.pop()
+        key = frame[0]
+        stat = self.tables[table].get(key)
+        if stat is None:
+            stat = self.tables[table][key] = Stat()
+        stat.count += 1
+        stat.self_s += elapsed - frame[2]
+        self.active[table, key] -= 1
+        if not self.active[table, key]:
+            stat.total_s += elapsed
+        if stack:
+            stack[-1][2] += elapsed
+
+    def timed(self, table, key_of, function):
+        """function, timed under key_of(its args) in table; key_of returning None skips it."""
+
+        def wrapper(*args, **kwargs):
+            key = key_of(*args)
+            if key is None:
+                return function(*args, **kwargs)
+            frame = self.open(table, key)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.close(table, frame)
+
+        return wrapper
+
+    def report(self):
+        """{table: {key: {"count", "total_s", "self_s"}}}, each table by total_s, largest first."""
+        return {
+            table: {
+                key: {"count": stat.count, "total_s": stat.total_s, "self_s": stat.self_s}
+                for key, stat in sorted(
+                    entries.items(), key=lambda item: item[1].total_s, reverse=True
+                )
+            }
+            for table, entries in self.tables.items()
+        }
+
+    def format_report(self, limit=10):
+        """The report as text, the first limit entries of each table."""
+        lines = []
+        for table, entries in self.report().items():
+            if not entries:
+                continue
+            lines.append(f"{table:<24}{'count':>10}{'total ms':>12}{'self ms':>12}")
+            for key, stat in list(entries.items())[:limit]:
+                lines.append(
+                    f"  {str(key):<22}{stat['count']:>10}"
+                    f"{stat['total_s'] * 1000:>12.3f}{stat['self_s'] * 1000:>12.3f}"
+                )
+        return "\n".join(lines)
+
+    def attach(self, interpreter):
+        """
+        Profile everything interpreter runs from now on, by setting timing wrappers of its
+        private methods on the instance. Call it after op_to_lambda is built and before
+        anything binds those methods (v3's backend selection).
+        """
+        for name, kind in NODE_METHODS.items():
+            self.__wrap(interpreter, name, "nodes", self.__node_key(kind))
+        for name in ("_Interpreter__compile_expr", "_Interpreter__compile_statement"):
+            if hasattr(interpreter, name):
+                setattr(interpreter, name, self.__compiling(getattr(interpreter, name)))
+        self.__attach_functions(interpreter)
+        for op_type, ops in interpreter.op_to_lambda.items():
+            for oper, function in ops.items():
+                key = f"{op_type.name.lower()} {oper}"
+                ops[oper] = self.timed("operators", lambda *_, key=key: key, function)
+        # unary operators: v3 applies them in one place for every backend
+        if hasattr(interpreter, "_Interpreter__apply_unary"):
+            self.__wrap(
+                interpreter, "_Interpreter__apply_unary", "operators", lambda oper, *_: oper
+            )
+        else:
+            self.__wrap(
+                interpreter,
+                "_Interpreter__eval_unary",
+                "operators",
+                lambda node, *_: node.elem_type,
+            )
+        self.__wrap(interpreter, "_Interpreter__copy_value", "deepcopy", value_kind)
+        new_environment = getattr(interpreter, "_Interpreter__new_environment")
+        environment_class = self.__environment_class(type(new_environment()))
+        setattr(interpreter, "_Interpreter__new_environment", environment_class)
+        for name in ("run", "run_compiled"):
+            if hasattr(interpreter, name):
+                setattr(interpreter, name, self.__run(getattr(interpreter, name)))
+
+    def __wrap(self, interpreter, name, table, key_of):
+        if hasattr(interpreter, name):
+            setattr(interpreter, name, self.timed(table, key_of, getattr(interpreter, name)))
+
+    def __node_key(self, kind):
+        if kind is not None:
+            return lambda *_: kind
+
+        def key_of(node, *_):
+            kind = node_type(node)
+            return None if kind in OWN_METHOD_NODES else kind
+
+        return key_of
+
+    def __compiling(self, compile_node):
+        # wraps what the closure backend compiles a node to, rather than the compiling
+        def wrapper(node):
+            code = compile_node(node)
+            if code is None or node.elem_type in OWN_METHOD_NODES:
+                return code
+            kind = node.elem_type
+            return self.timed("nodes", lambda: kind, code)
+
+        return wrapper
+
+    def __attach_functions(self, interpreter):
+        if not hasattr(interpreter, "_Interpreter__enter_func"):
+            # v1 and v2 run each call inside __call_func
+            self.__wrap(
+                interpreter,
+                "_Interpreter__call_func",
+                "functions",
+                lambda node: f"{node.get('name')}/{len(node.get('args'))}",
+            )
+            return
+        # v3 sets a call up in __enter_func and tears it down in __exit_func; the bytecode
+        # backend runs the body in between without a python call of its own. Every frame
+        # opened between the two is closed again by then, so the function's is on top
+        enter_func = getattr(interpreter, "_Interpreter__enter_func")
+        exit_func = getattr(interpreter, "_Interpreter__exit_func")
+
+        def timed_enter(call_node):
+            setup = enter_func(call_node)
+            lambda_ast, func_ast, formal_args, _ = setup
+            if func_ast is lambda_ast:
+                key = f"{func_ast.get('name')}/{len(formal_args)}"
+            else:
+                key = f"lambda {call_node.get('name')}/{len(formal_args)}"
+            self.open("functions", key)
+            return setup
+
+        def timed_exit(lambda_ast):
+            exit_func(lambda_ast)
+            stack = self.stacks["functions"]
+            if stack:
+                self.close("functions", stack[-1])
+
+        setattr(interpreter, "_Interpreter__enter_func", timed_enter)
+        setattr(interpreter, "_Interpreter__exit_func", timed_exit)
+
+    def __environment_class(self, base):
+        timed = self.timed
+
+        class ProfiledEnvironment(base):
+            pass
+
+        for name in ENV_METHODS:
+            if hasattr(base, name):
+                method = timed("env", lambda *_, name=name: name, getattr(base, name))
+                setattr(ProfiledEnvironment, name, method)
+        if hasattr(base, "deepcopy"):
+            copy = timed("deepcopy", lambda *_: "environment", base.deepcopy)
+            setattr(ProfiledEnvironment, "deepcopy", copy)
+        return ProfiledEnvironment
+
+    def __run(self, run):
+        # a run that ended in an error leaves the frames it had open; drop them
+        def wrapper(*args, **kwargs):
+            for stack in self.stacks.values():
+                stack.clear()
+            self.active.clear()
+            return run(*args, **kwargs)
+
+        return wrapper
+
+
+def frame_label(frame):
+    """name:line of a call_stack frame; lambdas are named after what they were called as."""
+    func_ast, call_node, line = frame
+    name = func_ast.get("name")
+    if name is None:
+        name = f"lambda {call_node.get('name')}"
+    return name if line is None else f"{name}:{line}"
+
+
+class Sampler:
+    """Counts the call stacks a v3 interpreter is seen running, every interval seconds."""
+
+    def __init__(self, interpreter, interval=0.005):
+        if not hasattr(interpreter, "call_stack"):
+            raise ValueError("Only interpreters that keep a call stack (v3) can be sampled")
+        self.interpreter = interpreter
+        self.interval = interval
+        # collapsed stack -> samples of it
+        self.stacks = {}
+        self.__stopping = threading.Event()
+        self.__thread = None
+        # the thread start() is called on, which is taken to be the one running the program
+        self.__running_thread = None
+        self.__vm_code = None
+        if interpreter.backend == type(interpreter).BYTECODE_BACKEND:
+            self.__vm_code = type(interpreter)._Interpreter__run_vm.__code__
+        # before the program runs: the closure backend decides when compiling
+        interpreter.track_lines = True
+
+    def start(self):
+        self.__running_thread = threading.get_ident()
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target=self.__run, name="brewin-sampler", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopping.set()
+        self.__thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __run(self):
+        while not self.__stopping.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        # copies: the interpreter goes on changing them
+        frames = [list(frame) for frame in self.interpreter.call_stack]
+        if not frames:
+            return
+        if self.__vm_code is not None:
+            self.__vm_lines(frames)
+        stack = ";".join(frame_label(frame) for frame in frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def __vm_lines(self, frames):
+        # the innermost __run_vm frame with a line is running a function body (the others
+        # evaluate print and inputi args); brewin calls whose args are still being evaluated
+        # have frames of their own, but haven't started running
+        python_frame = sys._current_frames().get(self.__running_thread)
+        pending = 0
+        line = None
+        while python_frame is not None and line is None:
+            if python_frame.f_code is self.__vm_code:
+                vm_locals = python_frame.f_locals
+                pending += len(vm_locals["calls"])
+                line = vm_locals["code"].lines[vm_locals["pc"] - 1]
+            python_frame = python_frame.f_back
+        running = len(frames) - 1 - pending
+        if line is None or running < 0:
+            return
+        for caller, callee in zip(frames[:running], frames[1 : running + 1]):
+            caller[2] = callee[1].line_num
+        frames[running][2] = line
+
+    def collapsed(self):
+        """The samples as folded stacks, one "frame;frame;... count" line each."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+def main():
+    # imported here: interpreters import this module when profiling, and shouldn't load
+    # argparse
+    import argparse
+
+    import interpreterv3
+
+    arg_parser = argparse.ArgumentParser(
+        description="Samples a brewin program's call stacks and writes them collapsed"
+    )
+    arg_parser.add_argument("program")
+    arg_parser.add_argument(
+        "--interval", type=float, default=5.0, help="milliseconds between samples"
+    )
+    arg_parser.add_argument(
+        "--backend",
+        default=interpreterv3.Interpreter.TREE_BACKEND,
+        choices=(
+            interpreterv3.Interpreter.TREE_BACKEND,
+            interpreterv3.Interpreter.CLOSURE_BACKEND,
+            interpreterv3.Interpreter.BYTECODE_BACKEND,
+        ),
+    )
+    arg_parser.add_argument(
+        "--input", action="append", default=[], help="a line of the program's input"
+    )
+    arg_parser.add_argument("--output", help="write the stacks here instead of stdout")
+    args = arg_parser.parse_args()
+    with open(args.program, encoding="utf-8") as handle:
+        source = handle.read()
+
+    interpreter = interpreterv3.Interpreter(False, args.input, backend=args.backend)
+    sampler = Sampler(interpreter, args.interval / 1000)
+    error = None
+    with sampler:
+        try:
+            interpreter.run(source)
+        except Exception as exception:  # pylint: disable=broad-except
+            error = exception
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(sampler.collapsed())
+    else:
+        sys.stdout.write(sampler.collapsed())
+    samples = sum(sampler.stacks.values())
+    print(f"{samples} samples of {len(sampler.stacks)} stacks", file=sys.stderr)
+    if error is not None:
+        print(f"the program stopped with an error: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Structured debug tracing for the interpreters: events in the CATEGORIES asked for
+# (statements run, calls entered and left, ref args, lambda environments), handed to a sink.
+# Interpreters check a Tracer's per-category flag first, so with tracing OFF an event costs
+# a branch.
+#
+#   python brewtrace.py program.br [--categories a,b|all] [--level L] [--version N]
+#                                  [--input LINE ...] [--output FILE]
+#
+# runs a program with tracing on, writing the events to stderr or FILE.
+import sys
+
+from element import Element
+
+CATEGORIES = ("statements", "calls", "refs", "env")
+
+# how much of each node an event shows (its type, name and line, or the whole subtree); the
+# values are logging's
+INFO = 20
+DEBUG = 10
+LEVELS = {"info": INFO, "debug": DEBUG}
+
+
+def describe(value, level):
+    if not isinstance(value, Element) or level <= DEBUG:
+        return str(value)
+    name = value.get("name")
+    summary = value.elem_type if name is None else f"{value.elem_type} {name}"
+    return summary if value.line_num is None else f"{summary} line {value.line_num}"
+
+
+class Event:
+    """
+    One thing an interpreter did, in a category, with the nodes and values involved,
+    rendered only when written; the environments it holds go on changing, so a sink keeping
+    events should keep event.render().
+    """
+
+    __slots__ = ("category", "message", "subjects", "level")
+
+    def __init__(self, category, message, subjects, level):
+        self.category = category
+        self.message = message
+        self.subjects = subjects
+        self.level = level
+
+    def render(self):
+        line = f"{self.category}: {self.message}"
+        if self.subjects:
+            line += " " + ", ".join(describe(subject, self.level) for subject in self.subjects)
+        return line
+
+
+# a sink writing each event on a line of stream; sys.stderr (as it is at the time) if None
+def stream_sink(stream=None):
+    def write(event):
+        print(event.render(), file=sys.stderr if stream is None else stream)
+
+    return write
+
+
+class Tracer:
+    """Hands the events of the categories it was made with to sink, rendered at level."""
+
+    def __init__(self, categories=(), level=INFO, sink=None):
+        unknown = set(categories) - set(CATEGORIES)
+        if unknown:
+            raise ValueError(
+                f"Unknown trace categories {', '.join(sorted(unknown))}; "
+                f"expected some of {', '.join(CATEGORIES)}"
+            )
+        if level not in LEVELS.values():
+            raise ValueError(f"Unknown trace level {level}")
+        self.level = level
+        self.sink = stream_sink() if sink is None else sink
+        self.statements = "statements" in categories
+        self.calls = "calls" in categories
+        self.refs = "refs" in categories
+        self.env = "env" in categories
+
+    # callers check the category's flag first
+    def emit(self, category, message, *subjects):
+        self.sink(Event(category, message, subjects, self.level))
+
+
+# tracing nothing: what interpreters are made with unless they're given a Tracer
+OFF = Tracer()
+
+
+def parse_categories(spec):
+    """The categories in a comma-separated list of them, or all of them for "all"."""
+    if spec == "all":
+        return CATEGORIES
+    return tuple(category for category in spec.split(",") if category)
+
+
+def main():
+    # imported here: the interpreters import this module, and shouldn't load argparse
+    import argparse
+
+    import interpreterv1
+    import interpreterv2
+    import interpreterv3
+
+    versions = {"1": interpreterv1, "2": interpreterv2, "3": interpreterv3}
+    arg_parser = argparse.ArgumentParser(description="Runs a brewin program with tracing on")
+    arg_parser.add_argument("program")
+    arg_parser.add_argument("--categories", default="all", help="comma-separated, or all")
+    arg_parser.add_argument("--level", default="info", choices=tuple(LEVELS))
+    arg_parser.add_argument("--version", default="3", choices=tuple(versions))
+    arg_parser.add_argument(
+        "--input", action="append", default=[], help="a line of the program's input"
+    )
+    arg_parser.add_argument("--output", help="write the events here instead of stderr")
+    args = arg_parser.parse_args()
+    with open(args.program, encoding="utf-8") as handle:
+        source = handle.read()
+
+    try:
+        tracer = Tracer(parse_categories(args.categories), LEVELS[args.level])
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+    output = None if args.output is None else open(args.output, "w", encoding="utf-8")
+    try:
+        tracer.sink = stream_sink(output)
+        interpreter = versions[args.version].Interpreter(True, args.input, tracer=tracer)
+        try:
+            interpreter.run(source)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"the program stopped with an error: {error}", file=sys.stderr)
+            sys.exit(1)
+    finally:
+        if output is not None:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# Lowers the AST produced by brewparse into flat bytecode for the v3 interpreter's bytecode
+# backend. Every instruction is an (opcode, arg) tuple; jumps hold absolute instruction indexes.
+from intbase import InterpreterBase
+from type_valuev2 import NIL_VALUE, Value, bool_value, int_value, string_literal
+
+# opcodes, roughly ordered by how often they run
+LOAD_VAR = 0  # arg: name
+LOAD_CONST = 1  # arg: Value
+BINARY_OP = 2  # arg: operator, e.g. "+"
+STORE_PREPARE = 3  # arg: name; pushes what name held before the assignment runs
+STORE = 4  # arg: name; pops the new value and what STORE_PREPARE pushed
+POP_JUMP_IF_FALSE = 5  # arg: (target, "if" or "while")
+JUMP = 6  # arg: target
+PUSH_SCOPE = 7  # arg: None
+CALL_BEGIN = 8  # arg: fcall node; sets up the callee's environment
+ARG_FROM_REF = 9  # arg: (target, index, actual arg node); binds arg index from ref vars and jumps
+BIND_ARG = 10  # arg: (index, actual arg node); pops the value for arg index
+CALL = 11  # arg: fcall node; runs the body of the callee set up by CALL_BEGIN
+RETURN_VALUE = 12  # arg: None; returns a copy of the top of the stack
+RETURN_NIL = 13  # arg: None
+POP_TOP = 14  # arg: None
+UNARY_OP = 15  # arg: operator, i.e. "neg" or "!"
+CONCAT_PRINTABLE = 16  # arg: None; pops a value and appends its printable form to the string below
+CALL_PRINT = 17  # arg: None; pops the string built by CONCAT_PRINTABLE and outputs it
+CALL_INPUT = 18  # arg: (fcall node, number of args)
+MAKE_LAMBDA = 19  # arg: (lambda node, name it's assigned to or None)
+END = 20  # arg: None; ends an expression evaluated on its own, leaving its value
+
+OPCODE_NAMES = {
+    value: name
+    for name, value in globals().items()
+    if name.isupper() and isinstance(value, int)
+}
+
+BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+
+def describe(arg):
+    if hasattr(arg, "elem_type"):
+        if arg.get("name") is not None:
+            return f"{arg.elem_type} {arg.get('name')}"
+        return arg.elem_type
+    return str(arg)
+
+
+class Code:
+    def __init__(self, instructions, lines):
+        self.instructions = instructions
+        # the source line of each instruction's statement, None outside any statement
+        self.lines = lines
+
+    def __str__(self):
+        lines = []
+        for index, (opcode, arg) in enumerate(self.instructions):
+            if isinstance(arg, Value):
+                arg = f"{arg.type()} {arg.value()!r}"
+            elif isinstance(arg, str):
+                arg = repr(arg)
+            elif isinstance(arg, tuple):
+                arg = ", ".join(describe(a) for a in arg)
+            elif arg is not None:
+                arg = describe(arg)
+            lines.append(f"{index:4} {OPCODE_NAMES[opcode]:<18} {'' if arg is None else arg}")
+        return "\n".join(lines)
+
+
+class Compiler:
+    def __init__(self):
+        self.instructions = []
+        # source line of the statement each instruction was compiled from
+        self.lines = []
+        self.line = None
+
+    def emit(self, opcode, arg=None):
+        self.instructions.append((opcode, arg))
+        self.lines.append(self.line)
+        return len(self.instructions) - 1
+
+    # fills in the target of a jump that was emitted before its target was known
+    def patch(self, index, target):
+        opcode, arg = self.instructions[index]
+        if isinstance(arg, tuple):
+            arg = (target,) + arg[1:]
+        else:
+            arg = target
+        self.instructions[index] = (opcode, arg)
+
+    def here(self):
+        return len(self.instructions)
+
+    def block(self, statements):
+        self.emit(PUSH_SCOPE)
+        for statement in statements:
+            self.statement(statement)
+
+    def statement(self, statement):
+        kind = statement.elem_type
+        self.line = statement.line_num
+        if kind == InterpreterBase.FCALL_DEF:
+            self.call(statement)
+            self.emit(POP_TOP)
+        elif kind == "=":
+            self.assign(statement)
+        elif kind == InterpreterBase.RETURN_DEF:
+            expr_ast = statement.get("expression")
+            if expr_ast is None:
+                self.emit(RETURN_NIL)
+            else:
+                self.expression(expr_ast)
+                self.emit(RETURN_VALUE)
+        elif kind == InterpreterBase.IF_DEF:
+            self.if_statement(statement)
+        elif kind == InterpreterBase.WHILE_DEF:
+            self.while_statement(statement)
+        # bare expression statements other than calls are never evaluated
+
+    def assign(self, assign_ast):
+        var_name = assign_ast.get("name")
+        expr_ast = assign_ast.get("expression")
+        self.emit(STORE_PREPARE, var_name)
+        if expr_ast.elem_type == InterpreterBase.LAMBDA_DEF:
+            # only a lambda assigned directly gets to see the name it's assigned to
+            self.emit(MAKE_LAMBDA, (expr_ast, var_name))
+        else:
+            self.expression(expr_ast)
+        self.emit(STORE, var_name)
+
+    def if_statement(self, if_ast):
+        self.expression(if_ast.get("condition"))
+        to_else = self.emit(POP_JUMP_IF_FALSE, (None, InterpreterBase.IF_DEF))
+        self.block(if_ast.get("statements"))
+        else_statements = if_ast.get("else_statements")
+        if else_statements is None:
+            self.patch(to_else, self.here())
+            return
+        to_end = self.emit(JUMP)
+        self.patch(to_else, self.here())
+        self.block(else_statements)
+        self.patch(to_end, self.here())
+
+    def while_statement(self, while_ast):
+        top = self.here()
+        self.expression(while_ast.get("condition"))
+        to_end = self.emit(POP_JUMP_IF_FALSE, (None, InterpreterBase.WHILE_DEF))
+        self.block(while_ast.get("statements"))
+        # the jump back goes to the condition, on the loop's line
+        self.line = while_ast.line_num
+        self.emit(JUMP, top)
+        self.patch(to_end, self.here())
+
+    def call(self, call_ast):
+        func_name = call_ast.get("name")
+        args = call_ast.get("args")
+        if func_name == "print":
+            self.emit(LOAD_CONST, "")
+            for arg in args:
+                self.expression(arg)
+                self.emit(CONCAT_PRINTABLE)
+            self.emit(CALL_PRINT)
+            return
+        if func_name in ("inputi", "inputs"):
+            # the prompt is only evaluated when there's exactly one
+            if len(args) == 1:
+                self.expression(args[0])
+            self.emit(CALL_INPUT, (call_ast, len(args)))
+            return
+        # args are evaluated one at a time inside the callee's environment, after the
+        # args before them have been bound
+        self.emit(CALL_BEGIN, call_ast)
+        for index, actual_ast in enumerate(args):
+            skip = self.emit(ARG_FROM_REF, (None, index, actual_ast))
+            self.expression(actual_ast)
+            self.emit(BIND_ARG, (index, actual_ast))
+            self.patch(skip, self.here())
+        self.emit(CALL, call_ast)
+
+    def expression(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_DEF:
+            self.emit(LOAD_VAR, expr_ast.get("name"))
+        elif kind in BIN_OPS:
+            self.expression(expr_ast.get("op1"))
+            self.expression(expr_ast.get("op2"))
+            self.emit(BINARY_OP, kind)
+        elif kind == InterpreterBase.NIL_DEF:
+            self.emit(LOAD_CONST, NIL_VALUE)
+        elif kind == InterpreterBase.INT_DEF:
+            self.emit(LOAD_CONST, int_value(expr_ast.get("val")))
+        elif kind == InterpreterBase.STRING_DEF:
+            self.emit(LOAD_CONST, string_literal(expr_ast.get("val")))
+        elif kind == InterpreterBase.BOOL_DEF:
+            self.emit(LOAD_CONST, bool_value(expr_ast.get("val")))
+        elif kind == InterpreterBase.FCALL_DEF:
+            self.call(expr_ast)
+        elif kind in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            self.expression(expr_ast.get("op1"))
+            self.emit(UNARY_OP, kind)
+        elif kind == InterpreterBase.LAMBDA_DEF:
+            self.emit(MAKE_LAMBDA, (expr_ast, None))
+        else:
+            # method calls and objects don't evaluate to anything in v3
+            self.emit(LOAD_CONST, None)
+
+
+# compiles the statements of a function or lambda body; falling off the end returns nil
+def compile_body(statements):
+    compiler = Compiler()
+    compiler.block(statements)
+    compiler.emit(RETURN_NIL)
+    return Code(compiler.instructions, compiler.lines)
+
+
+# compiles an expression to be evaluated outside of any function body
+def compile_expression(expr_ast):
+    compiler = Compiler()
+    compiler.expression(expr_ast)
+    compiler.emit(END)
+    return Code(compiler.instructions, compiler.lines)
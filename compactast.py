@@ -0,0 +1,219 @@
+# A compact form of the ASTs brewparse builds. Instead of an Element object and a dict per
+# node, the whole tree lives in a handful of typed arrays (struct of arrays):
+#
+#   kinds[n]            index of node n's elem_type in kind_names
+#   lines[n]            node n's line_num, or 0 if it has none
+#   field_start[n]      where node n's fields start in the field table
+#   field_count[n]      how many fields node n has
+#   field_keys[f]       index of field f's name in field_names
+#   field_values[f]     field f's value, tagged: a node index, a constants index, a list
+#                       index or None
+#   list_start[l]       where list l's items start in list_items
+#   list_length[l]      how many items list l has
+#   list_items[i]       node index of each list item
+#
+# Names, numbers and strings go in a shared constant pool, stored once each. Nodes are
+# numbered in preorder, so node 0 is the program and a walk over the arrays in order visits
+# the tree depth first.
+#
+# The interpreters don't read the arrays themselves: root() hands out Node views that
+# behave like Elements (elem_type, get(), str()). Views and child lists are made on first
+# use and then reused, so a node is always the same object, as the interpreters' code caches
+# (keyed by id()) and function equality expect.
+import sys
+from array import array
+
+from element import Element
+
+# tags in the low two bits of field_values
+NODE_TAG = 0
+CONSTANT_TAG = 1
+LIST_TAG = 2
+NONE_TAG = 3
+TAG_BITS = 2
+
+# the arrays making up a tree, and their typecodes
+ARRAYS = (
+    ("kinds", "B"),
+    ("lines", "I"),
+    ("field_start", "I"),
+    ("field_count", "B"),
+    ("field_keys", "B"),
+    ("field_values", "i"),
+    ("list_start", "I"),
+    ("list_length", "I"),
+    ("list_items", "I"),
+)
+
+
+class CompactAST:
+    def __init__(self):
+        for name, typecode in ARRAYS:
+            setattr(self, name, array(typecode))
+        self.constants = []
+        self.kind_names = []
+        self.field_names = []
+        self.__kind_ids = {}
+        self.__field_ids = {}
+        # keyed by (type, value) so True and 1 stay different constants
+        self.__constant_ids = {}
+        self.__views = []
+        self.__lists = []
+
+    @staticmethod
+    def from_element(root):
+        tree = CompactAST()
+        tree.__add_node(root)
+        tree.__index()
+        return tree
+
+    # a tree over arrays built elsewhere, e.g. memoryviews into a mapped .brc file. arrays
+    # maps each name in ARRAYS to something indexable holding its items
+    @staticmethod
+    def from_arrays(arrays, constants, kind_names, field_names):
+        tree = CompactAST()
+        for name, _ in ARRAYS:
+            setattr(tree, name, arrays[name])
+        tree.constants = constants
+        tree.kind_names = kind_names
+        tree.field_names = field_names
+        tree.__index()
+        return tree
+
+    # pickled (e.g. by the parse cache's on-disk tier) without the views, which are made
+    # again as they're used
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_CompactAST__views"] = state["_CompactAST__lists"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__index()
+
+    def __index(self):
+        self.__field_ids = {name: i for i, name in enumerate(self.field_names)}
+        self.__views = [None] * len(self.kinds)
+        self.__lists = [None] * len(self.list_start)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # the program node, as a view the interpreters can run
+    def root(self):
+        return self.node(0)
+
+    def node(self, index):
+        view = self.__views[index]
+        if view is None:
+            view = self.__views[index] = Node(self, index)
+        return view
+
+    def kind(self, index):
+        return self.kind_names[self.kinds[index]]
+
+    def line(self, index):
+        return self.lines[index] or None
+
+    def get(self, index, key):
+        key_id = self.__field_ids.get(key)
+        if key_id is None:
+            return None
+        start = self.field_start[index]
+        for slot in range(start, start + self.field_count[index]):
+            if self.field_keys[slot] == key_id:
+                return self.__decode(self.field_values[slot])
+        return None
+
+    def fields(self, index):
+        start = self.field_start[index]
+        return {
+            self.field_names[self.field_keys[slot]]: self.__decode(self.field_values[slot])
+            for slot in range(start, start + self.field_count[index])
+        }
+
+    # bytes held by the arrays and the constant pool's list, not counting the constants
+    def nbytes(self):
+        arrays = (getattr(self, name) for name, _ in ARRAYS)
+        return sum(sys.getsizeof(a) for a in arrays) + sys.getsizeof(self.constants)
+
+    def __decode(self, tagged):
+        tag = tagged & 3
+        payload = tagged >> TAG_BITS
+        if tag == NODE_TAG:
+            return self.node(payload)
+        if tag == CONSTANT_TAG:
+            return self.constants[payload]
+        if tag == LIST_TAG:
+            items = self.__lists[payload]
+            if items is None:
+                start = self.list_start[payload]
+                items = self.__lists[payload] = [
+                    self.node(self.list_items[i])
+                    for i in range(start, start + self.list_length[payload])
+                ]
+            return items
+        return None
+
+    # the node's fields are reserved before its children are added, so each node's fields
+    # (and each list's items) stay contiguous
+    def __add_node(self, element):
+        index = len(self.kinds)
+        self.kinds.append(self.__intern(self.__kind_ids, self.kind_names, element.elem_type))
+        self.lines.append(element.line_num or 0)
+        start = len(self.field_keys)
+        self.field_start.append(start)
+        self.field_count.append(len(element.dict))
+        for key in element.dict:
+            self.field_keys.append(self.__intern(self.__field_ids, self.field_names, key))
+            self.field_values.append(0)
+        for slot, value in enumerate(element.dict.values(), start):
+            self.field_values[slot] = self.__encode(value)
+        return index
+
+    def __encode(self, value):
+        if value is None:
+            return NONE_TAG
+        if isinstance(value, Element):
+            return self.__add_node(value) << TAG_BITS | NODE_TAG
+        if isinstance(value, list):
+            list_index = len(self.list_start)
+            start = len(self.list_items)
+            self.list_start.append(start)
+            self.list_length.append(len(value))
+            self.list_items.extend([0] * len(value))
+            for i, item in enumerate(value, start):
+                self.list_items[i] = self.__add_node(item)
+            return list_index << TAG_BITS | LIST_TAG
+        key = (type(value), value)
+        constant_id = self.__constant_ids.get(key)
+        if constant_id is None:
+            constant_id = self.__constant_ids[key] = len(self.constants)
+            self.constants.append(value)
+        return constant_id << TAG_BITS | CONSTANT_TAG
+
+    def __intern(self, ids, names, name):
+        name_id = ids.get(name)
+        if name_id is None:
+            name_id = ids[name] = len(names)
+            names.append(name)
+        return name_id
+
+
+# an Element-shaped view of one node of a CompactAST
+class Node(Element):
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+        self.elem_type = tree.kind(index)
+
+    def get(self, key):
+        return self.tree.get(self.index, key)
+
+    @property
+    def line_num(self):
+        return self.tree.line(self.index)
+
+    @property
+    def dict(self):
+        return self.tree.fields(self.index)
@@ -0,0 +1,140 @@
+# Checks the hand-written frontend (brewpratt.py) against the PLY parser on mutated
+# programs, then compares how fast they parse.
+#
+#   python compare_parsers.py [--mutants N] [--reps N] [--seed N]
+#
+# test_brewpratt.py compares the two on every .br file under v1, v2, v3 and v3original; this
+# sweeps N mutants of each (a token dropped, duplicated or swapped) so programs both
+# frontends reject, and programs only one of them might accept, get compared too. For each
+# mutant the Pratt parser either builds exactly PLY's tree or declines it (brewparse then
+# falls back to PLY); it must never accept something PLY rejects or build a different tree.
+import argparse
+import glob
+import io
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+
+import brewparse
+import brewpratt
+from element import tree_shape
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPORA = ("v1", "v2", "v3", "v3original")
+
+
+def ply_shape(source):
+    with redirect_stdout(io.StringIO()):
+        try:
+            return tree_shape(brewparse.parse_with_ply(source))
+        except SyntaxError:
+            return None
+
+
+def pratt_shape(source):
+    ast = brewpratt.parse(source)
+    return None if ast is None else tree_shape(ast)
+
+
+# programs that differ from source by one token, in the token's own spelling
+def mutants(source, count, rng):
+    pieces = [
+        match.group(match.lastindex)
+        for match in iter_tokens(source)
+        if brewpratt.TOKEN_TYPES[match.lastindex] is not None
+    ]
+    for _ in range(count):
+        tokens = list(pieces)
+        i = rng.randrange(len(tokens))
+        kind = rng.randrange(3)
+        if kind == 0:
+            del tokens[i]
+        elif kind == 1:
+            tokens.insert(i, tokens[i])
+        else:
+            j = rng.randrange(len(tokens))
+            tokens[i], tokens[j] = tokens[j], tokens[i]
+        yield " ".join(tokens)
+
+
+def iter_tokens(source):
+    pos = 0
+    while True:
+        match = brewpratt.scanner(source, pos)
+        if match is None:
+            return
+        yield match
+        pos = match.end()
+
+
+def check(name, source, failures):
+    expected = ply_shape(source)
+    got = pratt_shape(source)
+    if got is not None and got != expected:
+        failures.append(name)
+    return got is not None
+
+
+def throughput(sources, reps):
+    token_count = sum(len(brewpratt.tokenize(s)[0]) - 1 for s in sources)
+    results = {}
+    for name, parse in (
+        ("ply", brewparse.parse_with_ply),
+        ("pratt", brewpratt.parse),
+    ):
+        parse(sources[0])  # builds PLY's tables / warms up
+        start = time.perf_counter()
+        for _ in range(reps):
+            for source in sources:
+                parse(source)
+        elapsed = time.perf_counter() - start
+        results[name] = (
+            len(sources) * reps / elapsed,
+            token_count * reps / elapsed,
+            elapsed / (len(sources) * reps) * 1e6,
+        )
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--mutants", type=int, default=20, help="mutants per program")
+    arg_parser.add_argument("--reps", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    sources = {}
+    for corpus in CORPORA:
+        for path in sorted(glob.glob(os.path.join(HERE, corpus, "*", "*.br"))):
+            with open(path) as f:
+                sources[os.path.relpath(path, HERE)] = f.read()
+
+    failures = []
+    rng = random.Random(args.seed)
+    mutant_count = 0
+    mutant_accepted = 0
+    for path, source in sources.items():
+        for i, mutant in enumerate(mutants(source, args.mutants, rng)):
+            mutant_count += 1
+            mutant_accepted += check(f"{path} mutant {i}", mutant, failures)
+    print(f"{mutant_count} mutants: {mutant_accepted} parsed by pratt, the rest fell back to ply")
+
+    if failures:
+        print(f"{len(failures)} trees differ from ply's:")
+        for name in failures[:20]:
+            print(f"  {name}")
+        sys.exit(1)
+    print("every tree pratt built matches ply's")
+
+    valid = [source for source in sources.values() if brewpratt.parse(source) is not None]
+    results = throughput(valid, args.reps)
+    print(f"\nthroughput over {len(valid)} corpus programs x {args.reps}:")
+    for name, (programs, tokens, micros) in results.items():
+        print(f"  {name:<6} {programs:>9.0f} programs/s {tokens:>11.0f} tokens/s {micros:>8.1f} us/program")
+    print(f"  pratt is {results['pratt'][0] / results['ply'][0]:.1f}x ply")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture
+def make_test(tmp_path):
+    """Writes a .br file into tmp_path and returns the test case for it, as tester makes."""
+
+    def make(name, source="func main() { print(1); }\n", expect_failure=False):
+        path = tmp_path / f"{name}.br"
+        path.write_text(source)
+        return {"name": name, "srcfile": str(path), "expect_failure": expect_failure}
+
+    return make
@@ -1,6 +1,8 @@
 class Element:
-    def __init__(self, elem_type, **kwargs):
+    def __init__(self, elem_type, line_num=None, **kwargs):
         self.elem_type = elem_type
+        # the source line the node starts on, where the parser knows it; not a field
+        self.line_num = line_num
         self.dict = {}
         for key, value in kwargs.items():
             self.dict[key] = value
@@ -27,3 +29,17 @@ class Element:
                 return "[" + s[0:-2] + "]"
             return "[" + s + "]"
         return str(v)
+
+
+# a nested tuple form of an AST, for checking that two trees have the same structure (and
+# line numbers)
+def tree_shape(node):
+    if isinstance(node, Element):
+        return (
+            node.elem_type,
+            node.line_num,
+            tuple((key, tree_shape(value)) for key, value in node.dict.items()),
+        )
+    if isinstance(node, list):
+        return tuple(tree_shape(item) for item in node)
+    return node
@@ -1,43 +1,143 @@
 # The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
 # in a brewin program and the Value object, which stores a type, and a value.
-import copy
+#
+# Besides the stack of frames, it keeps an index from each symbol to the frames that
+# define it (shallow binding), so finding the innermost binding of a symbol doesn't
+# depend on how many frames are on the stack. Brewin scoping is dynamic, so which frame
+# a name resolves to can't be worked out ahead of time. Each symbol's frames are a linked
+# list of (depth, rest) cells, innermost first: creating a binding adds a cell without
+# copying the others, and copies of the environment share the cells.
+#
+# Copies (what lambdas capture) are copy-on-write and take constant time: a copy shares
+# the stack of frames and the index it was made from, and whichever side pushes, pops or
+# binds a new name first copies those, while whichever side writes to a shared frame
+# first copies that frame. Frames and the index start out as dicts; a big one that has to
+# be copied becomes a persistent map instead (see persistentmap.py), which is copied in
+# constant time and whose copies diverge only by what's written to them, so capturing a
+# big environment over and over doesn't copy it each time. The values are shared too.
+#
+# A lambda value's captured environment changes when it's called, so a lambda is claimed
+# for the environment binding it before a call (claim): if that environment was copied
+# since the lambda was last claimed for it, the lambda's own environment is copied (the
+# same way) and every binding of it here is pointed at the copy. A lambda value keeps the
+# slots (depth and name) it's been written to, so claiming it looks at those rather than
+# at every binding.
+from persistentmap import unshared_copy
 from type_valuev2 import Value
+
+
 class EnvironmentManager:
     def __init__(self):
         self.environment = [{}]
-
-    def deepcopy(self):
-        newEnv = EnvironmentManager()
-        newEnv.environment = copy.deepcopy(self.environment)
+        # symbol -> (index of the innermost frame defining it, the same for the frames
+        # below it, or None)
+        self.bindings = {}
+        # frames whose dict no other environment can see
+        self.own_frames = {0}
+        # whether another environment shares the environment list and bindings
+        self.shared = False
+        # what the lambdas claimed for this environment since it was last copied carry
+        self.token = object()
+        # the names of the ref entries (see set_ref) bound here at some point, for
+        # get_ref_var
+        self.ref_symbols = ()
+
+    def deepcopy(self, memo=None):
+        # of the same class, so a profiled environment's copies are profiled too
+        newEnv = type(self)()
+        if memo is not None:
+            memo[id(self)] = newEnv
+        newEnv.environment = self.environment
+        newEnv.bindings = self.bindings
+        newEnv.own_frames = set()
+        newEnv.shared = True
+        newEnv.ref_symbols = self.ref_symbols
+        self.own_frames = set()
+        self.shared = True
+        # the lambdas bound here can be reached from the copy now
+        self.token = object()
 
         return newEnv
 
+    # a lambda value captured inside another environment gets copied along with it
+    def __deepcopy__(self, memo):
+        return self.deepcopy(memo)
+
     # returns a VariableDef object
     def get(self, symbol, save_env= None):
-        for env in reversed(self.environment):
-            if symbol in env:
-                return env[symbol]
+        depths = self.bindings.get(symbol)
+        if depths:
+            return self.environment[depths[0]][symbol]
 
         return None
+
+    def __unshare(self):
+        self.environment = list(self.environment)
+        self.bindings = unshared_copy(self.bindings)
+        self.shared = False
+
+    # the lambda value to call in place of value, which this environment binds: one only
+    # this environment can reach. None if value isn't bound here
+    def claim(self, value):
+        payload = value.v
+        if payload[2] is self.token:
+            return value
+        holders = []
+        for depth, symbol in payload[3]:
+            if depth < len(self.environment):
+                held = self.environment[depth].get(symbol)
+                if isinstance(held, Value) and held.v is payload:
+                    holders.append((depth, symbol, held))
+        if not holders:
+            return None
+        claimed = [payload[0], payload[1].deepcopy(), self.token, {}]
+        # names bound to the same lambda value stay bound to the same one
+        replacements = {}
+        for depth, symbol, held in holders:
+            if id(held) not in replacements:
+                replacements[id(held)] = Value(held.t, claimed)
+            self.__write(depth, symbol, replacements[id(held)])
+        return replacements.get(id(value), Value(value.t, claimed))
+
+    def __write(self, depth, symbol, value):
+        if depth not in self.own_frames:
+            if self.shared:
+                self.__unshare()
+            self.environment[depth] = unshared_copy(self.environment[depth])
+            self.own_frames.add(depth)
+        self.environment[depth][symbol] = value
+        if type(value) is Value and type(value.v) is list:
+            # a lambda's slots, for claim
+            value.v[3][depth, symbol] = None
+
+    # index of the innermost frame at or below limit that defines symbol, or -1
+    def __find(self, symbol, limit):
+        depths = self.bindings.get(symbol)
+        while depths is not None and depths[0] > limit:
+            depths = depths[1]
+        return -1 if depths is None else depths[0]
     
     # here symbol would be the 
     def get_ref(self, symbol, original_var, save_env = None, it = 0):
-        for env in list(reversed(self.environment))[it:]:
-            if original_var+"!REF!" in env:
-                return env[original_var+"!REF!"]
-            elif symbol in env:
-                if isinstance(env[symbol], list):
-                    # print("FROM GET REF symbol", symbol, "AND ORIGINAL VAR", original_var)
-                    if(symbol == original_var):
-                        return self.get_ref(symbol, original_var, save_env, it+1)
-                    else:
-                        return env[symbol]
-                else:
-                    return env[symbol]
+        ref_symbol = original_var+"!REF!"
+        limit = len(self.environment) - 1 - it
+        while limit >= 0:
+            ref_depth = self.__find(ref_symbol, limit)
+            depth = self.__find(symbol, limit)
+            if ref_depth < 0 and depth < 0:
+                break
+            # a frame's !REF! entry wins over the symbol itself
+            if ref_depth >= depth:
+                return self.environment[ref_depth][ref_symbol]
+            val = self.environment[depth][symbol]
+            # print("FROM GET REF symbol", symbol, "AND ORIGINAL VAR", original_var)
+            if isinstance(val, list) and symbol == original_var:
+                # keep looking below the ref arg for what it refers to
+                limit = depth - 1
+                continue
+            return val
         if save_env:
-            for env in reversed(save_env.environment):
-                if symbol in env:
-                    return env[symbol]
+            return save_env.get(symbol)
 
 
     #val represents the list of [Value, refvar name]
@@ -47,57 +147,74 @@ class EnvironmentManager:
         if save_env != None:
             new_lambda = Value(value.type(), value.value())
             if var_name:
-                self.set(var_name+"!REF!", new_lambda)
-            for env in reversed(save_env.environment):
-                if key in env:
-                    env[key] = new_lambda
-            print("FROM SET REF ENV", self.environment)
-            print("FROM SET REF SAVE ENV",save_env.environment)
+                ref_symbol = var_name + "!REF!"
+                if ref_symbol not in self.ref_symbols:
+                    self.ref_symbols += (ref_symbol,)
+                self.set(ref_symbol, new_lambda)
+            for depth in range(len(save_env.environment) - 1, -1, -1):
+                if key in save_env.environment[depth]:
+                    save_env.__write(depth, key, new_lambda)
                     # print("FROM SET_REF NEW SAVE ENV", save_env)
                     
         
         else:
-            for env in list(reversed(self.environment))[1+it:]:
+            for depth in range(len(self.environment) - 2 - it, -1, -1):
+                env = self.environment[depth]
                 if key in env:
                     if isinstance(env[key], list):
                         val = env[key]
                         if isinstance(env[key], list):
                             self.set_ref(val[1], value, var_name, save_env, it + 1)
                     else:
-                        env[key] = value
+                        self.__write(depth, key, value)
                         return
 
 
 
 
     def set(self, symbol, value):
-        for env in reversed(self.environment):
-            if symbol in env:
-                env[symbol] = value
-                return
+        depths = self.bindings.get(symbol)
+        if depths:
+            self.__write(depths[0], symbol, value)
+            return
 
         # symbol not found anywhere in the environment
-        self.environment[-1][symbol] = value
+        self.create(symbol, value)
 
     # create a new symbol in the top-most environment, regardless of whether that symbol exists
     # in a lower environment
     def create(self, symbol, value):
-        self.environment[-1][symbol] = value
+        depth = len(self.environment) - 1
+        if symbol not in self.environment[depth]:
+            if self.shared:
+                self.__unshare()
+            self.bindings[symbol] = (depth, self.bindings.get(symbol))
+        self.__write(depth, symbol, value)
 
     # used when we enter a nested block to create a new environment for that block
     def push(self):
+        if self.shared:
+            self.__unshare()
         self.environment.append({})  # [{}] -> [{}, {}]
+        self.own_frames.add(len(self.environment) - 1)
 
     # used when we exit a nested block to discard the environment for that block
     def pop(self):
-        self.environment.pop()
+        if self.shared:
+            self.__unshare()
+        depth = len(self.environment) - 1
+        for symbol in self.environment.pop():
+            depths = self.bindings[symbol][1]
+            if depths is not None:
+                self.bindings[symbol] = depths
+            else:
+                del self.bindings[symbol]
+        self.own_frames.discard(depth)
 
     def get_ref_var(self, save_env):
         ref_dict = {}
-        print("FROM GET REF VAR SAVE ENV", save_env.environment)
-        for env in save_env.environment:
-            for key, value in env.items():
-                if key[-5:] == "!REF!":
-                    ref_dict[key[:-5]] = value
+        for ref_symbol in save_env.ref_symbols:
+            value = save_env.get(ref_symbol)
+            if value is not None:
+                ref_dict[ref_symbol[:-5]] = value
         return ref_dict
-
@@ -4,10 +4,17 @@ test management.
 """
 
 import asyncio
+import io
 import json
-from os import makedirs
-from os.path import exists
+import multiprocessing
+import os
+import statistics
+import time
 from abc import ABC, abstractmethod
+from contextlib import redirect_stdout
+from multiprocessing.connection import wait
+from os import makedirs
+from os.path import exists, getsize, split
 
 
 class AbstractTestScaffold(ABC):
@@ -21,6 +28,13 @@ class AbstractTestScaffold(ABC):
     def run_test_case(self, test_case, environment):
         """Run the test case end-to-end; return a number encoding the points allocated."""
 
+    def test_metadata(self):
+        """
+        Anything noted about the test case just run, passed back along with its score to
+        the result cache (e.g. the functions it called); None by default.
+        """
+        return None
+
 
 def run_test(scaffold, test_case):
     """Ran a single test case with the scaffold; returns score."""
@@ -32,43 +46,348 @@ def run_test(scaffold, test_case):
         return 0
 
 
-async def run_test_wrapper(interpreter, test_case, timeout):
+def read_rss(key="VmRSS"):
+    """This process's resident set size (or, with key="VmHWM", its peak) in bytes; Linux only."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith(f"{key}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset this process's peak RSS to its current RSS, and return that; None if it can't."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as handle:
+            handle.write("5")
+    except OSError:
+        return None
+    return read_rss()
+
+
+def unmeasured(wall_s):
+    """Measurements of a test that didn't finish (timed out or crashed)."""
+    return {"wall_s": wall_s, "cpu_s": None, "peak_rss_bytes": None}
+
+
+def measure_test(scaffold, test_case):
     """
-    Wrapper for run_test with timeout and minor debugging.
-    Uses asyncio to enforce timeout, not for concurrency.
+    run_test, measured; returns the score and {"wall_s", "cpu_s", "peak_rss_bytes"}. CPU
+    time is the running thread's; peak RSS is how far the process's resident set grew
+    above where it was at the start, or None where that can't be read.
     """
-    print(f'Running {test_case["srcfile"]}... ', end="")
-    try:
-        async with asyncio.timeout(timeout):
-            result = await asyncio.to_thread(run_test, interpreter, test_case)
-            print(f' {"PASSED" if result else "FAILED"}')
-            return result
-    except asyncio.TimeoutError:
-        print("TIMED OUT")
-        return 0
+    start_rss = reset_peak_rss()
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    score = run_test(scaffold, test_case)
+    stats = unmeasured(time.perf_counter() - start)
+    stats["cpu_s"] = time.thread_time() - start_cpu
+    if start_rss is not None:
+        stats["peak_rss_bytes"] = max(0, read_rss("VmHWM") - start_rss)
+    return score, stats
 
 
-async def run_all_tests(interpreter, tests, timeout_per_test=5):
+async def run_all_tests(
+    interpreter,
+    tests,
+    timeout_per_test=5,
+    workers=None,
+    timings_path=None,
+    queue=None,
+    result_cache=None,
+):
     """
-    Run all tests sequentially; defaults to 5s timeout per test.
-    Each test case *must* have a name and srcfile key.
+    Run all tests, replaying the scores of those a result_cache (see resultcache.py) already
+    holds and running the rest (see run_uncached_tests). With a queue, the replayed tests
+    are marked done in it, so no run sharing it claims them.
+    Each test case *must* have a name and srcfile key. The result of each test run (rather
+    than replayed) carries its measurements (see measure_test) as extra_data.
     """
-    print(f"Running {len(tests)} tests...")
+    scores = {}
+    measurements = {}
+    if result_cache is not None:
+        for index, test in enumerate(tests):
+            score = result_cache.get(test)
+            if score is not None:
+                print(f'Running {test["srcfile"]}...  {"PASSED" if score else "FAILED"} (cached)')
+                scores[index] = score
+                if queue is not None:
+                    queue.complete(test["srcfile"], score)
+    uncached = [test for index, test in enumerate(tests) if index not in scores]
+    ran = await run_uncached_tests(
+        interpreter, uncached, timeout_per_test, workers, timings_path, queue
+    )
+    indexes = {id(test): index for index, test in enumerate(tests)}
+    for test, score, stats, metadata in ran:
+        scores[indexes[id(test)]] = score
+        measurements[indexes[id(test)]] = stats
+        # only tests that ran to the end are cached: one that crashed or ran out of time
+        # (and so went unmeasured) might pass on a second try or a less loaded machine
+        if result_cache is not None and stats["cpu_s"] is not None:
+            result_cache.put(test, score, metadata)
+    if result_cache is not None:
+        result_cache.save()
     results = [
         {
-            "name": test["name"],
-            "score": await run_test_wrapper(interpreter, test, timeout_per_test),
+            "name": tests[index]["name"],
+            "score": scores[index],
             "max_score": 1,
             "visibility": "visible"
-            if test.get("visible", False)
+            if tests[index].get("visible", False)
             else "after_published",
         }
-        for test in tests
+        for index in sorted(scores)
     ]
-    print(f"{get_score(results)}/{len(tests)} tests passed.")
+    for index, result in zip(sorted(scores), results):
+        if index in measurements:
+            result["extra_data"] = {
+                key: value if value is None or key == "peak_rss_bytes" else round(value, 6)
+                for key, value in measurements[index].items()
+            }
+    print(f"{get_score(results)}/{len(results)} tests passed.")
     return results
 
 
+async def run_uncached_tests(
+    interpreter, tests, timeout_per_test, workers, timings_path, queue
+):
+    """
+    Run tests; returns (test, score, measurements, metadata) for each test run, measurements
+    as measure_test returns them and metadata what the scaffold's test_metadata() returned
+    after it.
+    Tests run in workers worker processes, one by default (see run_tests_in_processes), so
+    a test that runs out of time is killed; longest first by the durations recorded in
+    timings_path, where each test's duration is recorded too if given.
+    With a queue (see testqueue.TestQueue), tests are instead claimed from it one at a time
+    by this run's worker processes, alongside any other runs sharing the queue, and only
+    the tests this run claimed are run and reported. A claimed test that isn't in tests
+    (one another run put in the queue) is skipped, and handed out again once its lease runs
+    out.
+    """
+    timings = load_timings(timings_path) if timings_path else {}
+    if queue is not None:
+        print(f"Running tests from {queue}...")
+        ran = []
+        indexes = {test["srcfile"]: index for index, test in enumerate(tests)}
+
+        def claimed():
+            while (srcfile := queue.claim()) is not None:
+                if srcfile in indexes:
+                    yield indexes[srcfile]
+
+        def record(index, score, _):
+            queue.complete(tests[index]["srcfile"], score)
+            ran.append(index)
+
+        scores, measurements, metadata = await asyncio.to_thread(
+            run_tests_in_processes,
+            interpreter,
+            tests,
+            timeout_per_test,
+            workers or 1,
+            claimed(),
+            record,
+        )
+        ran.sort()
+        tests = [tests[index] for index in ran]
+        scores = [scores[index] for index in ran]
+        measurements = [measurements[index] for index in ran]
+        metadata = [metadata[index] for index in ran]
+    else:
+        print(f"Running {len(tests)} tests...")
+        order = schedule_longest_first(tests, timings)
+        scores, measurements, metadata = await asyncio.to_thread(
+            run_tests_in_processes, interpreter, tests, timeout_per_test, workers or 1, order
+        )
+    if timings_path:
+        for test, stats in zip(tests, measurements):
+            timings[test["srcfile"]] = round(stats["wall_s"], 6)
+        save_timings(timings_path, timings)
+    return list(zip(tests, scores, measurements, metadata))
+
+
+def load_timings(path):
+    """Test durations in seconds, keyed by srcfile, recorded by earlier runs."""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_timings(path, timings):
+    """Write test durations; written then renamed, so a killed run can't truncate them."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(timings, handle, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def estimate_costs(tests, timings):
+    """
+    Estimated seconds per test: its recorded duration if there is one, otherwise its source
+    size times the median seconds per byte of the tests that have been timed.
+    """
+    sizes = []
+    for test in tests:
+        try:
+            sizes.append(getsize(test["srcfile"]))
+        except OSError:
+            sizes.append(0)
+    rates = [
+        timings[test["srcfile"]] / size
+        for test, size in zip(tests, sizes)
+        if test["srcfile"] in timings and size > 0
+    ]
+    # with nothing timed yet, sizes alone still rank the tests
+    rate = statistics.median(rates) if rates else 1.0
+    return [
+        timings.get(test["srcfile"], size * rate) for test, size in zip(tests, sizes)
+    ]
+
+
+def schedule_longest_first(tests, timings):
+    """
+    Indexes of tests, most expensive first. Handing each to the next free worker is
+    longest-processing-time-first bin packing: no long test is left to start last.
+    """
+    costs = estimate_costs(tests, timings)
+    return sorted(range(len(tests)), key=lambda index: -costs[index])
+
+
+def worker_main(scaffold, connection):
+    """
+    Worker process loop: run each (index, test case) sent, reply with its score,
+    measurements, output and metadata.
+    """
+    while True:
+        job = connection.recv()
+        if job is None:
+            return
+        index, test_case = job
+        output = io.StringIO()
+        with redirect_stdout(output):
+            score, stats = measure_test(scaffold, test_case)
+        connection.send((index, score, stats, output.getvalue(), scaffold.test_metadata()))
+
+
+class Worker:
+    """A worker process and the pipe used to hand it test cases."""
+
+    def __init__(self, context, scaffold):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(scaffold, child_connection), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.job = None
+        self.started = None
+        self.deadline = None
+
+    def send(self, job, timeout):
+        self.job = job
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.connection.send(job)
+
+    def stop(self):
+        """Ask an idle worker to exit."""
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        """Kill the worker outright, e.g. one stuck in an infinite loop."""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def run_tests_in_processes(
+    scaffold, tests, timeout_per_test, workers, order=None, on_result=None
+):
+    """
+    Run tests over a pool of worker processes, handing them out in order (indexes into
+    tests, read only as workers free up; defaults to test order); returns their scores,
+    measurements (see measure_test) and metadata, in test order. on_result(index, score,
+    duration) is called as each finishes.
+    A worker still running a test after timeout_per_test seconds is killed and replaced,
+    so a program that never halts doesn't keep burning a core. Output a test prints is
+    shown once it finishes, after its "Running ..." line.
+    """
+    # fork shares the scaffold (and its interpreter module) with workers as-is; elsewhere
+    # the scaffold is pickled over to them
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+    if order is None:
+        order = range(len(tests))
+    jobs = iter(order)
+    exhausted = False
+    scores = [0] * len(tests)
+    measurements = [unmeasured(float(timeout_per_test)) for _ in tests]
+    metadata = [None] * len(tests)
+    idle = [Worker(context, scaffold) for _ in range(min(workers, len(tests)))]
+    busy = {}
+
+    def finish(worker, status, output=""):
+        index = worker.job[0]
+        print(f'Running {worker.job[1]["srcfile"]}... {output}{status}')
+        worker.job = None
+        if on_result is not None:
+            on_result(index, scores[index], measurements[index]["wall_s"])
+
+    try:
+        while True:
+            while idle and not exhausted:
+                index = next(jobs, None)
+                if index is None:
+                    exhausted = True
+                    break
+                worker = idle.pop()
+                worker.send((index, tests[index]), timeout_per_test)
+                busy[worker.connection] = worker
+            if not busy:
+                break
+            soonest = min(worker.deadline for worker in busy.values())
+            for connection in wait(list(busy), max(0, soonest - time.monotonic())):
+                worker = busy.pop(connection)
+                try:
+                    index, score, stats, output, meta = connection.recv()
+                except EOFError:
+                    # the worker died mid-test
+                    measurements[worker.job[0]] = unmeasured(time.monotonic() - worker.started)
+                    finish(worker, "CRASHED")
+                    worker.kill()
+                    idle.append(Worker(context, scaffold))
+                    continue
+                scores[index] = score
+                measurements[index] = stats
+                metadata[index] = meta
+                finish(worker, " PASSED" if score else " FAILED", output)
+                idle.append(worker)
+            now = time.monotonic()
+            for connection, worker in list(busy.items()):
+                if worker.deadline <= now:
+                    del busy[connection]
+                    finish(worker, "TIMED OUT")
+                    worker.kill()
+                    idle.append(Worker(context, scaffold))
+    finally:
+        for worker in idle:
+            worker.stop()
+        for worker in busy.values():
+            worker.kill()
+    return scores, measurements, metadata
+
+
 def format_gradescope_output(results):
     """Generate proper JSON object depending on results type."""
     if isinstance(results, (int, float)):
@@ -76,17 +395,48 @@ def format_gradescope_output(results):
     return {"tests": results}
 
 
-def write_gradescope_output(score, is_prod):
-    """Write a results.json with the score; use CWD on dev, root on prod."""
+def write_gradescope_output(score, is_prod, output=None):
+    """
+    Write a results.json with the score; use CWD on dev, root on prod, or the output file
+    if one is given (e.g. one node's part of a sharded run).
+    """
     path = "/autograder/results" if is_prod else "."
+    if output is not None:
+        path, filename = split(output)
+        path = path or "."
+    else:
+        filename = "results.json"
     data = format_gradescope_output(score)
     if not exists(path):
         print(f"{path} does not exist, creating...")
         makedirs(path)
-    with open(f"{path}/results.json", "w", encoding="utf-8") as handle:
+    with open(f"{path}/{filename}", "w", encoding="utf-8") as handle:
         json.dump(data, handle, ensure_ascii=False, indent=4)
 
 
+def shard_tests(tests, index, count):
+    """
+    The tests in shard index (0-based) of count. Tests are dealt round robin in srcfile
+    order, so every node gets the same split without talking to the others.
+    """
+    ordered = sorted(tests, key=lambda test: test["srcfile"])
+    return ordered[index::count]
+
+
+def merge_results(paths):
+    """
+    Combine the test results in several results.json files into one list, sorted by name.
+    A test that appears in more than one (e.g. a queued test reclaimed from a slow node)
+    keeps its first result.
+    """
+    merged = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            for result in json.load(handle).get("tests", []):
+                merged.setdefault(result["name"], result)
+    return [merged[name] for name in sorted(merged)]
+
+
 def get_score(results):
     """Helper to get student's score (for 0/1-based scores.)"""
     return len(list(filter(lambda result: result["score"], results)))
\ No newline at end of file
@@ -1,6 +1,8 @@
 # Base class for our interpreter
 from enum import Enum
 
+import brewtrace
+
 
 class ErrorType(Enum):
     TYPE_ERROR = 1
@@ -34,9 +36,12 @@ class InterpreterBase:
     NOT_DEF = "!"
 
     # methods
-    def __init__(self, console_output=True, inp=None):
+    def __init__(self, console_output=True, inp=None, tracer=None):
         self.console_output = console_output
         self.inp = inp  # if not none, then read input from passed-in list
+        self.profiler = None  # a brewprofile.Profiler when trace_output is on
+        # where debug trace events go (see brewtrace.py); tracing nothing by default
+        self.tracer = brewtrace.OFF if tracer is None else tracer
         self.reset()
 
     # Call to reset I/O for another run of the program
@@ -84,3 +89,10 @@ class InterpreterBase:
 
     def get_error_type_and_line(self):
         return self.error_type, self.error_line
+
+    # counts and times of what the runs so far executed (see brewprofile.py), or None
+    # unless the interpreter was made with trace_output on
+    def get_profile(self):
+        if self.profiler is None:
+            return None
+        return self.profiler.report()
@@ -9,12 +9,20 @@ class Interpreter(InterpreterBase):
     # constants
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
     BIN_OPS = {"+", "-"}
+    # what each run's environment is made with; the profiler swaps in a timed subclass
+    __new_environment = EnvironmentManager
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    def __init__(self, console_output=True, inp=None, trace_output=False, tracer=None):
+        super().__init__(console_output, inp, tracer)
         self.trace_output = trace_output
         self.__setup_ops()
+        if trace_output:
+            # imported here so runs that aren't profiled don't load it
+            from brewprofile import Profiler
+
+            self.profiler = Profiler()
+            self.profiler.attach(self)
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
@@ -23,7 +31,7 @@ class Interpreter(InterpreterBase):
         ast = parse_program(program)
         self.__set_up_function_table(ast)
         main_func = self.__get_func_by_name("main")
-        self.env = EnvironmentManager()
+        self.env = self.__new_environment()
         self.__run_statements(main_func.get("statements"))
 
     def __set_up_function_table(self, ast):
@@ -38,9 +46,10 @@ class Interpreter(InterpreterBase):
 
     def __run_statements(self, statements):
         # all statements of a function are held in arg3 of the function AST node
+        trace_statements = self.tracer.statements
         for statement in statements:
-            if self.trace_output:
-                print(statement)
+            if trace_statements:
+                self.tracer.emit("statements", "run", statement)
             if statement.elem_type == InterpreterBase.FCALL_DEF:
                 self.__call_func(statement)
             elif statement.elem_type == "=":
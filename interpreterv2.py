@@ -18,12 +18,22 @@ class Interpreter(InterpreterBase):
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    # what each run's environment is made with, and args and return values are copied with;
+    # the profiler swaps in timed versions
+    __new_environment = EnvironmentManager
+    __copy_value = staticmethod(copy.deepcopy)
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    def __init__(self, console_output=True, inp=None, trace_output=False, tracer=None):
+        super().__init__(console_output, inp, tracer)
         self.trace_output = trace_output
         self.__setup_ops()
+        if trace_output:
+            # imported here so runs that aren't profiled don't load it
+            from brewprofile import Profiler
+
+            self.profiler = Profiler()
+            self.profiler.attach(self)
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
@@ -31,7 +41,7 @@ class Interpreter(InterpreterBase):
     def run(self, program):
         ast = parse_program(program)
         self.__set_up_function_table(ast)
-        self.env = EnvironmentManager()
+        self.env = self.__new_environment()
         main_func = self.__get_func_by_name("main", 0)
         self.__run_statements(main_func.get("statements"))
 
@@ -57,9 +67,10 @@ class Interpreter(InterpreterBase):
 
     def __run_statements(self, statements):
         self.env.push()
+        trace_statements = self.tracer.statements
         for statement in statements:
-            if self.trace_output:
-                print(statement)
+            if trace_statements:
+                self.tracer.emit("statements", "run", statement)
             status = ExecStatus.CONTINUE
             if statement.elem_type == InterpreterBase.FCALL_DEF:
                 self.__call_func(statement)
@@ -96,13 +107,17 @@ class Interpreter(InterpreterBase):
                 ErrorType.NAME_ERROR,
                 f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
             )
+        if self.tracer.calls:
+            self.tracer.emit("calls", "enter", call_node, func_ast)
         self.env.push()
         for formal_ast, actual_ast in zip(formal_args, actual_args):
-            result = copy.deepcopy(self.__eval_expr(actual_ast))
+            result = self.__copy_value(self.__eval_expr(actual_ast))
             arg_name = formal_ast.get("name")
             self.env.create(arg_name, result)
         _, return_val = self.__run_statements(func_ast.get("statements"))
         self.env.pop()
+        if self.tracer.calls:
+            self.tracer.emit("calls", "exit", func_ast)
         return return_val
 
     def __call_print(self, call_ast):
@@ -309,5 +324,5 @@ class Interpreter(InterpreterBase):
         expr_ast = return_ast.get("expression")
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        value_obj = copy.deepcopy(self.__eval_expr(expr_ast))
+        value_obj = self.__copy_value(self.__eval_expr(expr_ast))
         return (ExecStatus.RETURN, value_obj)
@@ -1,10 +1,21 @@
-import copy
+import sys
 from enum import Enum
 
-from brewparse import parse_program
+from brewparse import parse_compact, parse_program
 from env_v2 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
-from type_valuev2 import Type, Value, create_value, get_printable
+from type_valuev2 import (
+    FALSE_VALUE,
+    TRUE_VALUE,
+    Type,
+    Value,
+    bool_value,
+    copy_value,
+    create_value,
+    get_printable,
+    int_value,
+    string_literal,
+)
 
 class ExecStatus(Enum):
     CONTINUE = 1
@@ -17,23 +28,105 @@ class Interpreter(InterpreterBase):
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    # execution backends
+    TREE_BACKEND = "tree"
+    CLOSURE_BACKEND = "closure"
+    BYTECODE_BACKEND = "bytecode"
+    # the fewest python frames a brewin call takes on the tree backend; the bytecode VM
+    # keeps calls off the python stack, so it caps its own depth to fail where the tree
+    # backend would
+    PY_FRAMES_PER_CALL = 4
+    # AST representations
+    ELEMENT_AST = "element"
+    COMPACT_AST = "compact"
+    # what each run's environment is made with, and args and return values are copied with;
+    # the profiler swaps in timed versions
+    __new_environment = EnvironmentManager
+    __copy_value = staticmethod(copy_value)
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    def __init__(
+        self,
+        console_output=True,
+        inp=None,
+        trace_output=False,
+        backend=TREE_BACKEND,
+        ast_format=ELEMENT_AST,
+        tracer=None,
+    ):
+        super().__init__(console_output, inp, tracer)
         self.trace_output = trace_output
+        # one [function or lambda AST, call node, line] per brewin call in progress, main
+        # first. The tree and closure backends only keep the line up to date with track_lines
+        # on, which brewprofile's Sampler turns on before the program runs; the bytecode VM
+        # never does, the Sampler reads it off the VM's pc
+        self.call_stack = []
+        self.track_lines = False
         self.__setup_ops()
+        # before the backend binds the methods the profiler wraps
+        if trace_output:
+            # imported here so runs that aren't profiled don't load it
+            from brewprofile import Profiler
+
+            self.profiler = Profiler()
+            self.profiler.attach(self)
+        self.__set_backend(backend)
+        if ast_format not in (Interpreter.ELEMENT_AST, Interpreter.COMPACT_AST):
+            raise ValueError(f"Unknown AST format {ast_format}")
+        self.ast_format = ast_format
+
+    # the tree backend re-dispatches on elem_type every time a node runs; the closure
+    # backend compiles each node once into a python closure and just calls it afterwards;
+    # the bytecode backend lowers function bodies to bytecode run by a single dispatch loop
+    def __set_backend(self, backend):
+        if backend == Interpreter.TREE_BACKEND:
+            self.__evaluate = self.__eval_expr
+            self.__execute = self.__run_statements
+        elif backend == Interpreter.CLOSURE_BACKEND:
+            self.__evaluate = self.__eval_compiled
+            self.__execute = self.__run_compiled
+        elif backend == Interpreter.BYTECODE_BACKEND:
+            if self.tracer.statements:
+                raise ValueError(
+                    "The bytecode backend runs no per-statement code, so it can't trace"
+                    " statements; use the tree or closure backend"
+                )
+            # imported here so the other backends don't load the compiler
+            import bytecodev3
+
+            self.__bytecode = bytecodev3
+            self.__evaluate = self.__eval_bytecode
+            self.__execute = self.__run_bytecode
+        else:
+            raise ValueError(f"Unknown backend {backend}")
+        self.backend = backend
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
+        if self.ast_format == Interpreter.COMPACT_AST:
+            # the backends run the compact tree through its Element-shaped node views
+            ast = parse_compact(program).root()
+        else:
+            ast = parse_program(program)
         self.__set_up_function_table(ast)
-        self.env = EnvironmentManager()
+        self.__run_main()
+
+    # run a program loaded by brewcompile.load(), which comes with its function table
+    # already built, so nothing gets parsed
+    def run_compiled(self, compiled):
+        self.func_name_to_ast = compiled.function_table()
+        self.__run_main()
+
+    def __run_main(self):
+        self.env = self.__new_environment()
         self.save_env = None
+        self.__code = {}
         main_func = self.__get_func_by_name("main", 0)
-        self.__run_statements(main_func.get("statements"))
+        self.call_stack.clear()
+        self.call_stack.append([main_func, None, main_func.line_num])
+        self.__execute(main_func.get("statements"))
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
@@ -81,9 +174,13 @@ class Interpreter(InterpreterBase):
 
     def __run_statements(self, statements):
         self.env.push()
-        print()
+        frame = self.call_stack[-1] if self.track_lines else None
+        trace_statements = self.tracer.statements
         for statement in statements:
-            print(statement)
+            if trace_statements:
+                self.tracer.emit("statements", "run", statement)
+            if frame is not None:
+                frame[2] = statement.line_num
             status = ExecStatus.CONTINUE
             if statement.elem_type == InterpreterBase.FCALL_DEF:
                 self.__call_func(statement)
@@ -112,6 +209,25 @@ class Interpreter(InterpreterBase):
         if func_name == "inputs":
             return self.__call_input(call_node)
 
+        actual_args = call_node.get("args")
+        lambda_ast, func_ast, formal_args, ref_vars = self.__enter_func(call_node)
+        for formal_ast, actual_ast in zip(formal_args, actual_args):
+            arg_name = formal_ast.get("name")
+            if arg_name in ref_vars.keys():
+                result = self.__copy_value(ref_vars[arg_name])
+            else:
+                result = self.__copy_value(self.__evaluate(actual_ast))
+            # print(result)
+            self.__bind_arg(formal_ast, actual_ast, result)
+        
+        _, return_val = self.__execute(func_ast.get("statements"))
+        self.__exit_func(lambda_ast)
+        return return_val
+
+    # sets up the environment for a call and returns what's needed to bind its args and
+    # run its body; lambda_ast is the called Value for lambdas, func_ast its AST
+    def __enter_func(self, call_node):
+        func_name = call_node.get("name")
         actual_args = call_node.get("args")
         func_ast = self.__get_func_by_name(func_name, len(actual_args))
         lambda_ast = func_ast
@@ -135,8 +251,17 @@ class Interpreter(InterpreterBase):
                 # check to see if any prior lambdas changed shadowed vars
                 if self.save_env != None:
                     
+                    if self.tracer.env:
+                        self.tracer.emit("env", "gathering refs from", self.save_env.environment)
                     ref_vars = self.save_env.get_ref_var(self.save_env)
-                    print("REF_VARS", ref_vars)
+                    if self.tracer.refs:
+                        self.tracer.emit("refs", "gathered", ref_vars)
+                # the call changes the lambda's environment, so it mustn't be one a copy shares
+                claimed = self.env.claim(lambda_ast)
+                if claimed is None and self.save_env is not None:
+                    claimed = self.save_env.claim(lambda_ast)
+                if claimed is not None:
+                    lambda_ast = claimed
                 self.save_env = self.env
                 #sets the current environment as lamb env
                 self.env = (lambda_ast.value()[1])
@@ -144,20 +269,22 @@ class Interpreter(InterpreterBase):
                 # print("DURING LAMBDA FUNC CALL")
                 # print(self.save_env.environment)
                 # print(self.env.environment)
+        self.call_stack.append([func_ast, call_node, func_ast.line_num])
+        if self.tracer.calls:
+            self.tracer.emit("calls", "enter", call_node, func_ast)
+        return lambda_ast, func_ast, formal_args, ref_vars
 
-        for formal_ast, actual_ast in zip(formal_args, actual_args):
-            arg_name = formal_ast.get("name")
-            if arg_name in ref_vars.keys():
-                result = copy.deepcopy(ref_vars[arg_name])
-            else:
-                result = copy.deepcopy(self.__eval_expr(actual_ast))
-            # print(result)
-            if formal_ast.elem_type == "refarg" and actual_ast.elem_type == 'var':
-                self.env.create(arg_name, [Value("refvar", result), actual_ast.get('name')])
-            else:
-                self.env.create(arg_name, result)
-        
-        _, return_val = self.__run_statements(func_ast.get("statements"))
+    def __bind_arg(self, formal_ast, actual_ast, result):
+        arg_name = formal_ast.get("name")
+        if formal_ast.elem_type == "refarg" and actual_ast.elem_type == 'var':
+            self.env.create(arg_name, [Value("refvar", result), actual_ast.get('name')])
+        else:
+            self.env.create(arg_name, result)
+
+    def __exit_func(self, lambda_ast):
+        func_ast = self.call_stack.pop()[0]
+        if self.tracer.calls:
+            self.tracer.emit("calls", "exit", func_ast)
         if isinstance(lambda_ast, Value) and lambda_ast.type()== Type.LAMBDA:
                 ## save the prior environment before lambda exits
                 # self.env.pop()
@@ -165,21 +292,27 @@ class Interpreter(InterpreterBase):
                 self.env = self.save_env
                 self.save_env = temp
         self.env.pop()
-        return return_val
 
     def __call_print(self, call_ast):
         output = ""
         for arg in call_ast.get("args"):
             # print(self.env.environment)
-            result = self.__eval_expr(arg)  # result is a Value object
+            result = self.__evaluate(arg)  # result is a Value object
             output = output + get_printable(result)
         super().output(output)
         return Interpreter.NIL_VALUE
 
     def __call_input(self, call_ast):
+        args = call_ast.get("args")
+        result = None
+        if args is not None and len(args) == 1:
+            result = self.__evaluate(args[0])
+        return self.__read_input(call_ast, result)
+
+    # result is the evaluated prompt when the call has exactly one arg
+    def __read_input(self, call_ast, result):
         args = call_ast.get("args")
         if args is not None and len(args) == 1:
-            result = self.__eval_expr(args[0])
             super().output(get_printable(result))
         elif args is not None and len(args) > 1:
             super().error(
@@ -187,7 +320,7 @@ class Interpreter(InterpreterBase):
             )
         inp = super().get_input()
         if call_ast.get("name") == "inputi":
-            return Value(Type.INT, int(inp))
+            return int_value(int(inp))
         if call_ast.get("name") == "inputs":
             return Value(Type.STRING, inp)
 
@@ -195,6 +328,10 @@ class Interpreter(InterpreterBase):
         var_name = assign_ast.get("name")
         val = self.env.get(var_name, self.save_env)
         value_obj = self.__eval_expr(assign_ast.get("expression"), 0, var_name)
+        self.__store(var_name, val, value_obj)
+
+    # val is what var_name held before the assignment's expression was evaluated
+    def __store(self, var_name, val, value_obj):
         # print("WHAT IS VALUE OBJ", value_obj.type(), value_obj.value())
         # val is none when it doesn't exist in our current env,
         # and it needs to be set in current env
@@ -216,6 +353,13 @@ class Interpreter(InterpreterBase):
                     # print(self.env.environment)
                     # print(self.save_env.environment)
                     self.env.set_ref(val[1], value_obj, var_name, self.save_env)
+                    if self.tracer.env and self.save_env is not None:
+                        self.tracer.emit(
+                            "env",
+                            f"after writing ref {var_name}",
+                            self.env.environment,
+                            self.save_env.environment,
+                        )
                     # print(self.env.environment)
                     # print(self.save_env.environment)
                     # NEED TO FIGURE OUT THIS LOGIC BECAUSE ITS AN ISSUE IN LAMBDAS
@@ -243,26 +387,16 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == InterpreterBase.NIL_DEF:
             return Interpreter.NIL_VALUE
         if expr_ast.elem_type == InterpreterBase.INT_DEF:
-            return Value(Type.INT, expr_ast.get("val"))
+            return int_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.STRING_DEF:
-            return Value(Type.STRING, expr_ast.get("val"))
+            return string_literal(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.BOOL_DEF:
-            return Value(Type.BOOL, expr_ast.get("val"))
+            return bool_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.VAR_DEF:
             var_name = expr_ast.get("name")
             val = self.env.get(var_name)
             # will return a list if refarg
-            if isinstance(val, list):
-                return self.__eval_expr(val)
-            if val is None:
-                val = self.__get_func_by_name(var_name, -1)
-                if val.elem_type != InterpreterBase.FUNC_DEF and val.elem_type != InterpreterBase.LAMBDA_DEF:
-                    super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
-                if val.elem_type == InterpreterBase.FUNC_DEF:
-                    return Value(Type.FUNC, val)
-                if val.elem_type == InterpreterBase.LAMBDA_DEF:
-                    return Value(Type.LAMBDA, val)
-            return val
+            return self.__resolve_var(var_name, val)
         if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
             return self.__call_func(expr_ast)
         if expr_ast.elem_type in Interpreter.BIN_OPS:
@@ -274,40 +408,61 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == InterpreterBase.LAMBDA_DEF:
             return self.__handle_lambdas(expr_ast, var_name)
     
+    # handles the variable reads that aren't a plain Value: ref args and function names
+    def __resolve_var(self, var_name, val):
+        if isinstance(val, list):
+            return self.__eval_expr(val)
+        if val is None:
+            val = self.__get_func_by_name(var_name, -1)
+            if val.elem_type != InterpreterBase.FUNC_DEF and val.elem_type != InterpreterBase.LAMBDA_DEF:
+                super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
+            if val.elem_type == InterpreterBase.FUNC_DEF:
+                return Value(Type.FUNC, val)
+            if val.elem_type == InterpreterBase.LAMBDA_DEF:
+                return Value(Type.LAMBDA, val)
+        return val
+
     def __handle_lambdas(self, lambda_ast, var_name):
         # I copy the env before setting lambda in it
         lambEnvironment = self.env.deepcopy()
         # print("HANDLE LAMBDAS")
         # print(lambEnvironment.environment)
         # print(self.env.environment)
-        lambEnvironment.set(var_name, Value(Type.LAMBDA, [lambda_ast, lambEnvironment.deepcopy()]))
-        return Value(Type.LAMBDA, [lambda_ast, lambEnvironment])
+        # each claimed for the environment it's about to be bound in (see env_v2)
+        lambEnvironment.set(
+            var_name,
+            Value(Type.LAMBDA, [lambda_ast, lambEnvironment.deepcopy(), lambEnvironment.token, {}]),
+        )
+        return Value(Type.LAMBDA, [lambda_ast, lambEnvironment, self.env.token, {}])
     
 
     def __eval_op(self, arith_ast):
         left_value_obj = self.__eval_expr(arith_ast.get("op1"))
         right_value_obj = self.__eval_expr(arith_ast.get("op2"))
+        return self.__apply_op(arith_ast.elem_type, left_value_obj, right_value_obj)
+
+    def __apply_op(self, oper, left_value_obj, right_value_obj):
         # print("\nleft", left_value_obj.type(), "right", right_value_obj.type())
         if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
+            oper, left_value_obj, right_value_obj
         ):
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible types for {arith_ast.elem_type} operation",
+                f"Incompatible types for {oper} operation",
             )
         if right_value_obj.type() == Type.NIL:
             op_type = right_value_obj.type()
         else:
             op_type = left_value_obj.type()
-        if arith_ast.elem_type in ["==", "!="]:
+        if oper in ["==", "!="]:
             if (left_value_obj.type() == Type.BOOL and right_value_obj.type() == Type.INT) or (left_value_obj.type() == Type.INT and right_value_obj.type() == Type.BOOL):
                 op_type = Type.BOOL
-        if arith_ast.elem_type not in self.op_to_lambda[op_type]:
+        if oper not in self.op_to_lambda[op_type]:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {op_type}",
+                f"Incompatible operator {oper} for type {op_type}",
             )
-        f = self.op_to_lambda[op_type][arith_ast.elem_type]
+        f = self.op_to_lambda[op_type][oper]
         return f(left_value_obj, right_value_obj)
 
     def __compatible_types(self, oper, obj1, obj2):
@@ -326,129 +481,132 @@ class Interpreter(InterpreterBase):
 
     def __eval_unary(self, arith_ast, type, function):
         value_obj = self.__eval_expr(arith_ast.get("op1"))
+        return self.__apply_unary(arith_ast.elem_type, value_obj, type, function)
+
+    def __apply_unary(self, oper, value_obj, type, function):
         if value_obj.type() == Type.INT:
-            return Value(Type.BOOL, function(value_obj.value()))
+            return bool_value(function(value_obj.value()))
         if value_obj.type() != type:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
+                f"Incompatible type for {oper} operation",
             )
-        return Value(type, function(value_obj.value()))
+        return bool_value(function(value_obj.value()))
 
     def __setup_ops(self):
         self.op_to_lambda = {}
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), int(x.value()) + int(y.value())
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(
+            int(x.value()) + int(y.value())
         )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), int(x.value()) - int(y.value())
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(
+            int(x.value()) - int(y.value())
         )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), int(x.value()) * int(y.value())
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(
+            int(x.value()) * int(y.value())
         )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), int(x.value()) // int(y.value())
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(
+            int(x.value()) // int(y.value())
         )
         # fails when 3 == 5
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, (x.type() == y.type()) and x.value() == y.value()
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: bool_value(
+            (x.type() == y.type()) and x.value() == y.value()
         )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, (x.type() != y.type()) or x.value() != y.value()
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: bool_value(
+            (x.type() != y.type()) or x.value() != y.value()
         )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, int(x.value()) < int(y.value())
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: bool_value(
+            int(x.value()) < int(y.value())
         )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, int(x.value()) <= int(y.value())
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(
+            int(x.value()) <= int(y.value())
         )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, int(x.value()) > int(y.value())
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: bool_value(
+            int(x.value()) > int(y.value())
         )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, int(x.value()) >= int(y.value())
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(
+            int(x.value()) >= int(y.value())
         )
-        self.op_to_lambda[Type.INT]["&&"] = lambda x, y: Value(
-            Type.BOOL, bool(x.value() and y.value())
+        self.op_to_lambda[Type.INT]["&&"] = lambda x, y: bool_value(
+            bool(x.value() and y.value())
         )
-        self.op_to_lambda[Type.INT]["||"] = lambda x, y: Value(
-            Type.BOOL, bool(x.value() or y.value())
+        self.op_to_lambda[Type.INT]["||"] = lambda x, y: bool_value(
+            bool(x.value() or y.value())
         )
         #  set up operations on strings
         self.op_to_lambda[Type.STRING] = {}
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
             x.type(), x.value() + y.value()
         )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
         #  set up operations on bools
         self.op_to_lambda[Type.BOOL] = {}
-        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: Value(
-            x.type(), bool(x.value()) and bool(y.value())
+        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: bool_value(
+            bool(x.value()) and bool(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: Value(
-            x.type(), bool(x.value()) or bool(y.value())
+        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: bool_value(
+            bool(x.value()) or bool(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, bool(x.value()) == bool(y.value())
+        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: bool_value(
+            bool(x.value()) == bool(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, bool(x.value()) != bool(y.value())
+        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: bool_value(
+            bool(x.value()) != bool(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["+"] = lambda x, y: Value(
-            Type.INT, int(x.value()) + int(y.value())
+        self.op_to_lambda[Type.BOOL]["+"] = lambda x, y: int_value(
+            int(x.value()) + int(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["-"] = lambda x, y: Value(
-            Type.INT, int(x.value()) - int(y.value())
+        self.op_to_lambda[Type.BOOL]["-"] = lambda x, y: int_value(
+            int(x.value()) - int(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["*"] = lambda x, y: Value(
-            Type.INT, int(x.value()) * int(y.value())
+        self.op_to_lambda[Type.BOOL]["*"] = lambda x, y: int_value(
+            int(x.value()) * int(y.value())
         )
-        self.op_to_lambda[Type.BOOL]["/"] = lambda x, y: Value(
-            Type.INT, int(x.value()) // int(y.value())
+        self.op_to_lambda[Type.BOOL]["/"] = lambda x, y: int_value(
+            int(x.value()) // int(y.value())
         )
-        self.op_to_lambda[Type.BOOL][">"] = lambda x, y: Value(
-            Type.BOOL, bool(int(x.value()) > int(y.value()))
+        self.op_to_lambda[Type.BOOL][">"] = lambda x, y: bool_value(
+            bool(int(x.value()) > int(y.value()))
         )
-        self.op_to_lambda[Type.BOOL][">="] = lambda x, y: Value(
-            Type.BOOL, bool(int(x.value()) >= int(y.value()))
+        self.op_to_lambda[Type.BOOL][">="] = lambda x, y: bool_value(
+            bool(int(x.value()) >= int(y.value()))
         )
-        self.op_to_lambda[Type.BOOL]["<"] = lambda x, y: Value(
-            Type.BOOL, bool(int(x.value()) < int(y.value()))
+        self.op_to_lambda[Type.BOOL]["<"] = lambda x, y: bool_value(
+            bool(int(x.value()) < int(y.value()))
         )
-        self.op_to_lambda[Type.BOOL]["<="] = lambda x, y: Value(
-            Type.BOOL, bool(int(x.value()) <= int(y.value()))
+        self.op_to_lambda[Type.BOOL]["<="] = lambda x, y: bool_value(
+            bool(int(x.value()) <= int(y.value()))
         )
         #  set up operations on nil
         self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
         # set up operations on functions
         self.op_to_lambda[Type.FUNC] = {}
-        self.op_to_lambda[Type.FUNC]["=="] = lambda x, y: Value(
-            Type.BOOL, id(x.value()) == id(y.value())
-        ) if x.type() == y.type() else Value(Type.BOOL, False)
-        self.op_to_lambda[Type.FUNC]["!="] = lambda x, y: Value(
-            Type.BOOL, id(x.value()) != id(y.value())
-        ) if x.type() == y.type() else Value(Type.BOOL, True)
+        self.op_to_lambda[Type.FUNC]["=="] = lambda x, y: bool_value(
+            id(x.value()) == id(y.value())
+        ) if x.type() == y.type() else FALSE_VALUE
+        self.op_to_lambda[Type.FUNC]["!="] = lambda x, y: bool_value(
+            id(x.value()) != id(y.value())
+        ) if x.type() == y.type() else TRUE_VALUE
         # set up operation on lambdas
         self.op_to_lambda[Type.LAMBDA] = {}
-        self.op_to_lambda[Type.LAMBDA]["=="] = lambda x, y: Value(
-            Type.BOOL, id(x) == id(y)
-        ) if x.type() == y.type() else Value(Type.BOOL, False)
-        self.op_to_lambda[Type.LAMBDA]["!="] = lambda x, y: Value(
-            Type.BOOL, id(x) != id(y)
-        ) if x.type() == y.type() else Value(Type.BOOL, True)
+        self.op_to_lambda[Type.LAMBDA]["=="] = lambda x, y: bool_value(
+            id(x) == id(y)
+        ) if x.type() == y.type() else FALSE_VALUE
+        self.op_to_lambda[Type.LAMBDA]["!="] = lambda x, y: bool_value(
+            id(x) != id(y)
+        ) if x.type() == y.type() else TRUE_VALUE
         # Note that a copy of a closure or function (e.g., one returned by a function, 
         # since functions return deep copies) is NOT the same as the original closure/function, 
         # so comparison using == would be false, and != would be true:
@@ -456,14 +614,7 @@ class Interpreter(InterpreterBase):
     def __do_if(self, if_ast):
         cond_ast = if_ast.get("condition")
         result = self.__eval_expr(cond_ast)
-        if result.type() == Type.INT:
-            result = Value(Type.BOOL, bool(result.value()))
-        if result.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
-        if result.value():
+        if self.__check_condition(result, Interpreter.IF_DEF):
             statements = if_ast.get("statements")
             status, return_val = self.__run_statements(statements)
             return (status, return_val)
@@ -477,17 +628,10 @@ class Interpreter(InterpreterBase):
 
     def __do_while(self, while_ast):
         cond_ast = while_ast.get("condition")
-        run_while = Interpreter.TRUE_VALUE
-        while run_while.value():
-            run_while = self.__eval_expr(cond_ast)
-            if run_while.type() == Type.INT:
-                run_while = Value(Type.BOOL, bool(run_while.value()))
-            if run_while.type() != Type.BOOL:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    "Incompatible type for while condition",
-                )
-            if run_while.value():
+        run_while = True
+        while run_while:
+            run_while = self.__check_condition(self.__eval_expr(cond_ast), Interpreter.WHILE_DEF)
+            if run_while:
                 statements = while_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
                 if status == ExecStatus.RETURN:
@@ -495,10 +639,357 @@ class Interpreter(InterpreterBase):
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
+    # ints are coerced to bools in conditions; returns the truthiness of the condition
+    def __check_condition(self, result, kind):
+        if result.type() == Type.INT:
+            return bool(result.value())
+        if result.type() != Type.BOOL:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {kind} condition",
+            )
+        return result.value()
+
     def __do_return(self, return_ast):
         # print("do return:! ", return_ast)
         expr_ast = return_ast.get("expression")
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        value_obj = copy.deepcopy(self.__eval_expr(expr_ast))
+        value_obj = self.__copy_value(self.__eval_expr(expr_ast))
         return (ExecStatus.RETURN, value_obj)
+
+    # closure backend: every node is compiled once per run into a python closure. expressions
+    # compile to functions returning a Value; statements compile to functions returning None to
+    # keep going, or an (ExecStatus.RETURN, Value) tuple when the statement returned
+    def __eval_compiled(self, expr_ast):
+        entry = self.__code.get(id(expr_ast))
+        if entry is None:
+            # keep the node alive alongside its code so its id can't be reused
+            entry = (expr_ast, self.__compile_expr(expr_ast))
+            self.__code[id(expr_ast)] = entry
+        return entry[1]()
+
+    def __run_compiled(self, statements):
+        entry = self.__code.get(id(statements))
+        if entry is None:
+            entry = (statements, self.__compile_block(statements))
+            self.__code[id(statements)] = entry
+        result = entry[1]()
+        if result is None:
+            return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+        return result
+
+    def __compile_block(self, statements):
+        code = []
+        lines = []
+        for statement in statements:
+            compiled = self.__compile_statement(statement)
+            # bare expression statements other than calls are never evaluated
+            if compiled is not None:
+                if self.tracer.statements:
+                    compiled = self.__compile_traced(statement, compiled)
+                code.append(compiled)
+                lines.append(statement.line_num)
+        if self.track_lines:
+            return self.__compile_tracked_block(code, lines)
+
+        def run_block():
+            self.env.push()
+            for run_statement in code:
+                result = run_statement()
+                if result is not None:
+                    return result
+            return None
+
+        return run_block
+
+    # run_statement, first handing the tracer the statement it runs
+    def __compile_traced(self, statement, run_statement):
+        tracer = self.tracer
+
+        def run_traced():
+            tracer.emit("statements", "run", statement)
+            return run_statement()
+
+        return run_traced
+
+    # run_block, also keeping the running function's line in call_stack up to date
+    def __compile_tracked_block(self, code, lines):
+        call_stack = self.call_stack
+        steps = list(zip(lines, code))
+
+        def run_tracked_block():
+            self.env.push()
+            frame = call_stack[-1]
+            for line, run_statement in steps:
+                frame[2] = line
+                result = run_statement()
+                if result is not None:
+                    return result
+            return None
+
+        return run_tracked_block
+
+    def __compile_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_DEF:
+            call = self.__call_func
+
+            def run_call():
+                call(statement)
+
+            return run_call
+        if kind == "=":
+            return self.__compile_assign(statement)
+        if kind == InterpreterBase.RETURN_DEF:
+            return self.__compile_return(statement)
+        if kind == Interpreter.IF_DEF:
+            return self.__compile_if(statement)
+        if kind == Interpreter.WHILE_DEF:
+            return self.__compile_while(statement)
+        return None
+
+    def __compile_assign(self, assign_ast):
+        var_name = assign_ast.get("name")
+        expr_ast = assign_ast.get("expression")
+        store = self.__store
+        if expr_ast.elem_type == InterpreterBase.LAMBDA_DEF:
+            # only a lambda assigned directly gets to see the name it's assigned to
+            handle_lambdas = self.__handle_lambdas
+
+            def expression():
+                return handle_lambdas(expr_ast, var_name)
+        else:
+            expression = self.__compile_expr(expr_ast)
+
+        def run_assign():
+            val = self.env.get(var_name, self.save_env)
+            store(var_name, val, expression())
+
+        return run_assign
+
+    def __compile_return(self, return_ast):
+        expr_ast = return_ast.get("expression")
+        if expr_ast is None:
+            result = (ExecStatus.RETURN, Interpreter.NIL_VALUE)
+            return lambda: result
+        expression = self.__compile_expr(expr_ast)
+        copy_value = self.__copy_value
+        return lambda: (ExecStatus.RETURN, copy_value(expression()))
+
+    def __compile_if(self, if_ast):
+        condition = self.__compile_expr(if_ast.get("condition"))
+        statements = self.__compile_block(if_ast.get("statements"))
+        else_statements = None
+        if if_ast.get("else_statements") is not None:
+            else_statements = self.__compile_block(if_ast.get("else_statements"))
+        check_condition = self.__check_condition
+
+        def run_if():
+            if check_condition(condition(), Interpreter.IF_DEF):
+                return statements()
+            if else_statements is not None:
+                return else_statements()
+            return None
+
+        return run_if
+
+    def __compile_while(self, while_ast):
+        condition = self.__compile_expr(while_ast.get("condition"))
+        statements = self.__compile_block(while_ast.get("statements"))
+        check_condition = self.__check_condition
+
+        def run_while():
+            while check_condition(condition(), Interpreter.WHILE_DEF):
+                result = statements()
+                if result is not None:
+                    return result
+            return None
+
+        return run_while
+
+    def __compile_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_DEF:
+            return lambda: Interpreter.NIL_VALUE
+        if kind == InterpreterBase.INT_DEF:
+            value = int_value(expr_ast.get("val"))
+            return lambda: value
+        if kind == InterpreterBase.STRING_DEF:
+            value = string_literal(expr_ast.get("val"))
+            return lambda: value
+        if kind == InterpreterBase.BOOL_DEF:
+            value = bool_value(expr_ast.get("val"))
+            return lambda: value
+        if kind == InterpreterBase.VAR_DEF:
+            return self.__compile_var(expr_ast.get("name"))
+        if kind == InterpreterBase.FCALL_DEF:
+            call = self.__call_func
+            return lambda: call(expr_ast)
+        if kind in Interpreter.BIN_OPS:
+            return self.__compile_op(expr_ast)
+        if kind == Interpreter.NEG_DEF:
+            return self.__compile_unary(expr_ast, Type.INT, lambda x: -1 * x)
+        if kind == Interpreter.NOT_DEF:
+            return self.__compile_unary(expr_ast, Type.BOOL, lambda x: not x)
+        if kind == InterpreterBase.LAMBDA_DEF:
+            handle_lambdas = self.__handle_lambdas
+            return lambda: handle_lambdas(expr_ast, None)
+        return lambda: None
+
+    def __compile_var(self, var_name):
+        resolve_var = self.__resolve_var
+
+        def run_var():
+            val = self.env.get(var_name)
+            if val is None or isinstance(val, list):
+                return resolve_var(var_name, val)
+            return val
+
+        return run_var
+
+    def __compile_op(self, arith_ast):
+        oper = arith_ast.elem_type
+        left = self.__compile_expr(arith_ast.get("op1"))
+        right = self.__compile_expr(arith_ast.get("op2"))
+        apply_op = self.__apply_op
+        # int op int is always compatible and always uses the int table
+        int_op = self.op_to_lambda[Type.INT][oper]
+
+        def run_op():
+            left_value_obj = left()
+            right_value_obj = right()
+            if left_value_obj.type() == Type.INT and right_value_obj.type() == Type.INT:
+                return int_op(left_value_obj, right_value_obj)
+            return apply_op(oper, left_value_obj, right_value_obj)
+
+        return run_op
+
+    def __compile_unary(self, arith_ast, type, function):
+        oper = arith_ast.elem_type
+        operand = self.__compile_expr(arith_ast.get("op1"))
+        apply_unary = self.__apply_unary
+        return lambda: apply_unary(oper, operand(), type, function)
+
+    # bytecode backend: function bodies are lowered by bytecodev3 once per run and executed by
+    # __run_vm. brewin calls push a frame onto the vm's own frame stack rather than recursing
+    def __body_code(self, statements):
+        entry = self.__code.get(id(statements))
+        if entry is None:
+            entry = (statements, self.__bytecode.compile_body(statements))
+            self.__code[id(statements)] = entry
+        return entry[1]
+
+    def __run_bytecode(self, statements):
+        return (ExecStatus.RETURN, self.__run_vm(self.__body_code(statements)))
+
+    def __eval_bytecode(self, expr_ast):
+        entry = self.__code.get(id(expr_ast))
+        if entry is None:
+            entry = (expr_ast, self.__bytecode.compile_expression(expr_ast))
+            self.__code[id(expr_ast)] = entry
+        return self.__run_vm(entry[1])
+
+    def __run_vm(self, code):
+        bc = self.__bytecode
+        resolve_var = self.__resolve_var
+        apply_op = self.__apply_op
+        int_ops = self.op_to_lambda[Type.INT]
+        check_condition = self.__check_condition
+        copy_value = self.__copy_value
+        unary_ops = {
+            Interpreter.NEG_DEF: (Type.INT, lambda x: -1 * x),
+            Interpreter.NOT_DEF: (Type.BOOL, lambda x: not x),
+        }
+
+        # suspended callers, each (code, pc, stack, calls, func). The running function's
+        # code and pc are also where brewprofile's Sampler reads the line being run from
+        frames = []
+        instructions = code.instructions
+        pc = 0
+        # operand stack of the running function
+        stack = []
+        # calls whose args are still being evaluated, innermost last
+        calls = []
+        # (lambda_ast, func_ast, formal_args, ref_vars) of the running function
+        func = None
+        max_frames = sys.getrecursionlimit() // Interpreter.PY_FRAMES_PER_CALL
+        while True:
+            opcode, arg = instructions[pc]
+            pc += 1
+            if opcode == bc.LOAD_VAR:
+                val = self.env.get(arg)
+                if val is None or isinstance(val, list):
+                    val = resolve_var(arg, val)
+                stack.append(val)
+            elif opcode == bc.LOAD_CONST:
+                stack.append(arg)
+            elif opcode == bc.BINARY_OP:
+                right_value_obj = stack.pop()
+                left_value_obj = stack.pop()
+                if left_value_obj.type() == Type.INT and right_value_obj.type() == Type.INT:
+                    stack.append(int_ops[arg](left_value_obj, right_value_obj))
+                else:
+                    stack.append(apply_op(arg, left_value_obj, right_value_obj))
+            elif opcode == bc.STORE_PREPARE:
+                stack.append(self.env.get(arg, self.save_env))
+            elif opcode == bc.STORE:
+                value_obj = stack.pop()
+                self.__store(arg, stack.pop(), value_obj)
+            elif opcode == bc.POP_JUMP_IF_FALSE:
+                if not check_condition(stack.pop(), arg[1]):
+                    pc = arg[0]
+            elif opcode == bc.JUMP:
+                pc = arg
+            elif opcode == bc.PUSH_SCOPE:
+                self.env.push()
+            elif opcode == bc.CALL_BEGIN:
+                calls.append(self.__enter_func(arg))
+            elif opcode == bc.ARG_FROM_REF:
+                _, _, formal_args, ref_vars = calls[-1]
+                formal_ast = formal_args[arg[1]]
+                arg_name = formal_ast.get("name")
+                if arg_name in ref_vars:
+                    self.__bind_arg(formal_ast, arg[2], copy_value(ref_vars[arg_name]))
+                    pc = arg[0]
+            elif opcode == bc.BIND_ARG:
+                formal_ast = calls[-1][2][arg[0]]
+                self.__bind_arg(formal_ast, arg[1], copy_value(stack.pop()))
+            elif opcode == bc.CALL:
+                if len(frames) >= max_frames:
+                    raise RecursionError("maximum recursion depth exceeded")
+                frames.append((code, pc, stack, calls, func))
+                func = calls.pop()
+                code = self.__body_code(func[1].get("statements"))
+                instructions = code.instructions
+                pc = 0
+                stack = []
+                calls = []
+            elif opcode == bc.RETURN_VALUE or opcode == bc.RETURN_NIL:
+                if opcode == bc.RETURN_VALUE:
+                    return_val = copy_value(stack.pop())
+                else:
+                    return_val = Interpreter.NIL_VALUE
+                if not frames:
+                    return return_val
+                self.__exit_func(func[0])
+                code, pc, stack, calls, func = frames.pop()
+                instructions = code.instructions
+                stack.append(return_val)
+            elif opcode == bc.POP_TOP:
+                stack.pop()
+            elif opcode == bc.UNARY_OP:
+                type, function = unary_ops[arg]
+                stack.append(self.__apply_unary(arg, stack.pop(), type, function))
+            elif opcode == bc.CONCAT_PRINTABLE:
+                result = stack.pop()
+                stack.append(stack.pop() + get_printable(result))
+            elif opcode == bc.CALL_PRINT:
+                super().output(stack.pop())
+                stack.append(Interpreter.NIL_VALUE)
+            elif opcode == bc.CALL_INPUT:
+                stack.append(self.__read_input(arg[0], stack.pop() if arg[1] == 1 else None))
+            elif opcode == bc.MAKE_LAMBDA:
+                stack.append(self.__handle_lambdas(arg[0], arg[1]))
+            elif opcode == bc.END:
+                return stack.pop()
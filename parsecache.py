@@ -0,0 +1,158 @@
+# Caches the ASTs brewparse builds, keyed by a hash of the program's source, so running the
+# same program again (test reruns, the same program with different inputs) doesn't lex and
+# parse it again. Nothing changes an AST once it's built, so one cached AST can be handed
+# to any number of interpreters.
+#
+# The in-memory tier is a bounded LRU, keyed by the source itself. The on-disk tier is off
+# unless it's given a directory, and keeps one pickled AST per source, named by its hash.
+# Its file names also carry a fingerprint of the lexer and grammar, so ASTs built by an
+# older parser are never read back. hashlib and pickle are only loaded with it on, so
+# parsing a program doesn't cost their import.
+import os
+import threading
+from collections import OrderedDict
+
+# the modules that decide what AST a source parses to
+GRAMMAR_FILES = ("brewlex.py", "brewparse.py", "brewpratt.py", "compactast.py", "element.py")
+grammar_fingerprint_hex = None
+
+
+# a short hash of GRAMMAR_FILES, so ASTs built by a different parser are never read back
+def grammar_fingerprint():
+    global grammar_fingerprint_hex
+    if grammar_fingerprint_hex is None:
+        import hashlib
+
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in GRAMMAR_FILES:
+            with open(os.path.join(here, name), "rb") as f:
+                digest.update(f.read())
+        grammar_fingerprint_hex = digest.hexdigest()[:16]
+    return grammar_fingerprint_hex
+
+
+class ParseCache:
+    def __init__(self, max_entries=128, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # the cache is shared by every thread parsing; parsing itself happens outside the lock
+        self.lock = threading.Lock()
+        # per thread: whether a bypass() is open on it
+        self.local = threading.local()
+
+    # the on-disk tier's name for source
+    def key(self, source):
+        import hashlib
+
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    # returns the AST for source, calling parse(source) only when no tier has it.
+    # parse raising (e.g. on a syntax error) leaves the cache as it was. ASTs parse builds
+    # in another form (e.g. compact ones) are cached apart under a variant name
+    def get(self, source, parse, variant=None):
+        if getattr(self.local, "bypassed", False):
+            return parse(source)
+        entry = (variant, source)
+        with self.lock:
+            ast = self.entries.get(entry)
+            if ast is not None:
+                self.entries.move_to_end(entry)
+                self.hits += 1
+                return ast
+        key = None
+        if self.directory is not None:
+            key = self.key(source)
+            if variant is not None:
+                key = f"{variant}-{key}"
+            ast = self.__load(key)
+        with self.lock:
+            if ast is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if ast is None:
+            ast = parse(source)
+            if key is not None:
+                self.__save(key, ast)
+        with self.lock:
+            self.entries[entry] = ast
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return ast
+
+    # while this is open, gets on this thread call parse every time and neither read nor
+    # fill the cache, e.g. so testimpact.CallRecorder sees the parser functions each
+    # program runs
+    def bypass(self):
+        return Bypass(self.local)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+            }
+
+    # forgets the in-memory entries and resets the counters; the on-disk tier is kept
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def __path(self, key):
+        return os.path.join(self.directory, f"{grammar_fingerprint()}-{key}.ast")
+
+    def __load(self, key):
+        import pickle
+
+        try:
+            with open(self.__path(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # a missing, truncated or unreadable entry is just a miss; saving replaces it
+            return None
+
+    def __save(self, key, ast):
+        import pickle
+        import tempfile
+
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write then rename, so concurrent runs never read half an entry
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(ast, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.__path(key))
+            temp_path = None
+        except (OSError, pickle.PicklingError, RecursionError):
+            # the on-disk tier is best effort
+            pass
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+
+# what ParseCache.bypass returns; a class rather than a contextlib generator so parsing
+# doesn't import contextlib
+class Bypass:
+    def __init__(self, local):
+        self.local = local
+        self.previous = False
+
+    def __enter__(self):
+        self.previous = getattr(self.local, "bypassed", False)
+        self.local.bypassed = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.local.bypassed = self.previous
@@ -0,0 +1,95 @@
+"""
+Performance regression gate: compares a run's test measurements with a baseline
+results.json's, failing tests (and the total) that got slower by more than a ratio.
+"""
+
+import json
+import math
+
+# the measurements that can be gated on, and the default floor of each: short tests are
+# noisy, so a value below the floor is compared as the floor
+FLOORS = {"cpu_s": 0.05, "wall_s": 0.05, "peak_rss_bytes": 4 * 1024 * 1024}
+
+
+def load_baseline(path):
+    """{test name: measurements} from a results.json written by an earlier run."""
+    with open(path, encoding="utf-8") as handle:
+        return measurements(json.load(handle).get("tests", []))
+
+
+def measurements(results):
+    """{test name: measurements} of the tests in results that were run and measured."""
+    return {result["name"]: result["extra_data"] for result in results if "extra_data" in result}
+
+
+def keep_best(best, other):
+    """Fold the measurements of a rerun into best, keeping the lower of each value."""
+    for name, stats in other.items():
+        if name not in best:
+            best[name] = dict(stats)
+            continue
+        for key, value in stats.items():
+            if value is not None and (best[name].get(key) is None or value < best[name][key]):
+                best[name][key] = value
+
+
+class Gate:
+    """Compares measurements of one kind (metric) against a baseline's."""
+
+    def __init__(self, baseline, metric="cpu_s", threshold=1.5, floor=None):
+        if metric not in FLOORS:
+            raise ValueError(f"Unknown metric {metric}; expected one of {', '.join(FLOORS)}")
+        self.baseline = baseline
+        self.metric = metric
+        self.threshold = threshold
+        self.floor = FLOORS[metric] if floor is None else floor
+
+    def pairs(self, current):
+        """
+        (name, baseline value, current value) of each test the baseline measured; the
+        current value is None if the test timed out or crashed.
+        """
+        for name, stats in sorted(current.items()):
+            before = self.baseline.get(name, {}).get(self.metric)
+            if before is not None:
+                yield name, before, stats.get(self.metric)
+
+    def ratio(self, before, after):
+        return max(after, self.floor) / max(before, self.floor)
+
+    def regressions(self, current):
+        """
+        (name, baseline value, current value, ratio) of each test over the threshold, and
+        last, if it's over too, the total of the tests both runs measured, named None.
+        """
+        regressed = []
+        total_before = total_after = 0
+        for name, before, after in self.pairs(current):
+            if after is None:
+                # no longer finishes: slower than any threshold
+                regressed.append((name, before, None, math.inf))
+                continue
+            total_before += before
+            total_after += after
+            ratio = self.ratio(before, after)
+            if ratio > self.threshold:
+                regressed.append((name, before, after, ratio))
+        if total_before or total_after:
+            ratio = self.ratio(total_before, total_after)
+            if ratio > self.threshold:
+                regressed.append((None, total_before, total_after, ratio))
+        return regressed
+
+    def report(self, regressed):
+        """Lines describing regressions, as returned by regressions()."""
+        lines = []
+        for name, before, after, ratio in regressed:
+            label = "total" if name is None else name
+            if after is None:
+                lines.append(f"{label}: {self.metric} {before:g} -> timed out or crashed")
+                continue
+            lines.append(
+                f"{label}: {self.metric} {before:g} -> {after:g}"
+                f" ({ratio:.2f}x, threshold {self.threshold:g}x)"
+            )
+        return lines
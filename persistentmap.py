@@ -0,0 +1,169 @@
+# A map that's copied in constant time. A copy shares everything with the map it was made
+# from, and whichever side then writes a key copies only the nodes on that key's path, so
+# the two diverge by as much as they're written, not by how big they are (a hash array
+# mapped trie).
+#
+# Keys live in leaves, dicts of at most WIDTH keys; a leaf that outgrows that becomes a
+# branch of WIDTH leaves, picked by the next BITS bits of each key's hash. A map writes in
+# place the nodes it made itself since it was last copied (the ones whose owner is its
+# own), and copies the rest before writing them.
+WIDTH = 32
+BITS = 5
+MASK = WIDTH - 1
+# a hash has 64 bits to split on; a leaf this deep just keeps growing
+MAX_DEPTH = 64 // BITS
+
+
+class Leaf(dict):
+    __slots__ = ("owner",)
+
+
+class Branch(list):
+    __slots__ = ("owner",)
+
+
+def copy_node(node, owner):
+    copied = type(node)(node)
+    copied.owner = owner
+    return copied
+
+
+# the WIDTH leaves a full leaf at depth splits into
+def split(leaf, depth, owner):
+    branch = Branch(Leaf() for _ in range(WIDTH))
+    branch.owner = owner
+    shift = depth * BITS
+    for key, value in leaf.items():
+        branch[(hash(key) >> shift) & MASK][key] = value
+    for child in branch:
+        child.owner = owner
+    return branch
+
+
+# A copy of mapping, a dict or a PersistentMap shared with something else, that can be
+# written without the other side seeing it. Small dicts are copied outright, which reading
+# and writing them as dicts more than pays for; a bigger one becomes a PersistentMap, and
+# from then on its copies take constant time
+def unshared_copy(mapping):
+    if type(mapping) is not dict:
+        return mapping.copy()
+    if len(mapping) <= WIDTH:
+        return dict(mapping)
+    return PersistentMap(mapping.items())
+
+
+def leaves(node):
+    if type(node) is Leaf:
+        yield node
+    else:
+        for child in node:
+            yield from leaves(child)
+
+
+class PersistentMap:
+    __slots__ = ("root", "owner", "size")
+
+    def __init__(self, items=()):
+        self.owner = object()
+        self.root = Leaf()
+        self.root.owner = self.owner
+        self.size = 0
+        for key, value in items:
+            self[key] = value
+
+    def copy(self):
+        copied = PersistentMap.__new__(PersistentMap)
+        copied.root = self.root
+        copied.size = self.size
+        copied.owner = object()
+        # the nodes are shared now, so neither side can write them in place
+        self.owner = object()
+        return copied
+
+    # reads walk down to the key's leaf inline, since the interpreters read variables more
+    # than they do anything else
+    def get(self, key, default=None):
+        node = self.root
+        if type(node) is Branch:
+            h = hash(key)
+            while type(node) is Branch:
+                node = node[h & MASK]
+                h >>= BITS
+        return node.get(key, default)
+
+    def __getitem__(self, key):
+        node = self.root
+        if type(node) is Branch:
+            h = hash(key)
+            while type(node) is Branch:
+                node = node[h & MASK]
+                h >>= BITS
+        return node[key]
+
+    def __contains__(self, key):
+        node = self.root
+        if type(node) is Branch:
+            h = hash(key)
+            while type(node) is Branch:
+                node = node[h & MASK]
+                h >>= BITS
+        return key in node
+
+    # the leaf key goes in, made this map's own on the way down
+    def __own_leaf(self, key):
+        owner = self.owner
+        node = self.root
+        if node.owner is not owner:
+            node = self.root = copy_node(node, owner)
+        h = hash(key)
+        depth = 0
+        while type(node) is Branch:
+            index = h & MASK
+            child = node[index]
+            if child.owner is not owner:
+                child = node[index] = copy_node(child, owner)
+            node = child
+            h >>= BITS
+            depth += 1
+        return node, depth
+
+    def __setitem__(self, key, value):
+        leaf, depth = self.__own_leaf(key)
+        if key in leaf:
+            leaf[key] = value
+            return
+        leaf[key] = value
+        self.size += 1
+        if len(leaf) > WIDTH and depth < MAX_DEPTH:
+            self.__replace(key, depth, split(leaf, depth, self.owner))
+
+    # puts node where the leaf at depth on key's path is; the nodes above it are this map's
+    def __replace(self, key, depth, node):
+        if depth == 0:
+            self.root = node
+            return
+        parent = self.root
+        h = hash(key)
+        for _ in range(depth - 1):
+            parent = parent[h & MASK]
+            h >>= BITS
+        parent[h & MASK] = node
+
+    def __delitem__(self, key):
+        leaf, _ = self.__own_leaf(key)
+        del leaf[key]
+        self.size -= 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for leaf in leaves(self.root):
+            yield from leaf
+
+    def items(self):
+        for leaf in leaves(self.root):
+            yield from leaf.items()
+
+    def __repr__(self):
+        return repr(dict(self.items()))
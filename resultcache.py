@@ -0,0 +1,140 @@
+"""
+A persistent cache of test scores, so rerunning a suite only runs the tests whose program
+or interpreter changed since they last ran.
+
+A score is keyed by a hash of the test's .br file (which holds its input and expected
+output too) and whether it's expected to fail, under a fingerprint of everything else that
+decides it: the source of every local module the interpreter and the test scaffold import,
+directly or not, and the scaffold's options (backend, AST format, ...). Changing any of
+those modules gives a new fingerprint, and so a fresh set of entries.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+
+# generated tables PLY imports by name rather than with an import statement
+TABLE_MODULES = ("parsetab", "brewlextab")
+# fingerprints kept in the file, most recent first; older ones are dropped on save
+MAX_FINGERPRINTS = 8
+
+
+# import statements, at any indentation; faster than parsing the source with ast
+IMPORT_RE = re.compile(
+    r"^[ \t]*(?:from[ \t]+(\w+)[\w.]*[ \t]+import|import[ \t]+([\w., \t]+))", re.M
+)
+
+
+def imported_names(path):
+    """Names of the modules a source file imports anywhere in it, including in functions."""
+    with open(path, encoding="utf-8") as handle:
+        source = handle.read()
+    names = set()
+    for from_name, import_names in IMPORT_RE.findall(source):
+        if from_name:
+            names.add(from_name)
+        else:
+            for name in import_names.split(","):
+                names.add(name.split()[0].split(".")[0])
+    return names
+
+
+def local_module_files(module_names, directory):
+    """The .py files in directory that the named modules are, or import, transitively."""
+    seen = set(TABLE_MODULES)
+    pending = list(module_names)
+    # the tables are data, and large; they're hashed but not scanned for imports
+    files = [os.path.join(directory, f"{name}.py") for name in TABLE_MODULES]
+    files = [path for path in files if os.path.isfile(path)]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        path = os.path.join(directory, f"{name}.py")
+        if not os.path.isfile(path):
+            continue
+        files.append(path)
+        pending.extend(imported_names(path))
+    return sorted(files)
+
+
+def fingerprint(modules, options):
+    """
+    Hash of the given modules' source and every local module they import, plus options
+    (a JSON-serializable description of how tests are run).
+    """
+    directory = os.path.dirname(os.path.abspath(modules[0].__file__))
+    # by file rather than __name__, which is __main__ for a module run as a script
+    names = [os.path.splitext(os.path.basename(module.__file__))[0] for module in modules]
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8"))
+    for path in local_module_files(names, directory):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as handle:
+            digest.update(hashlib.sha256(handle.read()).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Test scores under one fingerprint, loaded from and saved to a JSON file."""
+
+    def __init__(self, path, fingerprint_hex):
+        self.path = path
+        self.fingerprint = fingerprint_hex
+        try:
+            with open(path, encoding="utf-8") as handle:
+                self.data = json.load(handle)
+        except (OSError, ValueError):
+            self.data = {}
+        # the current fingerprint's entries go first, so it's the last to be dropped
+        self.entries = self.data.pop(fingerprint_hex, {})
+        self.data = {fingerprint_hex: self.entries, **self.data}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, test):
+        digest = hashlib.sha256()
+        with open(test["srcfile"], "rb") as handle:
+            digest.update(handle.read())
+        digest.update(b"fail" if test.get("expect_failure") else b"pass")
+        return digest.hexdigest()
+
+    def get(self, test):
+        """The test's cached score, or None if it has to be run."""
+        try:
+            score = self.entries.get(self.key(test))
+        except OSError:
+            score = None
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def put(self, test, score, _metadata=None):
+        try:
+            self.entries[self.key(test)] = score
+        except OSError:
+            pass
+
+    def save(self):
+        """Write the cache, written then renamed so concurrent runs never see half of one."""
+        data = dict(list(self.data.items())[:MAX_FINGERPRINTS])
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+        os.replace(temp_path, self.path)
+
+
+def scaffold_fingerprint(scaffold):
+    """fingerprint() for a tester.TestScaffold: its interpreter, its own module, its options."""
+    options = {
+        key: value
+        for key, value in vars(scaffold).items()
+        if isinstance(value, (str, int, float, bool, type(None)))
+    }
+    options["parser"] = os.environ.get("BREWIN_PARSER")
+    modules = [scaffold.interpreter_lib, sys.modules[type(scaffold).__module__]]
+    return fingerprint(modules, options)
@@ -0,0 +1,35 @@
+import pytest
+
+import brewcompile
+import interpreterv3
+
+
+def test_load_runs_and_closes_the_mapping(tmp_path):
+    path = tmp_path / "program.br"
+    path.write_text("func main() { print(1 + 2); }")
+    brc = brewcompile.compile_file(str(path))
+
+    with brewcompile.load(brc, path.read_text()) as program:
+        interpreter = interpreterv3.Interpreter(False, [])
+        interpreter.run_compiled(program)
+        mapping = program.mapping
+    assert interpreter.get_output() == ["3"]
+    assert mapping.closed
+    assert program.mapping is None
+
+
+def test_stale_program_leaves_nothing_mapped(tmp_path, monkeypatch):
+    path = tmp_path / "program.br"
+    path.write_text("func main() { print(1); }")
+    brc = brewcompile.compile_file(str(path))
+    mappings = []
+    mmap = brewcompile.mmap.mmap
+
+    def recording_mmap(*args, **kwargs):
+        mappings.append(mmap(*args, **kwargs))
+        return mappings[-1]
+
+    monkeypatch.setattr(brewcompile.mmap, "mmap", recording_mmap)
+    with pytest.raises(brewcompile.StaleProgramError):
+        brewcompile.load(brc, "func main() { print(2); }")
+    assert [mapping.closed for mapping in mappings] == [True]
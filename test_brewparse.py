@@ -0,0 +1,90 @@
+import glob
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import brewparse
+import interpreterv3
+from compactast import CompactAST
+from element import tree_shape
+from parsecache import ParseCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_shape(parse, source):
+    try:
+        return tree_shape(parse(source))
+    except SyntaxError:
+        return "SyntaxError"
+
+
+@pytest.fixture
+def fast_thread_switches():
+    # switch threads often, so they interleave inside a parse
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_threads_parse_like_one_parser(fast_thread_switches):
+    sources = {}
+    for path in sorted(glob.glob(os.path.join(HERE, "v*", "*", "*.br"))):
+        with open(path, encoding="utf-8") as handle:
+            sources[path] = handle.read()
+    serial = brewparse.Parser()
+    expected = {path: parse_shape(serial.parse, source) for path, source in sources.items()}
+
+    # parse_with_ply gives each thread its own Parser; any lexer or parser state they still
+    # shared would show up as trees that differ from the serial ones
+    def work(job):
+        path, source = job
+        return path, parse_shape(brewparse.parse_with_ply, source)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(work, list(sources.items()) * 5))
+    assert [path for path, shape in results if shape != expected[path]] == []
+
+
+def test_tables_parse_like_ply():
+    for path in sorted(glob.glob(os.path.join(HERE, "v*", "*", "*.br"))):
+        with open(path, encoding="utf-8") as handle:
+            source = handle.read()
+        assert parse_shape(brewparse.parse_with_tables, source) == parse_shape(
+            brewparse.parse_with_ply, source
+        ), path
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "func main() { x = ; }",  # a syntax error
+        "func main() { x = 1 # 2; }",  # a character no rule matches
+        "func main() { print(1) }",  # missing ;
+    ],
+)
+def test_tables_leave_errors_to_ply(source):
+    assert brewparse.parse_with_tables(source) is None
+
+
+def test_compact_runs_cache_only_the_compact_tree(monkeypatch, tmp_path):
+    cache = ParseCache(directory=str(tmp_path))
+    monkeypatch.setattr(brewparse, "parse_cache", cache)
+    source = "func main() { x = 1 + 2; print(x); }"
+    for _ in range(2):
+        interpreter = interpreterv3.Interpreter(
+            False, [], ast_format=interpreterv3.Interpreter.COMPACT_AST
+        )
+        interpreter.run(source)
+        assert interpreter.get_output() == ["3"]
+    assert [type(ast) for ast in cache.entries.values()] == [CompactAST]
+    assert cache.stats()["hits"] == 1
+
+    # read back from the on-disk tier
+    cache.clear()
+    ast = brewparse.parse_compact(source)
+    assert cache.stats()["disk_hits"] == 1
+    assert tree_shape(ast.root()) == tree_shape(brewparse.parse_uncached(source))
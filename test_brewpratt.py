@@ -0,0 +1,40 @@
+import glob
+import os
+
+import pytest
+
+import brewparse
+import brewpratt
+from element import tree_shape
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPORA = ("v1", "v2", "v3", "v3original")
+PROGRAMS = sorted(
+    os.path.relpath(path, HERE)
+    for corpus in CORPORA
+    for path in glob.glob(os.path.join(HERE, corpus, "*", "*.br"))
+)
+
+
+def parse_with(frontend, source, monkeypatch, capsys):
+    """The tree the frontend builds for source, the error it raises, and what it prints."""
+    monkeypatch.setattr(brewparse, "frontend", frontend)
+    shape = error = None
+    try:
+        shape = tree_shape(brewparse.parse_uncached(source))
+    except SyntaxError as exception:
+        error = str(exception)
+    return shape, error, capsys.readouterr().out
+
+
+@pytest.mark.parametrize("path", PROGRAMS)
+def test_pratt_parses_like_ply(path, monkeypatch, capsys):
+    with open(os.path.join(HERE, path), encoding="utf-8") as handle:
+        source = handle.read()
+    ply = parse_with(brewparse.PLY_FRONTEND, source, monkeypatch, capsys)
+    pratt = parse_with(brewparse.PRATT_FRONTEND, source, monkeypatch, capsys)
+    assert pratt == ply
+    shape = ply[0]
+    if shape is not None:
+        # built by the Pratt parser itself, not by falling back to PLY
+        assert tree_shape(brewpratt.parse(source)) == shape
@@ -0,0 +1,93 @@
+import brewprofile
+import interpreterv3
+from env_v2 import EnvironmentManager
+from intbase import InterpreterBase
+
+BACKENDS = (
+    interpreterv3.Interpreter.TREE_BACKEND,
+    interpreterv3.Interpreter.CLOSURE_BACKEND,
+    interpreterv3.Interpreter.BYTECODE_BACKEND,
+)
+
+PROGRAM = """func add(x) {
+  print(x);
+  return x + 1;
+}
+func main() {
+  y = add(1);
+  f = lambda(z) {
+    print(z);
+    return z;
+  };
+  f(y);
+  while (y < 3) { y = y + 1; }
+}
+"""
+
+
+def counts(report):
+    return {
+        table: {key: stat["count"] for key, stat in entries.items()}
+        for table, entries in report.items()
+    }
+
+
+def test_profile_counts():
+    interpreter = interpreterv3.Interpreter(False, [], True)
+    interpreter.run(PROGRAM)
+    assert counts(interpreter.get_profile()) == {
+        "nodes": {
+            "=": 3,
+            "fcall": 4,
+            "var": 8,
+            "int": 5,
+            "+": 2,
+            "<": 2,
+            "return": 2,
+            "lambda": 1,
+            "while": 1,
+        },
+        "functions": {"add/1": 1, "lambda f/1": 1},
+        "operators": {"int +": 2, "int <": 2},
+        "deepcopy": {"int": 4, "environment": 2},
+        "env": {"create": 5, "get": 12, "set": 4},
+    }
+
+
+def test_backends_profile_the_same_calls():
+    for backend in BACKENDS:
+        interpreter = interpreterv3.Interpreter(False, [], True, backend=backend)
+        interpreter.run(PROGRAM)
+        profile = counts(interpreter.get_profile())
+        assert profile["functions"] == {"add/1": 1, "lambda f/1": 1}, backend
+        assert profile["operators"] == {"int +": 2, "int <": 2}, backend
+
+
+def test_no_profiler_unless_trace_output(monkeypatch):
+    def no_profiler():
+        raise AssertionError("made a Profiler with trace_output off")
+
+    monkeypatch.setattr(brewprofile, "Profiler", no_profiler)
+    for backend in BACKENDS:
+        interpreter = interpreterv3.Interpreter(False, [], backend=backend)
+        interpreter.run(PROGRAM)
+        assert interpreter.get_profile() is None
+        assert type(interpreter.env) is EnvironmentManager
+
+
+def test_collapsed_stacks_name_functions_and_lines(monkeypatch):
+    for backend in BACKENDS:
+        interpreter = interpreterv3.Interpreter(False, [], backend=backend)
+        # sampled by hand at each print, rather than by the sampler's thread
+        sampler = brewprofile.Sampler(interpreter, interval=3600)
+        output = InterpreterBase.output
+
+        def sampled_output(self, value):
+            sampler.sample()
+            output(self, value)
+
+        monkeypatch.setattr(InterpreterBase, "output", sampled_output)
+        with sampler:
+            interpreter.run(PROGRAM)
+        monkeypatch.undo()
+        assert sampler.collapsed() == "main:11;lambda f:8 1\nmain:6;add:2 1\n", backend
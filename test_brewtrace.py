@@ -0,0 +1,44 @@
+import pytest
+
+import brewtrace
+import interpreterv3
+
+PROGRAM = """
+func add(x) { return x + 1; }
+func main() {
+  y = add(1);
+  print(y);
+}
+"""
+
+
+def traced_events(categories, backend):
+    events = []
+    tracer = brewtrace.Tracer(categories, sink=lambda event: events.append(event.render()))
+    interpreter = interpreterv3.Interpreter(False, [], backend=backend, tracer=tracer)
+    interpreter.run(PROGRAM)
+    return events
+
+
+def test_statements_traced_by_tree_and_closure_backends():
+    expected = [
+        "statements: run = y line 4",
+        "statements: run return line 2",
+        "statements: run fcall print line 5",
+    ]
+    backends = (interpreterv3.Interpreter.TREE_BACKEND, interpreterv3.Interpreter.CLOSURE_BACKEND)
+    for backend in backends:
+        assert traced_events(("statements",), backend) == expected, backend
+
+
+def test_bytecode_backend_refuses_to_trace_statements():
+    tracer = brewtrace.Tracer(("statements",))
+    with pytest.raises(ValueError):
+        interpreterv3.Interpreter(False, [], backend="bytecode", tracer=tracer)
+
+
+def test_bytecode_backend_traces_calls():
+    assert traced_events(("calls",), interpreterv3.Interpreter.BYTECODE_BACKEND) == [
+        "calls: enter fcall add line 4, func add line 2",
+        "calls: exit func add line 2",
+    ]
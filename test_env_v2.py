@@ -0,0 +1,192 @@
+import pytest
+
+import interpreterv3
+from env_v2 import EnvironmentManager
+from persistentmap import PersistentMap
+from type_valuev2 import Type, Value, int_value
+
+BACKENDS = (
+    interpreterv3.Interpreter.TREE_BACKEND,
+    interpreterv3.Interpreter.CLOSURE_BACKEND,
+    interpreterv3.Interpreter.BYTECODE_BACKEND,
+)
+
+
+def calls_program(n):
+    return f"""
+func f(x) {{ y = x + 1; return y; }}
+func main() {{
+  i = 0;
+  while (i < {n}) {{ i = f(i); }}
+  print(i);
+}}
+"""
+
+
+def output_of(source, backend):
+    interpreter = interpreterv3.Interpreter(False, [], backend=backend)
+    interpreter.run(source)
+    return interpreter.get_output()
+
+
+def lambdas_program(n):
+    # each lambda captures the one made before it
+    return f"""
+func main() {{
+  k = 1;
+  total = 0;
+  i = 0;
+  while (i < {n}) {{
+    f = lambda(x) {{ k = k + 1; return x + k; }};
+    total = f(total) + f(0);
+    i = i + 1;
+  }}
+  print(total);
+  print(k);
+  print(f(0));
+}}
+"""
+
+
+def test_create_shares_outer_bindings():
+    env = EnvironmentManager()
+    env.create("x", int_value(1))
+    outer = env.bindings["x"]
+    for depth in range(1, 100):
+        env.push()
+        env.create("x", int_value(depth))
+    cell = env.bindings["x"]
+    for _ in range(99):
+        cell = cell[1]
+    assert cell is outer
+    assert env.get("x") is int_value(99)
+
+
+def test_pop_restores_outer_binding():
+    env = EnvironmentManager()
+    env.create("x", int_value(1))
+    env.push()
+    env.create("x", int_value(2))
+    env.create("y", int_value(3))
+    env.pop()
+    assert env.get("x") is int_value(1)
+    assert env.get("y") is None
+
+
+def test_each_call_adds_one_binding_cell():
+    # v3 never pops a call's frames, so every call binds its names one frame deeper; each
+    # binding has to cost a constant-size cell, not a copy of the depths below it
+    for backend in BACKENDS:
+        interpreter = interpreterv3.Interpreter(False, [], backend=backend)
+        interpreter.run(calls_program(500))
+        env = interpreter.env
+        cell = env.bindings["x"]
+        depths = []
+        while cell is not None:
+            depth, cell = cell
+            depths.append(depth)
+        assert len(depths) == 500, backend
+        assert depths == sorted(depths, reverse=True), backend
+        assert all("x" in env.environment[depth] for depth in depths), backend
+
+
+def test_copy_shares_frames_until_written():
+    env = EnvironmentManager()
+    env.create("x", int_value(1))
+    copy = env.deepcopy()
+    assert copy.environment is env.environment
+
+    env.set("x", int_value(2))
+    assert copy.get("x") is int_value(1)
+    copy.set("x", int_value(3))
+    assert env.get("x") is int_value(2)
+    assert copy.get("x") is int_value(3)
+
+
+def test_copy_sees_no_names_the_other_side_binds():
+    env = EnvironmentManager()
+    env.create("x", int_value(1))
+    copy = env.deepcopy()
+    env.create("y", int_value(2))
+    copy.push()
+    copy.create("x", int_value(3))
+
+    assert copy.get("y") is None
+    assert env.get("x") is int_value(1)
+    assert len(env.environment) == 1
+    copy.pop()
+    assert copy.get("x") is int_value(1)
+
+
+def test_copies_of_a_big_frame_share_it():
+    env = EnvironmentManager()
+    for i in range(100):
+        env.create(f"x{i}", int_value(i))
+    copies = []
+    for i in range(100):
+        copies.append(env.deepcopy())
+        env.set("x0", int_value(i + 1))
+    # copied once into a persistent map, whose copies share what neither side wrote
+    assert type(env.environment[0]) is PersistentMap
+    assert [copy.get("x0") for copy in copies] == [int_value(i) for i in range(100)]
+    assert copies[0].get("x99") is int_value(99)
+
+
+def test_claim_rebinds_every_name_bound_to_the_lambda():
+    env = EnvironmentManager()
+    lambda_value = Value(Type.LAMBDA, [None, EnvironmentManager(), None, {}])
+    env.create("f", lambda_value)
+    env.push()
+    env.create("g", lambda_value)
+    env.create("h", Value(Type.LAMBDA, [None, EnvironmentManager(), None, {}]))
+    other = env.get("h")
+
+    claimed = env.claim(lambda_value)
+    assert claimed is not lambda_value
+    assert env.get("f") is claimed and env.get("g") is claimed
+    assert env.get("h") is other
+    # claimed for this environment already
+    assert env.claim(claimed) is claimed
+    assert EnvironmentManager().claim(claimed) is None
+
+
+def test_captured_lambda_state_is_per_copy():
+    source = """
+func twice(f) { f(); return f(); }
+func main() {
+  c = 0;
+  inc = lambda() { c = c + 1; return c; };
+  print(inc());
+  print(twice(inc));
+  print(inc());
+  d = inc;
+  print(d());
+  print(inc());
+  print(d == inc);
+  print(c);
+}
+"""
+    for backend in BACKENDS:
+        # twice gets a copy of inc; d is inc itself
+        assert output_of(source, backend) == ["1", "3", "2", "3", "4", "true", "0"], backend
+
+
+def test_lambdas_made_in_a_loop():
+    for backend in BACKENDS:
+        assert output_of(lambdas_program(500), backend) == ["2500", "1", "4"], backend
+
+
+def test_runaway_recursion_fails_alike_on_every_backend():
+    source = """
+func f(x) { return f(x + 1); }
+func main() {
+  print("start");
+  f(0);
+  print("end");
+}
+"""
+    for backend in BACKENDS:
+        interpreter = interpreterv3.Interpreter(False, [], backend=backend)
+        with pytest.raises(RecursionError):
+            interpreter.run(source)
+        assert interpreter.get_output() == ["start"], backend
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+import harness
+import resultcache
+import testqueue
+
+
+class PassingScaffold(harness.AbstractTestScaffold):
+    def setup(self, test_case):
+        return None
+
+    def run_test_case(self, test_case, environment):
+        return 1
+
+
+def make_tests(make_test, count):
+    return [make_test(f"test{i}", f"func main() {{ print({i}); }}\n") for i in range(count)]
+
+
+def test_queue_with_result_cache(tmp_path, make_test):
+    tests = make_tests(make_test, 3)
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "fingerprint")
+    cache.put(tests[1], 1)
+    queue = testqueue.TestQueue(str(tmp_path / "queue.db"), tests)
+
+    results = asyncio.run(
+        harness.run_all_tests(
+            PassingScaffold(), tests, workers=2, queue=queue, result_cache=cache
+        )
+    )
+
+    assert [result["name"] for result in results] == ["test0", "test1", "test2"]
+    assert all(result["score"] == 1 for result in results)
+    # the cached test is replayed, not run
+    assert "extra_data" not in results[1]
+    assert "extra_data" in results[0] and "extra_data" in results[2]
+    assert queue.counts() == {"done": 3}
+
+
+def test_queue_skips_tests_of_other_runs(tmp_path, make_test):
+    tests = make_tests(make_test, 3)
+    path = str(tmp_path / "queue.db")
+    # another run's suite has a test this one doesn't
+    testqueue.TestQueue(path, tests, worker_id="other").close()
+    queue = testqueue.TestQueue(path, tests[:2], worker_id="this")
+
+    results = asyncio.run(harness.run_all_tests(PassingScaffold(), tests[:2], queue=queue))
+
+    assert [result["name"] for result in results] == ["test0", "test1"]
+    assert queue.counts() == {"done": 2, "claimed": 1}
+
+
+class LoopingScaffold(PassingScaffold):
+    def run_test_case(self, test_case, environment):
+        while True:
+            pass
+
+
+def test_looping_test_is_killed_on_the_default_path(make_test):
+    start = time.monotonic()
+    results = asyncio.run(
+        harness.run_all_tests(LoopingScaffold(), make_tests(make_test, 1), timeout_per_test=0.5)
+    )
+    assert results[0]["score"] == 0
+    assert results[0]["extra_data"]["cpu_s"] is None
+    assert time.monotonic() - start < 5
+
+
+class CrashingScaffold(PassingScaffold):
+    def run_test_case(self, test_case, environment):
+        os._exit(1)
+
+
+def test_crashed_and_timed_out_tests_are_not_cached(tmp_path, make_test):
+    tests = make_tests(make_test, 1)
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "fingerprint")
+    for scaffold in (CrashingScaffold(), LoopingScaffold()):
+        results = asyncio.run(
+            harness.run_all_tests(scaffold, tests, timeout_per_test=0.5, result_cache=cache)
+        )
+        assert results[0]["score"] == 0
+        assert cache.get(tests[0]) is None
+
+    asyncio.run(harness.run_all_tests(PassingScaffold(), tests, result_cache=cache))
+    assert cache.get(tests[0]) == 1
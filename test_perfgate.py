@@ -0,0 +1,49 @@
+import math
+
+import perfgate
+
+
+def stats(cpu_s):
+    return {"wall_s": cpu_s, "cpu_s": cpu_s, "peak_rss_bytes": None}
+
+
+def test_regressions_over_threshold():
+    gate = perfgate.Gate({"a": stats(1.0), "b": stats(1.0)}, threshold=1.5)
+    regressed = gate.regressions({"a": stats(2.0), "b": stats(1.0)})
+    assert regressed == [("a", 1.0, 2.0, 2.0)]
+
+
+def test_regressions_compare_short_tests_as_the_floor():
+    gate = perfgate.Gate({"a": stats(0.001)}, threshold=1.5)
+    # 5x slower, but still under the 50 ms floor
+    assert gate.regressions({"a": stats(0.005)}) == []
+    regressed = gate.regressions({"a": stats(0.5)})
+    assert regressed == [("a", 0.001, 0.5, 10.0), (None, 0.001, 0.5, 10.0)]
+
+
+def test_regressions_include_the_total():
+    baseline = {name: stats(0.04) for name in "abcd"}
+    gate = perfgate.Gate(baseline, threshold=1.2)
+    # each under the floor, so not compared as slower, but together they're over it
+    regressed = gate.regressions({name: stats(0.049) for name in "abcd"})
+    assert [name for name, *_ in regressed] == [None]
+
+
+def test_unmeasured_test_regresses():
+    gate = perfgate.Gate({"a": stats(1.0), "b": stats(1.0)})
+    timed_out = {"wall_s": 5.0, "cpu_s": None, "peak_rss_bytes": None}
+    regressed = gate.regressions({"a": timed_out, "b": stats(1.0)})
+    assert regressed == [("a", 1.0, None, math.inf)]
+    assert "timed out or crashed" in gate.report(regressed)[0]
+
+
+def test_tests_new_since_the_baseline_are_not_compared():
+    gate = perfgate.Gate({"a": stats(1.0)})
+    assert gate.regressions({"a": stats(1.0), "b": stats(100.0)}) == []
+
+
+def test_keep_best():
+    best = {"a": stats(2.0), "b": {"wall_s": 5.0, "cpu_s": None, "peak_rss_bytes": None}}
+    perfgate.keep_best(best, {"a": stats(1.0), "b": stats(3.0), "c": stats(4.0)})
+    perfgate.keep_best(best, {"a": stats(1.5)})
+    assert best == {"a": stats(1.0), "b": stats(3.0), "c": stats(4.0)}
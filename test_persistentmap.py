@@ -0,0 +1,47 @@
+import random
+
+from persistentmap import WIDTH, Branch, PersistentMap, unshared_copy
+
+
+def test_copies_diverge_like_dicts():
+    rng = random.Random(0)
+    maps = [(PersistentMap(), {})]
+    for step in range(20000):
+        mapping, expected = rng.choice(maps)
+        key = f"k{rng.randrange(2000)}"
+        roll = rng.random()
+        if roll < 0.02 and len(maps) < 40:
+            maps.append((mapping.copy(), dict(expected)))
+        elif roll < 0.7:
+            mapping[key] = step
+            expected[key] = step
+        elif key in expected:
+            del mapping[key]
+            del expected[key]
+        assert mapping.get(key) == expected.get(key)
+    for mapping, expected in maps:
+        assert dict(mapping.items()) == expected
+        assert sorted(mapping) == sorted(expected)
+        assert len(mapping) == len(expected)
+
+
+def test_a_write_after_a_copy_copies_only_its_path():
+    mapping = PersistentMap((f"k{i}", i) for i in range(WIDTH * WIDTH))
+    copy = mapping.copy()
+    copy["k0"] = -1
+    assert mapping["k0"] == 0 and copy["k0"] == -1
+    assert type(mapping.root) is Branch
+    shared = sum(a is b for a, b in zip(mapping.root, copy.root))
+    assert shared == WIDTH - 1
+
+
+def test_unshared_copy_copies_small_dicts_outright():
+    small = {"x": 1}
+    assert type(unshared_copy(small)) is dict
+    big = {f"k{i}": i for i in range(WIDTH + 1)}
+    copy = unshared_copy(big)
+    assert type(copy) is PersistentMap
+    assert dict(copy.items()) == big
+    again = unshared_copy(copy)
+    again["k0"] = -1
+    assert copy["k0"] == 0
@@ -0,0 +1,64 @@
+import types
+
+import resultcache
+
+
+def reopen(cache, fingerprint_hex=None):
+    cache.save()
+    return resultcache.ResultCache(cache.path, fingerprint_hex or cache.fingerprint)
+
+
+def test_saved_score_is_replayed(tmp_path, make_test):
+    test = make_test("test_a")
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "one")
+    assert cache.get(test) is None
+    cache.put(test, 1)
+    assert reopen(cache).get(test) == 1
+
+
+def test_editing_the_program_misses(tmp_path, make_test):
+    test = make_test("test_a")
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "one")
+    cache.put(test, 1)
+    make_test("test_a", "func main() { print(2); }")
+    assert reopen(cache).get(test) is None
+
+
+def test_expecting_failure_is_part_of_the_key(tmp_path, make_test):
+    test = make_test("test_a")
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "one")
+    cache.put(test, 1)
+    assert cache.get(dict(test, expect_failure=True)) is None
+
+
+def test_other_fingerprints_are_kept_up_to_a_limit(tmp_path, make_test):
+    test = make_test("test_a")
+    cache = resultcache.ResultCache(str(tmp_path / "cache.json"), "one")
+    cache.put(test, 1)
+    cache = reopen(cache, "two")
+    assert cache.get(test) is None
+    # switching back to an interpreter seen recently finds its results again
+    assert reopen(cache, "one").get(test) == 1
+
+    for i in range(resultcache.MAX_FINGERPRINTS):
+        cache = reopen(cache, f"other {i}")
+    assert reopen(cache, "one").get(test) is None
+
+
+def test_fingerprint_covers_imported_local_modules(tmp_path):
+    (tmp_path / "interp.py").write_text("import helper\n")
+    (tmp_path / "helper.py").write_text("def f():\n    def g():\n        import deep\n")
+    (tmp_path / "deep.py").write_text("X = 1\n")
+    (tmp_path / "unrelated.py").write_text("Y = 1\n")
+    module = types.SimpleNamespace(__file__=str(tmp_path / "interp.py"))
+
+    def fingerprint(options=None):
+        return resultcache.fingerprint([module], options or {})
+
+    before = fingerprint()
+    (tmp_path / "unrelated.py").write_text("Y = 2\n")
+    assert fingerprint() == before
+    (tmp_path / "deep.py").write_text("X = 2\n")
+    changed = fingerprint()
+    assert changed != before
+    assert fingerprint({"backend": "closure"}) != changed
@@ -0,0 +1,118 @@
+import pytest
+
+import interpreterv3
+import tester
+import testimpact
+
+INTERPRETER = """LIMIT = 10
+
+
+def add(x, y):
+    return x + y
+
+
+class Machine:
+    def run(self, x):
+        return sorted([x], key=lambda item: item)
+"""
+
+PROGRAM = """func main() {
+  print(1 + 2);
+}
+
+/*
+*OUT*
+3
+*OUT*
+*/
+"""
+
+
+def test_parser_functions_recorded_on_parse_cache_hits(make_test):
+    test_case = make_test("test_add", PROGRAM)
+    scaffold = tester.TestScaffold(interpreterv3, trace_calls=True)
+
+    called = []
+    # the second run's program is in the parse cache
+    for _ in range(2):
+        assert scaffold.run_test_case(test_case, scaffold.setup(test_case)) == 1
+        called.append(scaffold.test_metadata())
+
+    # the lexer's and parser's rules (the first run also builds them)
+    rules = [
+        {(filename, name) for filename, name in run if name.startswith(("t_", "p_"))}
+        for run in called
+    ]
+    assert rules[0] == rules[1]
+    assert {filename for filename, _ in rules[1]} == {"brewlex.py", "brewparse.py"}
+
+
+def make_impact(directory, options=None):
+    return testimpact.TestImpact(
+        str(directory / "impact.json"), str(directory), ["interp"], options or {}
+    )
+
+
+# two tests recorded against interp.py, one calling add, the other Machine.run
+@pytest.fixture
+def recorded_tests(tmp_path, make_test):
+    (tmp_path / "interp.py").write_text(INTERPRETER)
+    tests = [make_test("test_add"), make_test("test_run")]
+    impact = make_impact(tmp_path)
+    impact.put(tests[0], 1, [("interp.py", "add")])
+    impact.put(tests[1], 0, [("interp.py", "Machine.run.<locals>.<lambda>")])
+    impact.save()
+    return tests
+
+
+def edit_interpreter(tmp_path, old, new):
+    path = tmp_path / "interp.py"
+    path.write_text(path.read_text().replace(old, new))
+
+
+def test_unchanged_tests_replay(tmp_path, recorded_tests):
+    impact = make_impact(tmp_path)
+    assert [impact.get(test) for test in recorded_tests] == [1, 0]
+
+
+def test_editing_a_function_selects_the_tests_that_ran_it(tmp_path, recorded_tests):
+    edit_interpreter(tmp_path, "return x + y", "return y + x")
+    impact = make_impact(tmp_path)
+    assert impact.affected_by(recorded_tests[0]) == "interp.py::add changed"
+    assert impact.affected_by(recorded_tests[1]) is None
+
+
+def test_lambdas_count_as_the_function_around_them(tmp_path, recorded_tests):
+    edit_interpreter(tmp_path, "key=lambda item: item", "key=lambda item: -item")
+    impact = make_impact(tmp_path)
+    assert impact.affected_by(recorded_tests[0]) is None
+    assert impact.affected_by(recorded_tests[1]) == "interp.py::Machine.run changed"
+
+
+def test_comments_and_formatting_are_not_edits(tmp_path, recorded_tests):
+    edit_interpreter(tmp_path, "    return x + y", "    # adds\n    return (x +\n            y)")
+    impact = make_impact(tmp_path)
+    assert [impact.affected_by(test) for test in recorded_tests] == [None, None]
+
+
+def test_editing_outside_functions_selects_every_test(tmp_path, recorded_tests):
+    edit_interpreter(tmp_path, "LIMIT = 10", "LIMIT = 20")
+    impact = make_impact(tmp_path)
+    affected = [impact.affected_by(test) for test in recorded_tests]
+    assert affected == ["interp.py::<module> changed"] * 2
+
+
+def test_editing_the_test_or_the_options_selects_it(tmp_path, recorded_tests):
+    with open(recorded_tests[0]["srcfile"], "a", encoding="utf-8") as handle:
+        handle.write("\n")
+    impact = make_impact(tmp_path)
+    assert impact.affected_by(recorded_tests[0]) == "test changed"
+    impact = make_impact(tmp_path, {"backend": "closure"})
+    assert impact.affected_by(recorded_tests[1]) == "never recorded"
+
+
+def test_unrecorded_run_is_forgotten(tmp_path, recorded_tests):
+    impact = make_impact(tmp_path)
+    # e.g. timed out, so the scaffold has no calls to give
+    impact.put(recorded_tests[0], 0, None)
+    assert impact.get(recorded_tests[0]) is None
@@ -0,0 +1,72 @@
+import testqueue
+
+
+# tests whose sources are these sizes, so the queue ranks them by size
+def make_tests(make_test, sizes):
+    return [make_test(f"test{i}", "x" * size) for i, size in enumerate(sizes)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_claims_most_expensive_first(tmp_path, make_test):
+    tests = make_tests(make_test, [10, 30, 20])
+    queue = testqueue.TestQueue(str(tmp_path / "queue.db"), tests)
+    claimed = [queue.claim() for _ in range(4)]
+    assert claimed == [tests[1]["srcfile"], tests[2]["srcfile"], tests[0]["srcfile"], None]
+    assert queue.counts() == {"claimed": 3}
+
+
+def test_recorded_timings_rank_tests(tmp_path, make_test):
+    tests = make_tests(make_test, [10, 30])
+    timings = {tests[0]["srcfile"]: 9.0, tests[1]["srcfile"]: 1.0}
+    queue = testqueue.TestQueue(str(tmp_path / "queue.db"), tests, timings)
+    assert queue.claim() == tests[0]["srcfile"]
+
+
+def test_workers_share_the_queue(tmp_path, make_test):
+    tests = make_tests(make_test, [10, 20, 30])
+    path = str(tmp_path / "queue.db")
+    first = testqueue.TestQueue(path, tests, worker_id="first")
+    second = testqueue.TestQueue(path, tests, worker_id="second")
+    claimed = [first.claim(), second.claim(), second.claim(), first.claim()]
+    assert sorted(claimed[:3]) == sorted(test["srcfile"] for test in tests)
+    assert claimed[3] is None
+
+
+def test_expired_lease_hands_test_out_again(tmp_path, make_test, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(testqueue.time, "time", clock)
+    tests = make_tests(make_test, [10])
+    path = str(tmp_path / "queue.db")
+    dead = testqueue.TestQueue(path, tests, lease=60, worker_id="dead")
+    alive = testqueue.TestQueue(path, tests, lease=60, worker_id="alive")
+
+    assert dead.claim() == tests[0]["srcfile"]
+    clock.now += 30
+    assert alive.claim() is None
+    clock.now += 31
+    assert alive.claim() == tests[0]["srcfile"]
+
+
+def test_completed_tests_stay_done(tmp_path, make_test, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(testqueue.time, "time", clock)
+    tests = make_tests(make_test, [10, 20])
+    path = str(tmp_path / "queue.db")
+    queue = testqueue.TestQueue(path, tests, lease=60)
+    srcfile = queue.claim()
+    queue.complete(srcfile, 1)
+    assert queue.counts() == {"done": 1, "pending": 1}
+
+    clock.now += 120
+    # a run starting now refills the queue with the same suite
+    later = testqueue.TestQueue(path, tests, lease=60)
+    assert later.claim() != srcfile
+    assert later.claim() is None
+    assert later.counts() == {"done": 1, "claimed": 1}
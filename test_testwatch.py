@@ -0,0 +1,58 @@
+import os
+import sys
+
+import brewprofile
+import brewtrace
+import interpreterv1
+import interpreterv2
+import interpreterv3
+import testwatch
+from resultcache import local_module_files
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def interpreter_files():
+    modules = [interpreterv1, interpreterv2, interpreterv3, brewprofile, brewtrace]
+    return local_module_files([module.__name__ for module in modules], HERE)
+
+
+def assert_dependencies_first(order):
+    for position, name in enumerate(order):
+        imports = testwatch.load_imports(os.path.join(HERE, f"{name}.py"))
+        assert not imports & set(order[position + 1 :]), name
+
+
+def test_editing_intbase_reloads_the_interpreters_after_it():
+    # intbase imports brewtrace, whose main() imports the interpreters, which import intbase
+    order = testwatch.reload_order(["intbase"], interpreter_files())
+    for name in ("interpreterv1", "interpreterv2", "interpreterv3", "brewprofile"):
+        assert order.index("intbase") < order.index(name)
+    assert "brewtrace" not in order
+    assert_dependencies_first(order)
+
+
+def test_only_importers_are_reloaded():
+    order = testwatch.reload_order(["env_v2"], interpreter_files())
+    assert order[0] == "env_v2"
+    assert "interpreterv3" in order
+    assert "intbase" not in order and "brewparse" not in order
+    assert_dependencies_first(order)
+
+
+def test_modules_importing_each_other_reload_together(tmp_path, monkeypatch):
+    sources = {
+        "base": "X = 1\n",
+        "left": "import base\nimport right\n",
+        "right": "from left import *\n",
+        "top": "import right\n",
+        "lazy": "def f():\n    import top\n",
+    }
+    for name, source in sources.items():
+        (tmp_path / f"{name}.py").write_text(source)
+        monkeypatch.setitem(sys.modules, name, object())
+    files = [str(tmp_path / f"{name}.py") for name in sources]
+
+    assert testwatch.reload_order(["base"], files) == ["base", "left", "right", "top"]
+    assert testwatch.reload_order(["right"], files) == ["left", "right", "top"]
+    assert testwatch.reload_order(["top"], files) == ["top"]
@@ -0,0 +1,11 @@
+from type_valuev2 import STRING_LITERALS, STRING_LITERALS_MAX, string_literal
+
+
+def test_string_literal_is_shared():
+    assert string_literal("hello") is string_literal("hello")
+
+
+def test_string_literals_stay_bounded():
+    for i in range(3 * STRING_LITERALS_MAX):
+        assert string_literal(f"literal {i}").value() == f"literal {i}"
+        assert len(STRING_LITERALS) <= STRING_LITERALS_MAX
@@ -2,26 +2,54 @@
 Implements all CS 131-related test logic; is entry-point for testing framework.
 """
 
+import argparse
 import asyncio
 import importlib
-from os import environ, listdir, getcwd
 import sys
+from os import environ, listdir, getcwd
+from os.path import dirname, exists
 import traceback
 from operator import itemgetter
 
+import brewparse
 from harness import (
     AbstractTestScaffold,
+    load_timings,
+    merge_results,
     run_all_tests,
     get_score,
+    shard_tests,
     write_gradescope_output,
 )
+from perfgate import FLOORS, Gate, keep_best, load_baseline, measurements
+from resultcache import ResultCache, scaffold_fingerprint
+from testimpact import CallRecorder, TestImpact
+from testqueue import TestQueue
+from testwatch import watch
 
 
 class TestScaffold(AbstractTestScaffold):
     """Implement scaffold for Brewin' interpreter; load file, validate syntax, run testcase."""
 
-    def __init__(self, interpreter_lib):
+    def __init__(self, interpreter_lib, backend=None, ast_format=None, trace_calls=False):
         self.interpreter_lib = interpreter_lib
+        # only interpreters with more than one execution backend / AST format take these
+        self.backend = backend
+        self.ast_format = ast_format
+        # record the functions each test calls, for test impact analysis (testimpact.py)
+        self.trace_calls = trace_calls
+        self.called = None
+
+    # worker processes started without fork get the scaffold pickled; modules can't be, so
+    # the interpreter goes by name and is re-imported there
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["interpreter_lib"] = self.interpreter_lib.__name__
+        return state
+
+    def __setstate__(self, state):
+        state["interpreter_lib"] = importlib.import_module(state["interpreter_lib"])
+        self.__dict__.update(state)
 
     def setup(self, test_case):
         srcfile = itemgetter("srcfile")(
@@ -43,11 +71,30 @@ class TestScaffold(AbstractTestScaffold):
         }
 
     def run_test_case(self, test_case, environment):
+        self.called = None
+        if not self.trace_calls:
+            return self.__run_and_check(test_case, environment)
+        recorder = CallRecorder()
+        # a cached AST would hide the lexer and parser functions the program needs
+        with brewparse.parse_cache.bypass(), recorder:
+            score = self.__run_and_check(test_case, environment)
+        self.called = recorder.functions(dirname(self.interpreter_lib.__file__))
+        return score
+
+    def test_metadata(self):
+        return self.called
+
+    def __run_and_check(self, test_case, environment):
         expect_failure = itemgetter("expect_failure")(test_case)
         stdin, expected, program = itemgetter("stdin", "expected", "program")(
             environment
         )
-        interpreter = self.interpreter_lib.Interpreter(False, stdin, False)
+        options = {}
+        if self.backend is not None:
+            options["backend"] = self.backend
+        if self.ast_format is not None:
+            options["ast_format"] = self.ast_format
+        interpreter = self.interpreter_lib.Interpreter(False, stdin, False, **options)
         try:
             interpreter.run(program)
         except Exception as exception:  # pylint: disable=broad-except
@@ -126,6 +173,9 @@ def __generate_test_suite(version, successes, failures):
     )
 
 def __get_file_names(folder_path):
+    # a version may have no fails/ directory at all
+    if not exists(folder_path):
+        return []
     files_in_folder = listdir(folder_path)
     filenames = [file.split(".")[0] for file in files_in_folder]
     return filenames
@@ -161,33 +211,222 @@ def generate_test_suite_v3():
         fails,
     )
 
+def shard_spec(spec):
+    """argparse type for --shard: "i/n", shard i (0-based) of n"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {spec}") from None
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard {index} of {count} doesn't exist")
+    return index, count
+
+
+def parse_args():
+    """command line options; the environment variables they replace still set defaults"""
+    parser = argparse.ArgumentParser(description="Run the Brewin test suite.")
+    parser.add_argument("version", nargs="?", help="ignored; the v3 suite is always run")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(environ["WORKERS"]) if environ.get("WORKERS") else None,
+        help="run tests in this many worker processes (default 1); a test still running at"
+        " --timeout is killed",
+    )
+    parser.add_argument("--timeout", type=float, default=5, help="seconds per test")
+    parser.add_argument(
+        "--timings",
+        default=environ.get("TIMINGS", "test_timings.json"),
+        help="file of recorded test durations, used to run the longest tests first",
+    )
+    parser.add_argument(
+        "--shard", type=shard_spec, help="run only shard i/n (0-based) of the suite"
+    )
+    parser.add_argument(
+        "--queue", help="claim tests from this SQLite queue, shared with other runs"
+    )
+    parser.add_argument("--worker-id", help="this run's name in the queue")
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=60,
+        help="seconds before a claimed, unfinished test is handed out again",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const="test_result_cache.json",
+        default=environ.get("RESULT_CACHE"),
+        help="replay cached results from this file for tests nothing they depend on has"
+        " changed since, and cache the results of the rest",
+    )
+    parser.add_argument(
+        "--impact",
+        nargs="?",
+        const=environ.get("TEST_IMPACT", "test_impact.json"),
+        help="instead of --cache, record the functions each test calls in this file and"
+        " rerun only the tests that called a function edited since",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="stay running; on each change to a test or the interpreter, reload it and rerun"
+        " the tests affected (recorded as with --impact)",
+    )
+    parser.add_argument(
+        "--gate",
+        metavar="BASELINE",
+        help="fail if tests got slower than in this results.json (ignores --cache)",
+    )
+    parser.add_argument(
+        "--gate-metric", choices=sorted(FLOORS), default="cpu_s", help="what to compare"
+    )
+    parser.add_argument(
+        "--gate-threshold",
+        type=float,
+        default=1.5,
+        help="how many times the baseline a test, or the total, may take",
+    )
+    parser.add_argument(
+        "--gate-floor",
+        type=float,
+        help="compare values below this as this (default 0.05 s, or 4 MiB of RSS)",
+    )
+    parser.add_argument(
+        "--gate-reps",
+        type=int,
+        default=3,
+        help="runs of a regressed test, best kept, before it fails the gate",
+    )
+    parser.add_argument("--output", help="write results here instead of results.json")
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="RESULTS",
+        help="combine these results.json files instead of running tests",
+    )
+    return parser.parse_args()
+
+
 async def main():
     """main entrypoint: argparses, delegates to test scaffold, suite generator, gradescope output"""
-    if not sys.argv:
-        raise ValueError("Error: Missing version number argument")
+    args = parse_args()
+    # flag that toggles write path for results.json
+    is_prod = environ.get("PROD", False)
+    if args.merge:
+        results = merge_results(args.merge)
+        print(f"{get_score(results)}/{len(results)} tests passed.")
+        write_gradescope_output(results, is_prod, args.output)
+        return
+
     # version = sys.argv[1]
     version = "3"
     module_name = f"interpreterv{version}"
     interpreter = importlib.import_module(module_name)
 
-    scaffold = TestScaffold(interpreter)
+    # e.g. BACKEND=bytecode to run the suite on another v3 execution backend, or
+    # AST_FORMAT=compact to run it on compact ASTs
+    scaffold = TestScaffold(
+        interpreter,
+        environ.get("BACKEND") or None,
+        environ.get("AST_FORMAT") or None,
+        trace_calls=args.impact is not None or args.watch,
+    )
 
     match version:
         case "1":
-            tests = generate_test_suite_v1()
+            generate_test_suite = generate_test_suite_v1
         case "2":
-            tests = generate_test_suite_v2()
+            generate_test_suite = generate_test_suite_v2
         case "3":
-            tests = generate_test_suite_v3()
+            generate_test_suite = generate_test_suite_v3
         case _:
             raise ValueError("Unsupported version; expect one of {1, 2}")
-
-    results = await run_all_tests(scaffold, tests)
-    total_score = get_score(results) / len(results) * 100.0
-    print(f"Total Score: {total_score:9.2f}%")
-
-    # flag that toggles write path for results.json
-    write_gradescope_output(results, environ.get("PROD", False))
+    tests = generate_test_suite()
+
+    options = {
+        "backend": scaffold.backend,
+        "ast_format": scaffold.ast_format,
+        "parser": environ.get("BREWIN_PARSER"),
+    }
+    if args.watch:
+        impact_path = args.impact or environ.get("TEST_IMPACT", "test_impact.json")
+        try:
+            await watch(
+                scaffold, generate_test_suite, impact_path, options, args.timeout, args.workers
+            )
+        except asyncio.CancelledError:
+            # Ctrl-C; asyncio.run cancels the task, so this is a clean exit rather than a
+            # KeyboardInterrupt traceback
+            pass
+        return
+
+    queue = None
+    if args.shard is not None:
+        tests = shard_tests(tests, *args.shard)
+    if args.queue is not None:
+        queue = TestQueue(
+            args.queue, tests, load_timings(args.timings), args.lease, args.worker_id
+        )
+    result_cache = None
+    # a gated run measures every test, so it replays none
+    if not args.gate and args.impact is not None:
+        result_cache = TestImpact(
+            args.impact, dirname(interpreter.__file__), [module_name, "tester"], options
+        )
+    elif not args.gate and args.cache is not None:
+        result_cache = ResultCache(args.cache, scaffold_fingerprint(scaffold))
+    results = await run_all_tests(
+        scaffold,
+        tests,
+        timeout_per_test=args.timeout,
+        workers=args.workers,
+        timings_path=args.timings,
+        queue=queue,
+        result_cache=result_cache,
+    )
+    if results:
+        total_score = get_score(results) / len(results) * 100.0
+        print(f"Total Score: {total_score:9.2f}%")
+
+    regressed = []
+    if args.gate:
+        gate = Gate(
+            load_baseline(args.gate), args.gate_metric, args.gate_threshold, args.gate_floor
+        )
+        regressed = await gate_tests(gate, scaffold, tests, results, args)
+        print("\n".join(gate.report(regressed)) or f"No regressions against {args.gate}.")
+
+    write_gradescope_output(results, is_prod, args.output)
+    if regressed:
+        sys.exit(1)
+
+
+async def gate_tests(gate, scaffold, tests, results, args):
+    """
+    Regressions of results against the gate's baseline, after rerunning the tests that
+    regressed (all of them, if only the total did) up to --gate-reps runs in all, keeping
+    each test's best measurements; results are updated with those.
+    """
+    best = measurements(results)
+    regressed = gate.regressions(best)
+    for _ in range(args.gate_reps - 1):
+        if not regressed:
+            break
+        names = {name for name, *_ in regressed if name is not None} or set(best)
+        print(f"Rerunning {len(names)} tests that regressed...")
+        rerun = await run_all_tests(
+            scaffold,
+            [test for test in tests if test["name"] in names],
+            timeout_per_test=args.timeout,
+            workers=args.workers,
+        )
+        keep_best(best, measurements(rerun))
+        regressed = gate.regressions(best)
+    for result in results:
+        if result["name"] in best:
+            result["extra_data"] = best[result["name"]]
+    return regressed
 
 
 if __name__ == "__main__":
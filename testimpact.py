@@ -0,0 +1,216 @@
+"""
+Test impact analysis: remember which interpreter functions each test ran, so that after an
+edit only the tests that ran an edited function are run again.
+
+While a test runs, CallRecorder notes every function called, with sys.setprofile (which
+only sees calls and returns, not every line). A function is named by its file and
+qualified name, e.g. ("interpreterv3.py", "Interpreter.__do_while"); lambdas and
+comprehensions count as the function they're written in.
+
+Each function's hash is of its syntax tree, so comments and formatting don't count as
+edits. A file's "<module>" hash covers everything outside function bodies: imports,
+constants, class attributes, signatures. Every test depends on the module hash of every
+local module the interpreter imports, so an edit there still runs everything again.
+Hashing a file's functions means parsing it, so they're saved along with a hash of the
+whole file, and a file is only parsed again once it has changed.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import sys
+
+from resultcache import TABLE_MODULES, local_module_files
+
+MODULE_KEY = "<module>"
+
+
+class StripBodies(ast.NodeTransformer):
+    """Replaces every function body with pass, leaving what's outside them."""
+
+    def visit_FunctionDef(self, node):  # pylint: disable=invalid-name
+        node.body = [ast.Pass()]
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def digest(node):
+    return hashlib.sha256(ast.dump(node).encode("utf-8")).hexdigest()[:16]
+
+
+def function_hashes(source, path):
+    """{qualified name: hash} for each function in a file's source, plus its MODULE_KEY."""
+    if os.path.splitext(os.path.basename(path))[0] in TABLE_MODULES:
+        # generated data, no functions; far quicker to hash than to parse
+        return {MODULE_KEY: hashlib.sha256(source).hexdigest()[:16]}
+    tree = ast.parse(source, path)
+    hashes = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, ast.stmt):
+                # functions are only defined by statements; lambdas don't have names
+                continue
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                hashes[name] = digest(child)
+                visit(child, name + ".<locals>.")
+            elif isinstance(child, ast.ClassDef):
+                visit(child, prefix + child.name + ".")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+    hashes[MODULE_KEY] = digest(StripBodies().visit(tree))
+    return hashes
+
+
+class CallRecorder:
+    """Records the code objects called while it's active, in the current thread."""
+
+    def __init__(self):
+        self.codes = set()
+
+    def __enter__(self):
+        codes = self.codes
+
+        def profile(frame, event, _):
+            if event == "call":
+                codes.add(frame.f_code)
+
+        self.previous = sys.getprofile()
+        sys.setprofile(profile)
+        return self
+
+    def __exit__(self, *_):
+        sys.setprofile(self.previous)
+
+    def functions(self, directory):
+        """(file name, qualified name) of each function called from a file in directory."""
+        directory = os.path.abspath(directory)
+        called = set()
+        for code in self.codes:
+            path = code.co_filename
+            # frozen and generated code has a filename like "<frozen abc>" or "<string>"
+            if path.startswith("<"):
+                continue
+            if os.path.dirname(os.path.abspath(path)) == directory:
+                called.add((os.path.basename(path), code.co_qualname))
+        return sorted(called)
+
+
+class TestImpact:
+    """
+    Per test: the hash of its source, its score, and the hash each function it ran had
+    then. Works as a result cache for harness.run_all_tests: get() replays a test's score
+    unless its source or something it ran has changed since; put() records a new run, given
+    the functions CallRecorder saw it call.
+    """
+
+    def __init__(self, path, directory, modules, options):
+        self.path = path
+        self.directory = directory
+        self.options = json.dumps(options, sort_keys=True)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            data = {}
+        self.tests = data.get("tests", {}) if data.get("options") == self.options else {}
+        # {file name: {"source": hash of the file, "functions": function_hashes() of it}}
+        self.files = data.get("files", {})
+        self.module_files = [
+            os.path.basename(path) for path in local_module_files(modules, directory)
+        ]
+        self.hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def current_hash(self, filename, name):
+        if filename not in self.hashes:
+            self.hashes[filename] = self.file_hashes(filename)
+        return self.hashes[filename].get(name)
+
+    def file_hashes(self, filename):
+        path = os.path.join(self.directory, filename)
+        try:
+            with open(path, "rb") as handle:
+                source = handle.read()
+        except OSError:
+            return {}
+        source_hash = hashlib.sha256(source).hexdigest()
+        saved = self.files.get(filename)
+        if saved is not None and saved["source"] == source_hash:
+            return saved["functions"]
+        try:
+            hashes = function_hashes(source, path)
+        except SyntaxError:
+            return {}
+        self.files[filename] = {"source": source_hash, "functions": hashes}
+        return hashes
+
+    def source_hash(self, test):
+        with open(test["srcfile"], "rb") as handle:
+            source = handle.read()
+        flag = b"fail" if test.get("expect_failure") else b"pass"
+        return hashlib.sha256(source + flag).hexdigest()
+
+    def affected_by(self, test):
+        """What makes test need running again, or None if nothing does."""
+        record = self.tests.get(test["srcfile"])
+        if record is None:
+            return "never recorded"
+        try:
+            if record["source"] != self.source_hash(test):
+                return "test changed"
+        except OSError:
+            return "test missing"
+        for key, recorded in record["functions"].items():
+            filename, name = key.split("::", 1)
+            if self.current_hash(filename, name) != recorded:
+                return f"{key} changed"
+        return None
+
+    def get(self, test):
+        """The test's recorded score, or None if it has to be run."""
+        if self.affected_by(test) is None:
+            self.hits += 1
+            return self.tests[test["srcfile"]]["score"]
+        self.misses += 1
+        return None
+
+    def put(self, test, score, called=None):
+        """called is the scaffold's test metadata: what CallRecorder.functions() returned."""
+        if called is None:
+            # ran without recording (e.g. timed out), so there's nothing to replay it from
+            self.tests.pop(test["srcfile"], None)
+            return
+        keys = {(filename, MODULE_KEY) for filename in self.module_files}
+        for filename, name in called:
+            # lambdas, comprehensions and the like count as the function around them
+            while self.current_hash(filename, name) is None and "." in name:
+                name = name.rsplit(".", 1)[0]
+                if name.endswith(".<locals>"):
+                    name = name[: -len(".<locals>")]
+            keys.add((filename, name))
+            keys.add((filename, MODULE_KEY))
+        try:
+            self.tests[test["srcfile"]] = {
+                "source": self.source_hash(test),
+                "score": score,
+                "functions": {
+                    f"{filename}::{name}": self.current_hash(filename, name)
+                    for filename, name in sorted(keys)
+                },
+            }
+        except OSError:
+            pass
+
+    def save(self):
+        data = {"options": self.options, "tests": self.tests, "files": self.files}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
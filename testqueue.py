@@ -0,0 +1,91 @@
+"""
+A work queue of test cases in a SQLite file, shared by several test runs (on one machine,
+or on several mounting the same file) that each claim tests from it until none are left.
+"""
+
+import os
+import socket
+import sqlite3
+import time
+
+from harness import estimate_costs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    srcfile TEXT PRIMARY KEY,
+    cost REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    score REAL
+)
+"""
+
+
+class TestQueue:
+    """
+    Every run fills the queue with the same suite (tests already in it are left alone), so
+    whichever starts first creates it. Tests are claimed most expensive first. A test
+    claimed longer than lease seconds ago without being completed is handed out again, so
+    a node that dies doesn't take its tests with it.
+    """
+
+    def __init__(self, path, tests, timings=None, lease=60, worker_id=None):
+        self.path = path
+        self.lease = lease
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        # autocommit; claims take the write lock themselves with BEGIN IMMEDIATE. claims come
+        # from the harness's scheduling thread, never two threads at once
+        self.connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        costs = estimate_costs(tests, timings or {})
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute(SCHEMA)
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO tests (srcfile, cost) VALUES (?, ?)",
+            [(test["srcfile"], cost) for test, cost in zip(tests, costs)],
+        )
+        self.connection.execute("COMMIT")
+
+    def __str__(self):
+        return f"queue {self.path} as {self.worker_id}"
+
+    def claim(self):
+        """Claim the next test for this worker; returns its srcfile, or None when done."""
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute(
+                "SELECT srcfile FROM tests"
+                " WHERE state = 'pending' OR (state = 'claimed' AND claimed_at < ?)"
+                " ORDER BY cost DESC, srcfile LIMIT 1",
+                (now - self.lease,),
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE tests SET state = 'claimed', worker = ?, claimed_at = ?"
+                    " WHERE srcfile = ?",
+                    (self.worker_id, now, row[0]),
+                )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return None if row is None else row[0]
+
+    def complete(self, srcfile, score):
+        """Mark a claimed test done, with its score."""
+        self.connection.execute(
+            "UPDATE tests SET state = 'done', score = ?, worker = ? WHERE srcfile = ?",
+            (score, self.worker_id, srcfile),
+        )
+
+    def counts(self):
+        """How many tests are in each state."""
+        return dict(
+            self.connection.execute("SELECT state, COUNT(*) FROM tests GROUP BY state")
+        )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,213 @@
+"""
+Watch mode: stay resident with the interpreter imported, and whenever a test or one of the
+interpreter's modules changes, reload what changed and run again just the tests it
+affects. Saves a run Python startup and importing the interpreter and PLY, and running
+the tests nothing changed for.
+
+Changes are found by polling modification times, of the .br files in the suite and of
+the .py files the interpreter imports. A changed module is reloaded along with every
+module that imports it, directly or not, dependencies first, so none keeps a reference
+to a class or function from before the edit. Which tests to run is decided by test
+impact analysis (testimpact.py): the ones whose file changed, or that called a function
+whose code changed. The test scaffold and harness aren't reloaded; a change to them needs
+a restart.
+"""
+
+import ast
+import asyncio
+import importlib
+import os
+import sys
+import time
+import traceback
+
+from harness import run_all_tests
+from parsecache import GRAMMAR_FILES
+from resultcache import TABLE_MODULES, imported_names, local_module_files
+from testimpact import MODULE_KEY, TestImpact
+
+
+def module_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def snapshot(paths):
+    """{path: modification time} for the paths that exist."""
+    times = {}
+    for path in paths:
+        try:
+            times[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return times
+
+
+def load_imports(path):
+    """
+    Names of the modules a source file imports when it's loaded. Imports in function bodies
+    are left out: they look the module up when they run, so they get a reloaded one anyway.
+    """
+    try:
+        with open(path, "rb") as handle:
+            tree = ast.parse(handle.read(), path)
+    except SyntaxError:
+        # mid-edit; reloading it will report the error
+        return imported_names(path)
+    names = set()
+
+    def visit(node):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                continue
+            if isinstance(child, ast.Import):
+                names.update(alias.name.split(".")[0] for alias in child.names)
+            elif isinstance(child, ast.ImportFrom):
+                if child.module and not child.level:
+                    names.add(child.module.split(".")[0])
+            else:
+                visit(child)
+
+    visit(tree)
+    return names
+
+
+def components(graph):
+    """
+    The strongly connected components of graph ({node: nodes it points to}), each sorted,
+    every component after the components it points to (Tarjan's algorithm).
+    """
+    index = {}
+    low = {}
+    stack = []
+    found = []
+
+    def connect(node):
+        index[node] = low[node] = len(index)
+        stack.append(node)
+        for other in sorted(graph[node]):
+            if other not in index:
+                connect(other)
+                low[node] = min(low[node], low[other])
+            elif other in stack:
+                low[node] = min(low[node], index[other])
+        if low[node] == index[node]:
+            component = []
+            while True:
+                other = stack.pop()
+                component.append(other)
+                if other == node:
+                    break
+            found.append(sorted(component))
+
+    for node in sorted(graph):
+        if node not in index:
+            connect(node)
+    return found
+
+
+def reload_order(changed, module_files):
+    """
+    The loaded modules among module_files to reload after the named modules changed:
+    those, and every one importing one of them, directly or not, each after what it
+    imports. Modules importing each other are reloaded together, after what they import.
+    """
+    changed = set(changed)
+    # the parse cache's on-disk tier is keyed by a hash of the grammar files, taken once
+    if changed & {module_name(path) for path in GRAMMAR_FILES}:
+        changed.add("parsecache")
+    imports = {}
+    for path in module_files:
+        name = module_name(path)
+        if name in sys.modules:
+            imports[name] = set() if name in TABLE_MODULES else load_imports(path)
+    graph = {name: names & imports.keys() for name, names in imports.items()}
+    order = []
+    stale = set()
+    for component in components(graph):
+        if any(name in changed or graph[name] & stale for name in component):
+            stale.update(component)
+            order.extend(component)
+    return order
+
+
+async def watch(
+    scaffold,
+    generate_tests,
+    impact_path,
+    options,
+    timeout_per_test=5,
+    workers=None,
+    poll_interval=0.2,
+):
+    """
+    Run the tests generate_tests() returns, then again each time something changes, until
+    interrupted. The scaffold has to record the functions each test calls (trace_calls).
+    """
+    interpreter = scaffold.interpreter_lib
+    directory = os.path.dirname(os.path.abspath(interpreter.__file__))
+    modules = [interpreter.__name__, "tester"]
+
+    def watched():
+        tests = generate_tests()
+        module_files = local_module_files([interpreter.__name__], directory)
+        return tests, module_files, [test["srcfile"] for test in tests] + module_files
+
+    pending = set()
+    seen = None
+    while True:
+        tests, module_files, paths = watched()
+        if seen is not None:
+            current = snapshot(module_files)
+            changed = [path for path in module_files if current.get(path) != seen.get(path)]
+            pending |= {module_name(path) for path in changed}
+        if pending:
+            names = reload_order(pending, module_files)
+            print(f"Reloading {', '.join(names)}...")
+            try:
+                for name in names:
+                    importlib.reload(sys.modules[name])
+            except Exception:  # pylint: disable=broad-except
+                # e.g. a syntax error mid-edit; try them all again after the next change
+                traceback.print_exc()
+                seen = snapshot(paths)
+                await wait_for_change(watched, seen, poll_interval)
+                continue
+            pending = set()
+        # after reloading, which may have rewritten generated tables; that's not an edit
+        seen = snapshot(paths)
+        start = time.perf_counter()
+        impact = TestImpact(impact_path, directory, modules, options)
+        # hash the modules as they are now, when they've just been loaded, so an edit made
+        # while the tests run is still seen as one afterwards
+        for path in module_files:
+            impact.current_hash(os.path.basename(path), MODULE_KEY)
+        affected = [test for test in tests if impact.affected_by(test) is not None]
+        scores = {}
+        if affected:
+            results = await run_all_tests(
+                scaffold,
+                affected,
+                timeout_per_test=timeout_per_test,
+                workers=workers,
+                result_cache=impact,
+            )
+            for test, result in zip(affected, results):
+                scores[test["srcfile"]] = result["score"]
+        passed = 0
+        for test in tests:
+            record = impact.tests.get(test["srcfile"], {})
+            passed += scores.get(test["srcfile"], record.get("score", 0))
+        print(
+            f"{passed:g}/{len(tests)} tests passed; ran {len(affected)}"
+            f" in {time.perf_counter() - start:.2f}s."
+        )
+        await wait_for_change(watched, seen, poll_interval)
+
+
+async def wait_for_change(watched, seen, poll_interval):
+    """Wait until a watched file changes, or a test is added or removed."""
+    print("Watching for changes...")
+    while True:
+        await asyncio.sleep(poll_interval)
+        if snapshot(watched()[2]) != seen:
+            return
@@ -1,6 +1,7 @@
 from enum import Enum
 from intbase import InterpreterBase
 import copy
+import sys
 
 
 # Enumerated type for our different language data types
@@ -13,8 +14,13 @@ class Type(Enum):
     FUNC = 6
 
 
+IMMUTABLE_TYPES = (Type.INT, Type.BOOL, Type.STRING, Type.NIL)
+
+
 # Represents a value, which has a type and its value
 class Value:
+    __slots__ = ("t", "v")
+
     def __init__(self, type, value=None):
         self.t = type
         self.v = value
@@ -24,11 +30,26 @@ class Value:
 
 
     def deepcopy(self):
-        type = self.t
-        val = self.v
-        # print("og id", id(self))
-        # print("new id", id(Value(type, copy.deepcopy(val))))
-        return Value(type, copy.deepcopy(val))
+        return copy_value(self)
+
+    # ints, bools, strings and nil never change once created, so copies share them.
+    # functions only need a node of their own, since == compares them by identity, and
+    # lambdas need their own captured environment, since calling one changes it
+    def __deepcopy__(self, memo):
+        if self.t in IMMUTABLE_TYPES:
+            return self
+        new_value = Value(self.t)
+        memo[id(self)] = new_value
+        if self.t == Type.FUNC:
+            new_value.v = copy.copy(self.v)
+        elif self.t == Type.LAMBDA and isinstance(self.v, list):
+            # claimed for no environment yet
+            new_value.v = [self.v[0], copy.deepcopy(self.v[1], memo), None, {}]
+        elif self.t == Type.LAMBDA:
+            new_value.v = self.v
+        else:
+            new_value.v = copy.deepcopy(self.v, memo)
+        return new_value
 
 
     def value(self):
@@ -38,21 +59,66 @@ class Value:
         return self.t
 
 
+# canonical instances shared by everything that produces these values; nothing changes a
+# Value in place, so handing out the same one is safe
+NIL_VALUE = Value(Type.NIL, None)
+TRUE_VALUE = Value(Type.BOOL, True)
+FALSE_VALUE = Value(Type.BOOL, False)
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+SMALL_INTS = [Value(Type.INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+# string literals from the source, by text. Dropped when it's full, so a long-running
+# process (watch mode, the test suite) doesn't keep the literals of every program it ran
+STRING_LITERALS = {}
+STRING_LITERALS_MAX = 4096
+
+
+def int_value(val):
+    if type(val) is int and SMALL_INT_MIN <= val <= SMALL_INT_MAX:
+        return SMALL_INTS[val - SMALL_INT_MIN]
+    return Value(Type.INT, val)
+
+
+# a BOOL value's payload isn't always a bool (e.g. -x on an int), those aren't shared
+def bool_value(val):
+    if val is True:
+        return TRUE_VALUE
+    if val is False:
+        return FALSE_VALUE
+    return Value(Type.BOOL, val)
+
+
+def string_literal(val):
+    value = STRING_LITERALS.get(val)
+    if value is None:
+        if len(STRING_LITERALS) >= STRING_LITERALS_MAX:
+            STRING_LITERALS.clear()
+        value = STRING_LITERALS[val] = Value(Type.STRING, sys.intern(val))
+    return value
+
+
 def create_value(val):
     if val == InterpreterBase.TRUE_DEF:
-        return Value(Type.BOOL, True)
+        return TRUE_VALUE
     elif val == InterpreterBase.FALSE_DEF:
-        return Value(Type.BOOL, False)
+        return FALSE_VALUE
     elif val == InterpreterBase.NIL_DEF:
-        return Value(Type.NIL, None)
+        return NIL_VALUE
     elif isinstance(val, str):
-        return Value(Type.STRING, val)
+        return string_literal(val)
     elif isinstance(val, int):
-        return Value(Type.INT, val)
+        return int_value(val)
     else:
         raise ValueError("Unknown value type")
 
 
+# what arguments and return values are passed as: primitives are shared as they are
+def copy_value(val):
+    if isinstance(val, Value) and val.t in IMMUTABLE_TYPES:
+        return val
+    return copy.deepcopy(val)
+
+
 def get_printable(val):
     if val.type() == Type.INT:
         return str(val.value())